@@ -1,130 +1,238 @@
 """
-This script will read in the HA alignment file, translate the sequence to amino acids, 
-find the beginning of HA2, and pull out the 4 amino acid sites immediately preceding HA2. 
+This script will read in the HA alignment file, translate the sequence to amino acids,
+find the beginning of HA2, and pull out the 4 amino acid sites immediately preceding HA2.
 If HA2 is preceded immediately by amino acids R-X-K/R-R, then it is annotated
 as having a furin cleavage motif. Otherwise, it is annotated as wild type. This produces 2
-json files, one annotating a binary has a furin site or wild type site, the other coding 
-the actual sequence at the cleavage sites. These can both be used in augur export so 
-that the annotation and sequence show up in auspice as a color by.  
+json files, one annotating a binary has a furin site or wild type site, the other coding
+the actual sequence at the cleavage sites. These can both be used in augur export so
+that the annotation and sequence show up in auspice as a color by.
+
+The alignment is read as a stream and split into chunks that are annotated by a pool of
+worker processes, and the two json files are written as results come back, so neither the
+alignment nor the output dicts are held in memory. Sequences in the alignment are in
+reference coordinates, so HA2 starts at about the same position in every sequence: rather
+than translating each entire sequence, only a window of codons around that position is
+translated. The position is taken from --ha2_position, or otherwise from the first sequence
+in which HA2 is found by translating it in full. Sequences without HA2 in the window are
+translated in full, as before. The cleavage site motifs are regular expressions that are
+matched against the amino acids preceding HA2, and can be changed with --motifs.
 """
 
 import Bio
-from Bio import SeqIO
+import Bio.Seq
 import json
+import multiprocessing as mp
+import re
 
 import argparse
-parser = argparse.ArgumentParser()
 
-parser.add_argument('--alignment', type=str, help='alignment file output by rule augur align')
-parser.add_argument('--furin_site_motif', type=str, help='name of output json file that annotates tips as having a furin cleavage site or a wt cleavage site')
-parser.add_argument('--cleavage_site_sequence', type=str, help='name of output json file that annotates the cleavage site sequence for each tip')
 
+## by default, R-X-R/K-R, where X is any amino acid (but not a gap)
+default_motifs = ["R[^X][RK]R"]
 
-args = parser.parse_args()
-alignment = args.alignment
-furin_site_motif_json = args.furin_site_motif
-cleavage_site_sequence_json = args.cleavage_site_sequence
+
+class CodonTable(dict):
+    """amino acid for each codon, translated with Bio.Seq the first time the codon is seen"""
+    def __missing__(self, codon):
+        aa = Bio.Seq.translate(codon)
+        self[codon] = aa
+        return(aa)
+
+codon_table = CodonTable()
 
 
 def translate_nucleotide_to_aa(input_nucleotide_str):
-    # convert to sequence object 
-    sequence = Bio.Seq.Seq(input_nucleotide_str)
-    # translate
-    aa_sequence = str(sequence.translate())
+    # translate codon by codon, as Bio.Seq would; partial codons at the end of a sequence are dropped
+    codons = [input_nucleotide_str[i:i+3] for i in range(0, len(input_nucleotide_str) - 2, 3)]
+    aa_sequence = "".join(map(codon_table.__getitem__, codons))
     return(aa_sequence)
 
 
-def return_ha2_start_position(aa_sequence):
-    
-    ha2_begin = "GLFG"
-    
-    # if .find does not match part of the string, it will return a value of -1 
+def return_ha2_start_position(aa_sequence, ha2_begin = "GLFG"):
+
+    # if .find does not match part of the string, it will return a value of -1
     start_pos_ha2_aa = aa_sequence.find(ha2_begin)
     start_pos_ha2_nt = start_pos_ha2_aa*3
     return(start_pos_ha2_nt)
 
 
-def output_furin_site_aa_sequence(ha2_nt_start, nt_sequence):
+def return_ha2_start_position_in_window(nt_sequence, ha2_position, window, ha2_begin = "GLFG"):
+    """translate only the codons from window nucleotides before ha2_position to window nucleotides after it, and return
+    the start of HA2 in nucleotide coordinates, or -1 if it is not in the window. The window starts at a multiple of 3,
+    so codons are read in the same frame as when the whole sequence is translated"""
+    window_start = max(0, (ha2_position - window) // 3 * 3)
+    window_end = ha2_position + len(ha2_begin) * 3 + window
+    window_end = window_start + (min(window_end, len(nt_sequence)) - window_start) // 3 * 3
+    start_pos_ha2_aa = translate_nucleotide_to_aa(nt_sequence[window_start:window_end]).find(ha2_begin)
+    if start_pos_ha2_aa == -1:
+        return(-1)
+    return(window_start + start_pos_ha2_aa*3)
 
-    """In the following function, we are collecting the 12 nucleotides that precede the start 
-    of HA2 and translating them to yield the amino acid sequence for the 4 amino acids that 
-    precede HA2. The reason we are doing it this way is to control for alignment 
+
+def output_furin_site_aa_sequence(ha2_nt_start, nt_sequence, site_length = 4):
+
+    """In the following function, we are collecting the 12 nucleotides that precede the start
+    of HA2 and translating them to yield the amino acid sequence for the 4 amino acids that
+    precede HA2. The reason we are doing it this way is to control for alignment
     inconsistences from one build to the next, which sometimes insert gaps in different places
     in this region, resulting in inconsistent translations."""
 
-    # find the 12 nucleotides that precede the start of HA2 that are not Ns 
-    cleavage_site_nts = []
-    current_site = ha2_nt_start
-    # starting at the current base, go backwards until we accumulate 12 nts that aren't Ns
-    while len(cleavage_site_nts) < 12: 
-        nt_site = nt_sequence[current_site-1]
-        if nt_site != "N":
-            cleavage_site_nts.append(nt_site)
-        current_site -= 1
-            
-    # reverse the list, translate it, and join into a string
-    furin_site_nts = "".join(cleavage_site_nts[::-1])
-    furin_site_sequence = Bio.Seq.Seq(furin_site_nts)
-    furin_site = str(furin_site_sequence.translate())
-    
+    # find the 12 nucleotides that precede the start of HA2 that are not Ns
+    furin_site_nts = nt_sequence[:ha2_nt_start].replace("N", "")[-site_length*3:]
+
+    # if there are not enough, go backwards one base at a time; as before, this continues from the end of the
+    # sequence once it passes the start
+    if len(furin_site_nts) < site_length*3:
+        cleavage_site_nts = []
+        current_site = ha2_nt_start
+        while len(cleavage_site_nts) < site_length*3:
+            nt_site = nt_sequence[current_site-1]
+            if nt_site != "N":
+                cleavage_site_nts.append(nt_site)
+            current_site -= 1
+        furin_site_nts = "".join(cleavage_site_nts[::-1])
+
+    # translate the site
+    furin_site = translate_nucleotide_to_aa(furin_site_nts)
+
     return(furin_site)
 
 
-def output_furin_cleavage_site_jsons(alignment, output_json1, output_json2):
-    
-    output_dict_furin = {"nodes":{}}
-    output_dict_seq = {"nodes":{}}
-    
-    with open(output_json1, "w") as outfile: 
-        outfile.write("")
-    with open(output_json2, "w") as outfile: 
-        outfile.write("")
-
-
-    for seq in SeqIO.parse(alignment, "fasta"):
-
-        strain_name = seq.description
-
-        # convert gaps to Ns to avoid translation errors
-        nt_sequence = str(seq.seq).upper().replace("-","N")
-
-        # translate to amino acids and find the start of HA2 in aa and nt coordinates
-        aa_sequence = translate_nucleotide_to_aa(nt_sequence)
-
-        start_pos_ha2_nt = return_ha2_start_position(aa_sequence)
-        
-        # if .find returns a null, it outputs a value of -1. This means that there is not adequate sequence data at the cleavage site, the start_pos will be a negative number. If it is positive, then the start of HA2 was present and we can annotate
-        if start_pos_ha2_nt > 0: 
-
-            # collect nts and translate the furin cleavage site sequence
-            furin_site = output_furin_site_aa_sequence(start_pos_ha2_nt, nt_sequence)
-        
-            # if those 4 preceding amino acids have the pattern R-X-R/K-R, then it is cleavable 
-            # by furin. Here, X is any amino acid (but not a gap), and the 3rd position can be 
-            # K or R
-            if furin_site[0] == "R" and furin_site[3] == "R" and (furin_site[2] == "R" or furin_site[2]=="K") and furin_site[1]!="X":
-                furin_site_annotation = "present"
-            else:
-                furin_site_annotation = "absent"
-        
-        # if there was not sequence data at the cleavage site, annotate as Ns and missing data
-        else:
-            furin_site = "NNNN"
-            furin_site_annotation = "missing data"
-        
-        output_dict_furin["nodes"][strain_name] = {"furin_cleavage_motif":furin_site_annotation}
-        output_dict_seq["nodes"][strain_name] = {"cleavage_site_sequence":furin_site.replace("X","-")}
-        
-        
-    f = open(output_json1, "w")
-    json.dump(output_dict_furin, f)
-    f.close()
+def annotate_sequence(nt_sequence, ha2_position, window, motifs, ha2_begin = "GLFG", site_length = 4):
+    """return (cleavage site sequence, furin cleavage motif annotation) for one aligned sequence"""
 
-    f = open(output_json2, "w")
-    json.dump(output_dict_seq, f)
-    f.close()
+    # convert gaps to Ns to avoid translation errors
+    nt_sequence = nt_sequence.upper().replace("-","N")
 
+    # find the start of HA2 in a window around its expected position, or in the whole translated sequence
+    start_pos_ha2_nt = -1
+    if ha2_position is not None:
+        start_pos_ha2_nt = return_ha2_start_position_in_window(nt_sequence, ha2_position, window, ha2_begin)
+    if start_pos_ha2_nt == -1:
+        start_pos_ha2_nt = return_ha2_start_position(translate_nucleotide_to_aa(nt_sequence), ha2_begin)
 
-output_furin_cleavage_site_jsons(alignment, furin_site_motif_json, cleavage_site_sequence_json)
+    # if .find returns a null, it outputs a value of -1. This means that there is not adequate sequence data at the cleavage site, the start_pos will be a negative number. If it is positive, then the start of HA2 was present and we can annotate
+    if start_pos_ha2_nt > 0:
 
+        # collect nts and translate the furin cleavage site sequence
+        furin_site = output_furin_site_aa_sequence(start_pos_ha2_nt, nt_sequence, site_length)
 
+        # if the preceding amino acids match one of the motifs, then it is cleavable by furin
+        if any(motif.fullmatch(furin_site) for motif in motifs):
+            furin_site_annotation = "present"
+        else:
+            furin_site_annotation = "absent"
+
+    # if there was not sequence data at the cleavage site, annotate as Ns and missing data
+    else:
+        furin_site = "N"*site_length
+        furin_site_annotation = "missing data"
+
+    return(furin_site.replace("X","-"), furin_site_annotation)
+
+
+def read_fasta_chunks(alignment, chunk_size):
+    """read a fasta file as a stream, yielding lists of up to chunk_size (description, sequence) tuples"""
+    chunk = []
+    description = None
+    lines = []
+    with open(alignment) as infile:
+        for line in infile:
+            if line.startswith(">"):
+                if description is not None:
+                    chunk.append((description, "".join(lines).replace(" ", "").replace("\r", "")))
+                    if len(chunk) == chunk_size:
+                        yield chunk
+                        chunk = []
+                description = line[1:].rstrip()
+                lines = []
+            elif description is not None:
+                lines.append(line.strip())
+    if description is not None:
+        chunk.append((description, "".join(lines).replace(" ", "").replace("\r", "")))
+    if chunk:
+        yield chunk
+
+
+def find_ha2_position(alignment, ha2_begin = "GLFG"):
+    """the start of HA2 in the first sequence of the alignment in which it is found, by translating sequences in full"""
+    for chunk in read_fasta_chunks(alignment, 1):
+        description, nt_sequence = chunk[0]
+        start_pos_ha2_nt = return_ha2_start_position(translate_nucleotide_to_aa(nt_sequence.upper().replace("-","N")), ha2_begin)
+        if start_pos_ha2_nt > 0:
+            return(start_pos_ha2_nt)
+    return(None)
+
+
+## settings shared with the worker processes, set by init_worker
+worker_settings = {}
+
+def init_worker(ha2_position, window, motifs, ha2_begin, site_length):
+    worker_settings.update(ha2_position=ha2_position, window=window, motifs=[re.compile(motif) for motif in motifs],
+                           ha2_begin=ha2_begin, site_length=site_length)
+
+
+def annotate_chunk(chunk):
+    s = worker_settings
+    return([(description, annotate_sequence(nt_sequence, s['ha2_position'], s['window'], s['motifs'], s['ha2_begin'], s['site_length']))
+            for description, nt_sequence in chunk])
+
+
+def output_furin_cleavage_site_jsons(alignment, output_json1, output_json2, motifs = default_motifs, ha2_begin = "GLFG",
+                                     ha2_position = None, window = 90, site_length = 4, nthreads = 1, chunk_size = 2000):
+
+    """write the two node data jsons, in the same format as json.dump of {"nodes": {strain: {...}}}. Each strain
+    is written once, with its first annotation"""
+
+    if ha2_position is None:
+        ha2_position = find_ha2_position(alignment, ha2_begin)
+
+    settings = (ha2_position, window, motifs, ha2_begin, site_length)
+    seen = set()
+    with open(output_json1, "w") as outfile1, open(output_json2, "w") as outfile2:
+        outfile1.write('{"nodes": {')
+        outfile2.write('{"nodes": {')
+
+        if nthreads == 1:
+            init_worker(*settings)
+            results = map(annotate_chunk, read_fasta_chunks(alignment, chunk_size))
+            pool = None
+        else:
+            pool = mp.get_context("fork").Pool(nthreads, initializer=init_worker, initargs=settings)
+            results = pool.imap(annotate_chunk, read_fasta_chunks(alignment, chunk_size))
+
+        try:
+            for chunk_results in results:
+                for strain_name, (furin_site, furin_site_annotation) in chunk_results:
+                    if strain_name in seen:
+                        continue
+                    separator = ", " if seen else ""
+                    seen.add(strain_name)
+                    outfile1.write(separator + json.dumps(strain_name) + ": " + json.dumps({"furin_cleavage_motif": furin_site_annotation}))
+                    outfile2.write(separator + json.dumps(strain_name) + ": " + json.dumps({"cleavage_site_sequence": furin_site}))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        outfile1.write('}}')
+        outfile2.write('}}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--alignment', type=str, help='alignment file output by rule augur align')
+    parser.add_argument('--furin_site_motif', type=str, help='name of output json file that annotates tips as having a furin cleavage site or a wt cleavage site')
+    parser.add_argument('--cleavage_site_sequence', type=str, help='name of output json file that annotates the cleavage site sequence for each tip')
+    parser.add_argument('--motifs', type=str, nargs='+', default=default_motifs, help='regular expressions for the amino acids preceding HA2 that are annotated as a furin cleavage site (default: R[^X][RK]R)')
+    parser.add_argument('--ha2_motif', type=str, default="GLFG", help='amino acids at the start of HA2')
+    parser.add_argument('--ha2_position', type=int, default=None, help='expected start of HA2 in alignment (nucleotide) coordinates, 0-based; found from the first sequence if not given')
+    parser.add_argument('--window', type=int, default=90, help='nucleotides on either side of the expected start of HA2 that are translated')
+    parser.add_argument('--site_length', type=int, default=4, help='number of amino acids preceding HA2 in the cleavage site sequence')
+    parser.add_argument('--nthreads', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--chunk_size', type=int, default=2000, help='sequences sent to a worker process at a time')
+
+    args = parser.parse_args()
+    output_furin_cleavage_site_jsons(args.alignment, args.furin_site_motif, args.cleavage_site_sequence, args.motifs, args.ha2_motif,
+                                     args.ha2_position, args.window, args.site_length, args.nthreads, args.chunk_size)
@@ -0,0 +1,223 @@
+"""
+This script times the main steps of the scan and residue analysis pipelines on synthetic trees of increasing
+size (written with synthetic_tree.py), and writes the timings to a JSON file so that runs from different
+versions of the code can be compared.
+
+The benchmarked steps are:
+    gather_all_mut_on_tree       (h5n1-gwas, calculate_enrichment_scores_across_tree_JSON.py)
+    calculate_enrichment_scores  (h5n1-gwas, Part 1 of the scan)
+    perform_simulations          (h5n1-gwas, Part 2 of the scan)
+    propagate_muts               (residue-analysis/1-propagate-mutations.py)
+    write_propagated_tree        (residue-analysis/1-propagate-mutations.py, streaming propagation and output)
+    get_all_aa_counts            (residue-analysis/2-get-all-aa-counts.py)
+    run_sims                     (residue-analysis/4-perform-simulations.py)
+
+Part 1 of the scan scales with the number of mutations times the number of tips, so by default it is only
+timed on a random sample of mutations (--max-mutations); the sample size is recorded with the result.
+
+Usage:
+    python run_benchmarks.py --sizes 1000,2000,5000 --shape yule --output benchmark_results.json
+"""
+
+import argparse
+import contextlib
+import copy
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import synthetic_tree
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+gwas_dir = os.path.join(repo_dir, 'h5n1-gwas', 'python-scripts')
+residue_dir = os.path.join(repo_dir, 'residue-analysis')
+
+ALL_FUNCTIONS = ['gather_all_mut_on_tree', 'calculate_enrichment_scores', 'perform_simulations', 'propagate_muts', 'write_propagated_tree', 'get_all_aa_counts', 'run_sims']
+
+
+
+def load_script(name, path):
+    '''import a script from its path; needed for the residue analysis scripts, whose names are not valid module names'''
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+
+def time_call(function, repeats):
+    '''call function repeats times and return the fastest wall time in seconds, along with the last return value'''
+    best = None
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+
+def benchmark_size(tips, args, workdir):
+    '''generate a tree with the given number of tips and time every requested function on it'''
+    import config as cfg
+    import tree_manager as tm
+    import calculate_enrichment_scores_across_tree_JSON as calenr
+    import simulate_mutation_gain_loss_markov_chain as simmut
+
+    tree_file = os.path.join(workdir, f'synthetic_{args.shape}_{tips}.json')
+    root_file = os.path.join(workdir, f'synthetic_{args.shape}_{tips}_root-sequence.json')
+    synthetic_tree.write_synthetic_tree(tree_file, root_file, tips=tips, shape=args.shape,
+                                        genes=[(args.gene, args.gene_length)], hosts=synthetic_tree.parse_weighted_list(args.hosts),
+                                        aa_mutations_per_branch=args.aa_mutations_per_branch, seed=args.seed)
+
+    results = []
+    def record(function, seconds, **extra):
+        results.append({'function': function, 'tips': tips, 'shape': args.shape, 'gene': args.gene, 'seconds': seconds, 'repeats': args.repeats, **extra})
+        print(f'{function:<30}{tips:>10}{seconds:>12.4f} s', flush=True)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        json_tree, tree, no_muts_tree, pickled_tree = tm.init_trees(tree_file, args.gene)
+    aa_muts, nt_muts = calenr.gather_all_mut_on_tree(tree, args.gene)
+    host_counts = calenr.return_all_host_tips(tree, args.host1, args.host2, cfg.host_annotation)
+    total_tree_branch_length, _ = calenr.return_total_tree_branch_length(tree)
+
+    if 'gather_all_mut_on_tree' in args.functions:
+        seconds, _ = time_call(lambda: calenr.gather_all_mut_on_tree(tree, args.gene), args.repeats)
+        record('gather_all_mut_on_tree', seconds, mutations=len(aa_muts))
+
+    if 'calculate_enrichment_scores' in args.functions:
+        sample = sorted(aa_muts)
+        if args.max_mutations and len(sample) > args.max_mutations:
+            sample = random.Random(args.seed).sample(sample, args.max_mutations)
+        seconds, _ = time_call(lambda: calenr.calculate_enrichment_scores(tree, sample, nt_muts, args.host1, args.host2, cfg.host_annotation, 0, host_counts, args.gene), args.repeats)
+        record('calculate_enrichment_scores', seconds, mutations=len(sample), total_mutations=len(aa_muts))
+
+    if 'perform_simulations' in args.functions:
+        seconds, _ = time_call(lambda: simmut.perform_simulations(pickled_tree, args.gene, total_tree_branch_length, args.host1, args.host2, cfg.host_annotation, 0, host_counts, args.iterations), args.repeats)
+        record('perform_simulations', seconds, iterations=args.iterations)
+
+    if 'propagate_muts' in args.functions:
+        propagate = load_script('propagate_mutations', os.path.join(residue_dir, '1-propagate-mutations.py'))
+        root_seq = propagate.get_root_seq(root_file, args.gene)
+        orig_json_tree = propagate.read_in_tree_json(tree_file)
+        def run_propagation():
+            prop_tree = copy.deepcopy(orig_json_tree)
+            propagate.assign_root_muts(prop_tree, args.gene, root_seq)
+            propagate.propagate_muts(prop_tree['tree'], args.gene)
+            return prop_tree
+        seconds, prop_tree = time_call(run_propagation, args.repeats)
+        record('propagate_muts', seconds)
+    else:
+        prop_tree = None
+
+    if 'write_propagated_tree' in args.functions:
+        propagate = load_script('propagate_mutations', os.path.join(residue_dir, '1-propagate-mutations.py'))
+        root_seq = propagate.get_root_seq(root_file, args.gene)
+        orig_json_tree = propagate.read_in_tree_json(tree_file)
+        prop_file = os.path.join(workdir, f'synthetic_{args.shape}_{tips}_mutprop.json')
+        def run_streaming_propagation():
+            with open(prop_file, 'w') as outfile:
+                propagate.write_propagated_tree(orig_json_tree, args.gene, root_seq, outfile)
+        seconds, _ = time_call(run_streaming_propagation, args.repeats)
+        record('write_propagated_tree', seconds)
+
+    if 'get_all_aa_counts' in args.functions:
+        counts = load_script('get_all_aa_counts', os.path.join(residue_dir, '2-get-all-aa-counts.py'))
+        if prop_tree is None:
+            propagate = load_script('propagate_mutations', os.path.join(residue_dir, '1-propagate-mutations.py'))
+            prop_tree = propagate.read_in_tree_json(tree_file)
+            propagate.assign_root_muts(prop_tree, args.gene, propagate.get_root_seq(root_file, args.gene))
+            propagate.propagate_muts(prop_tree['tree'], args.gene)
+        prop_file = os.path.join(workdir, f'synthetic_{args.shape}_{tips}_mutprop.json')
+        with open(prop_file, 'w') as outfile:
+            json.dump(prop_tree, outfile)
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, prop_bt_tree = tm.read_in_tree_json(prop_file)
+        seconds, _ = time_call(lambda: counts.get_all_aa_counts(prop_bt_tree, args.gene, args.host1, args.host2), args.repeats)
+        record('get_all_aa_counts', seconds)
+
+    if 'run_sims' in args.functions:
+        sims = load_script('perform_simulations', os.path.join(residue_dir, '4-perform-simulations.py'))
+        sims.root = sims.read_in_tree_json(tree_file)['tree']
+        sims.branch_length_dict = sims.get_branch_lengths(sims.root)
+        sims.total_branch_length = sum(sims.branch_length_dict.values())
+        sims.host1, sims.host2 = args.host1, args.host2
+        seconds, _ = time_call(lambda: sims.run_sims(args.iterations), args.repeats)
+        record('run_sims', seconds, iterations=args.iterations)
+
+    if not args.keep_trees:
+        for path in os.listdir(workdir):
+            if path.startswith(f'synthetic_{args.shape}_{tips}'):
+                os.remove(os.path.join(workdir, path))
+
+    return results
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='time the scan and residue analysis steps on synthetic trees')
+    parser.add_argument('--sizes', type=str, default='1000,2000,5000', help='comma separated list of tip counts')
+    parser.add_argument('--shape', choices=['yule', 'coalescent'], default='yule', help='tree shape for the synthetic trees')
+    parser.add_argument('--gene', type=str, default='PB2', help='gene to simulate and scan')
+    parser.add_argument('--gene-length', type=int, default=759, help='length of the gene in amino acids')
+    parser.add_argument('--hosts', type=str, default='Avian:0.85,Human:0.1,Mammal:0.05', help='host mix for the synthetic trees')
+    parser.add_argument('--host1', type=str, default='Human', help='host to screen for enrichment in')
+    parser.add_argument('--host2', type=str, default='Avian', help='background host')
+    parser.add_argument('--aa-mutations-per-branch', type=float, default=0.5, help='mutation density of the synthetic trees')
+    parser.add_argument('--iterations', type=int, default=10, help='number of simulations to time for perform_simulations and run_sims')
+    parser.add_argument('--max-mutations', type=int, default=200, help='number of mutations to score when timing calculate_enrichment_scores (0 for all)')
+    parser.add_argument('--repeats', type=int, default=1, help='number of times to repeat each timing; the fastest is reported')
+    parser.add_argument('--functions', type=str, default=','.join(ALL_FUNCTIONS), help='comma separated list of functions to time')
+    parser.add_argument('--baltic-path', type=str, default='pip', help='path to baltic.py, or "pip" if baltic is installed')
+    parser.add_argument('--workdir', type=str, default=None, help='directory for synthetic trees (default: a temporary directory)')
+    parser.add_argument('--keep-trees', action='store_true', help='keep the synthetic trees after timing')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for tree generation')
+    parser.add_argument('--output', type=str, default='benchmark_results.json', help='name of output json file with timings')
+    args = parser.parse_args()
+    args.functions = args.functions.split(',')
+    unknown = set(args.functions) - set(ALL_FUNCTIONS)
+    if unknown:
+        parser.error(f"unknown functions: {', '.join(sorted(unknown))}")
+
+    ## the scan modules read config.py on import, so the baltic path has to be set before they are loaded
+    sys.path.insert(0, gwas_dir)
+    import config as cfg
+    cfg.baltic_path = args.baltic_path
+    random.seed(args.seed)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='h5n1-benchmarks-')
+    os.makedirs(workdir, exist_ok=True)
+
+    all_results = []
+    for tips in [int(x) for x in args.sizes.split(',')]:
+        all_results.extend(benchmark_size(tips, args, workdir))
+
+    output = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': get_git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': {k: v for k, v in vars(args).items() if k not in ('workdir', 'output')},
+        'results': all_results,
+    }
+    with open(args.output, 'w') as outfile:
+        json.dump(output, outfile, indent=2)
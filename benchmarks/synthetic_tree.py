@@ -0,0 +1,288 @@
+"""
+This script writes a synthetic Nextstrain auspice v2 tree JSON and a matching root-sequence JSON, so that
+the scan and residue analysis scripts can be benchmarked and tested without passing real trees around.
+
+The tree topology is drawn from either a Yule (pure birth) or a Kingman coalescent process with serially
+sampled tips. Hosts are assigned by letting a host trait switch along branches, with the host mix as the
+stationary distribution, which gives the clustered host sampling that real avian flu trees have. Amino acid
+and nucleotide mutations are drawn along each branch in proportion to its length, with gamma-distributed
+rates across sites so that some positions mutate repeatedly, and every mutation is written relative to the
+state it arises on (e.g. E627K is only placed on a lineage that currently carries E at 627).
+
+Usage:
+    python synthetic_tree.py --tips 10000 --shape yule --genes PB2:759 --hosts Avian:0.85,Human:0.1,Mammal:0.05 \
+        --output-tree flu_avian_h5n1_pb2.json --output-root-sequence flu_avian_h5n1_pb2_root-sequence.json
+"""
+
+import argparse
+import json
+import math
+import random
+from bisect import bisect
+from itertools import accumulate
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+NUCLEOTIDES = 'ACGT'
+
+
+
+def parse_weighted_list(text, value_type = float):
+    '''parse a comma separated list of name:value pairs, e.g. "Avian:0.85,Human:0.15", into a list of tuples'''
+    pairs = []
+    for entry in text.split(','):
+        name, value = entry.split(':')
+        pairs.append((name.strip(), value_type(value)))
+    return pairs
+
+
+
+def yule_tree(n_tips, rng):
+    '''return (parents, times) for a Yule tree with n_tips tips, where node 0 is the root and times are
+    measured forward from the root. Tip times are drawn uniformly along their terminal branch so that tips
+    are serially sampled rather than all sampled at the present'''
+    parents = [-1]
+    times = [0.0]
+    active = [0]
+    t = 0.0
+    while len(active) < n_tips:
+        t += rng.expovariate(len(active))
+        i = rng.randrange(len(active))
+        node = active[i]
+        times[node] = t
+        active[i] = len(parents)
+        active.append(len(parents) + 1)
+        parents.extend([node, node])
+        times.extend([t, t])
+    t += rng.expovariate(len(active))
+    for node in active:
+        times[node] = times[parents[node]] + rng.random() * (t - times[parents[node]]) if node != 0 else t
+    return parents, times
+
+
+
+def coalescent_tree(n_tips, rng, sampling_span = 1.0):
+    '''return (parents, times) for a Kingman coalescent tree with n_tips serially sampled tips. Sampling times
+    are spread uniformly over sampling_span (in units of the coalescent population size) before the present;
+    times are converted to run forward from the root before returning'''
+    sample_ages = sorted(rng.random() * sampling_span for _ in range(n_tips))
+    parents = [-1] * n_tips
+    ages = list(sample_ages)
+    active = []
+    next_sample = 0
+    age = 0.0
+    while next_sample < n_tips or len(active) > 1:
+        k = len(active)
+        wait = rng.expovariate(k * (k - 1) / 2.0) if k > 1 else math.inf
+        if next_sample < n_tips and sample_ages[next_sample] <= age + wait:
+            age = sample_ages[next_sample]
+            active.append(next_sample)
+            next_sample += 1
+            continue
+        age += wait
+        i = rng.randrange(k)
+        a = active[i]
+        active[i] = active[-1]
+        active.pop()
+        j = rng.randrange(k - 1)
+        b = active[j]
+        new = len(parents)
+        parents.append(-1)
+        ages.append(age)
+        parents[a] = new
+        parents[b] = new
+        active[j] = new
+    root = active[0]
+
+    ## relabel so that the root is node 0 and every parent comes before its children
+    order = [root]
+    children = [[] for _ in parents]
+    for node, parent in enumerate(parents):
+        if parent != -1:
+            children[parent].append(node)
+    for node in order:
+        order.extend(children[node])
+    new_index = {old: new for new, old in enumerate(order)}
+    root_age = ages[root]
+    return [new_index[parents[old]] if parents[old] != -1 else -1 for old in order], [root_age - ages[old] for old in order]
+
+
+
+def draw_site_rates(length, rng, shape = 0.5):
+    '''return cumulative weights for gamma-distributed relative rates across sites, for use with bisect'''
+    return list(accumulate(rng.gammavariate(shape, 1.0 / shape) for _ in range(length)))
+
+
+
+def draw_mutations(sequence, cum_rates, expected, rng, alphabet):
+    '''draw a Poisson number of mutations with the given expectation on a sequence (a list, edited in place),
+    at sites chosen by rate. Returns a list of (position, old, new) tuples, with 1-based positions'''
+    mutations = []
+    taken = set()
+    n = poisson(expected, rng)
+    total = cum_rates[-1]
+    for _ in range(n):
+        site = min(bisect(cum_rates, rng.random() * total), len(sequence) - 1)
+        if site in taken:
+            continue
+        taken.add(site)
+        old = sequence[site]
+        new = rng.choice(alphabet)
+        while new == old:
+            new = rng.choice(alphabet)
+        sequence[site] = new
+        mutations.append((site + 1, old, new))
+    return sorted(mutations)
+
+
+
+def poisson(expected, rng):
+    '''draw from a Poisson distribution (Knuth's method for small expectations, normal approximation otherwise)'''
+    if expected <= 0:
+        return 0
+    if expected > 30:
+        return max(0, int(round(rng.gauss(expected, math.sqrt(expected)))))
+    limit = math.exp(-expected)
+    k = 0
+    p = rng.random()
+    while p > limit:
+        k += 1
+        p *= rng.random()
+    return k
+
+
+
+def write_synthetic_tree(output_tree, output_root_sequence, tips = 1000, shape = 'yule', genes = (('PB2', 759),),
+                         hosts = (('Avian', 0.85), ('Human', 0.1), ('Mammal', 0.05)), aa_mutations_per_branch = 0.5,
+                         nuc_mutations_per_branch = 1.5, host_switch_rate = 0.05, years = 30.0, end_date = 2023.0,
+                         clock_rate = 0.004, seed = 0):
+    '''simulate a tree and write it as an auspice v2 JSON, along with its root-sequence JSON. The tree JSON is
+    written node by node, so trees with a million tips can be generated without holding them in memory as
+    nested dicts'''
+    rng = random.Random(seed)
+    if shape == 'yule':
+        parents, times = yule_tree(tips, rng)
+    elif shape == 'coalescent':
+        parents, times = coalescent_tree(tips, rng)
+    else:
+        raise ValueError(f"unknown tree shape '{shape}', expected 'yule' or 'coalescent'")
+
+    children = [[] for _ in parents]
+    for node, parent in enumerate(parents):
+        if parent != -1:
+            children[parent].append(node)
+
+    ## scale times to years and get mean branch length, so that mutation densities are per average branch
+    scale = years / max(times)
+    branch_years = [(times[node] - times[parent]) * scale if parent != -1 else 0.0 for node, parent in enumerate(parents)]
+    mean_branch = sum(branch_years) / max(len(branch_years) - 1, 1)
+
+    host_names = [h for h, _ in hosts]
+    host_cum = list(accumulate(w for _, w in hosts))
+
+    ## root sequences: random codons for the nucleotide sequence, random residues (starting with M) for each gene
+    nuc_length = 3 * sum(length for _, length in genes)
+    root_nuc = [rng.choice(NUCLEOTIDES) for _ in range(nuc_length)]
+    root_aa = {gene: ['M'] + [rng.choice(AMINO_ACIDS) for _ in range(length - 1)] for gene, length in genes}
+    root_sequence = {'nuc': ''.join(root_nuc)}
+    root_sequence.update({gene: ''.join(seq) for gene, seq in root_aa.items()})
+
+    nuc_rates = draw_site_rates(nuc_length, rng)
+    aa_rates = {gene: draw_site_rates(length, rng) for gene, length in genes}
+    current_nuc = list(root_nuc)
+    current_aa = {gene: list(seq) for gene, seq in root_aa.items()}
+
+    n_internal = 0
+    meta = {
+        'title': f'Synthetic {shape} tree with {tips} tips',
+        'colorings': [
+            {'key': 'num_date', 'title': 'Date', 'type': 'continuous'},
+            {'key': 'host', 'title': 'Host', 'type': 'categorical'},
+        ],
+        'genome_annotations': {gene: {'type': 'CDS'} for gene, _ in genes},
+        'panels': ['tree'],
+    }
+
+    with open(output_tree, 'w') as outfile:
+        outfile.write('{"version": "v2", "meta": ' + json.dumps(meta) + ', "tree": ')
+
+        ## iterative depth first traversal; each stack entry is ('enter', node, parent host), ('exit', node, undo)
+        ## or ('separator',) between siblings
+        stack = [('enter', 0, None)]
+        while stack:
+            entry = stack.pop()
+            if entry[0] == 'separator':
+                outfile.write(', ')
+                continue
+            if entry[0] == 'exit':
+                ## leaving this node: restore the parent's sequence state and close the JSON object
+                _, node, undo = entry
+                for seq, site, old in undo:
+                    seq[site] = old
+                outfile.write(']}' if children[node] else '}')
+                continue
+            _, node, parent_host = entry
+
+            ## host trait switches along the branch with probability depending on branch length
+            if parent_host is None or rng.random() < 1.0 - math.exp(-host_switch_rate * branch_years[node]):
+                host = host_names[bisect(host_cum, rng.random() * host_cum[-1])]
+            else:
+                host = parent_host
+
+            relative_length = branch_years[node] / mean_branch if parents[node] != -1 else 0.0
+            undo = []
+            mutations = {}
+            nuc_muts = draw_mutations(current_nuc, nuc_rates, nuc_mutations_per_branch * relative_length, rng, NUCLEOTIDES)
+            undo.extend((current_nuc, pos - 1, old) for pos, old, _ in nuc_muts)
+            if nuc_muts:
+                mutations['nuc'] = [f'{old}{pos}{new}' for pos, old, new in nuc_muts]
+            for gene, _ in genes:
+                aa_muts = draw_mutations(current_aa[gene], aa_rates[gene], aa_mutations_per_branch * relative_length, rng, AMINO_ACIDS)
+                undo.extend((current_aa[gene], pos - 1, old) for pos, old, _ in aa_muts)
+                if aa_muts:
+                    mutations[gene] = [f'{old}{pos}{new}' for pos, old, new in aa_muts]
+
+            date = end_date - years + times[node] * scale
+            if children[node]:
+                name = f'NODE_{n_internal:07d}'
+                n_internal += 1
+            else:
+                name = f'A/{host.lower()}/synthetic/{node}/{int(date)}'
+
+            node_attrs = {'div': round(times[node] * scale * clock_rate, 8), 'num_date': {'value': round(date, 4)}, 'host': {'value': host}}
+            outfile.write('{"name": ' + json.dumps(name) + ', "node_attrs": ' + json.dumps(node_attrs) + ', "branch_attrs": ' + json.dumps({'mutations': mutations}))
+            if children[node]:
+                outfile.write(', "children": [')
+
+            ## push the exit first, then children in reverse so that they are written in order
+            stack.append(('exit', node, undo))
+            for i, child in reversed(list(enumerate(children[node]))):
+                stack.append(('enter', child, host))
+                if i > 0:
+                    stack.append(('separator',))
+
+        outfile.write('}')
+
+    with open(output_root_sequence, 'w') as outfile:
+        json.dump(root_sequence, outfile)
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='write a synthetic auspice v2 tree JSON and root-sequence JSON')
+    parser.add_argument('--tips', type=int, default=1000, help='number of tips on the tree (1k to 1M)')
+    parser.add_argument('--shape', choices=['yule', 'coalescent'], default='yule', help='process used to draw the tree topology')
+    parser.add_argument('--genes', type=str, default='PB2:759', help='comma separated gene:length pairs, e.g. "PB2:759,HA:568"')
+    parser.add_argument('--hosts', type=str, default='Avian:0.85,Human:0.1,Mammal:0.05', help='comma separated host:weight pairs giving the host mix')
+    parser.add_argument('--aa-mutations-per-branch', type=float, default=0.5, help='mean amino acid mutations per gene on a branch of average length')
+    parser.add_argument('--nuc-mutations-per-branch', type=float, default=1.5, help='mean nucleotide mutations on a branch of average length')
+    parser.add_argument('--host-switch-rate', type=float, default=0.05, help='rate of host switches per lineage per year')
+    parser.add_argument('--years', type=float, default=30.0, help='time span from the root to the most recent tip, in years')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--output-tree', type=str, required=True, help='name of output auspice v2 tree json file')
+    parser.add_argument('--output-root-sequence', type=str, required=True, help='name of output root-sequence json file')
+    args = parser.parse_args()
+
+    write_synthetic_tree(args.output_tree, args.output_root_sequence, tips=args.tips, shape=args.shape,
+                         genes=parse_weighted_list(args.genes, int), hosts=parse_weighted_list(args.hosts),
+                         aa_mutations_per_branch=args.aa_mutations_per_branch, nuc_mutations_per_branch=args.nuc_mutations_per_branch,
+                         host_switch_rate=args.host_switch_rate, years=args.years, seed=args.seed)
@@ -0,0 +1,144 @@
+## specify directory containing fasta files
+## output files will be saved here (with the suffix of each annotator appended to file name, e.g. '_avian_orders_clades')
+fasta_dir = '/Users/jort/coding/AvianOrders/'
+
+## specify names of fasta files
+fasta_file_names = ['h5n1_ha.fasta', 'h5n1_pb2.fasta']
+
+## specify annotators to apply, in order: 'orders' (get-avian-orders) and/or 'clades' (get-h5n1-clade)
+annotator_names = ['orders', 'clades']
+
+## specify paths to lookup tables
+synonyms_path = '/Users/jort/coding/h5n1-mutations-rotation/get-avian-orders/avian-species-synonyms.txt'
+species_orders_path = '/Users/jort/coding/h5n1-mutations-rotation/get-avian-orders/avian-species-orders.txt'
+clade_tsv_path = '/Users/jort/coding/h5n1-mutations-rotation/get-h5n1-clade/h5nx-clades.tsv'
+
+## specify the confidence (0 to 1) above which species names that are not in the synonyms file are matched to the
+## closest known name (None to only use exact synonyms), and a tsv file to report these matches to (None for no report)
+species_threshold = None
+species_report_path = None
+
+## specify number of fasta files to annotate at once (None for one per file, up to the number of cores)
+cores = None
+
+
+##### user input above #####
+
+
+## FASTA IDs are formatted as
+## {strain}|{virus}|{isolate_id}|{date}|{region}|{country}|{division}|{location}|{host}|{subtype}|{originating_lab}|{submitting_lab}|{h5_clade}
+## an annotator is a function that takes the list of pipe-delimited fields of an ID and a dictionary shared by the
+## annotators of a record (so that a lookup, such as the standardized species name, is only made once), and edits the
+## fields in place. Annotators are applied one after another to each header as the file is read, so every file is read
+## and written once however many annotators there are. Sequence lines are copied as they are.
+
+import os
+import sys
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+## load the renamer scripts, which define the annotators
+def load_renamer(name, path):
+  import importlib.util
+  if name in sys.modules:
+    return sys.modules[name]
+  spec = importlib.util.spec_from_file_location(name, path)
+  module = importlib.util.module_from_spec(spec)
+  sys.modules[name] = module
+  spec.loader.exec_module(module)
+  return module
+
+def build_annotators(annotator_names, synonyms_path, species_orders_path, clade_tsv_path, species_threshold = None):
+  '''return [(annotator, file name suffix), ...] for 'orders' and 'clades' in annotator_names, in that order. With a
+  species_threshold, species names are also matched to the closest known name (order_renamer.match_species_name)'''
+  annotators = []
+  for name in annotator_names:
+    if name == 'orders':
+      orders = load_renamer('order_renamer', os.path.join(repo_dir, 'get-avian-orders', 'order_renamer.py'))
+      species_dict = orders.read_species_dict(synonyms_path)
+      orders_dict = orders.read_orders_dict(species_orders_path)
+      species_index = None if species_threshold is None else orders.build_species_index(species_dict, orders_dict)
+      annotators.append((orders.species_annotator(species_dict, species_index, species_threshold), ''))
+      annotators.append((orders.order_annotator(orders_dict), '_avian_orders'))
+    elif name == 'clades':
+      clades = load_renamer('clade_renamer', os.path.join(repo_dir, 'get-h5n1-clade', 'clade_renamer.py'))
+      annotators.append((clades.clade_annotator(clades.read_clade_index(clade_tsv_path)), '_clades'))
+    else:
+      raise ValueError(F"unknown annotator {name}, expected 'orders' or 'clades'")
+  return annotators
+
+
+## functions for re-writing FASTA headers
+def annotate_header(line, annotators):
+  '''return a header line (bytes, with '>' and line ending) with its ID annotated; as in Bio.SeqIO, the ID is the
+  header up to the first whitespace, and the description after it is dropped'''
+  title = line[1:].rstrip(b'\r\n')
+  ending = line[1 + len(title):]
+  title = title.strip()
+  name = title.split(None, 1)[0].decode('utf-8', 'surrogateescape') if title else ''
+  fields = name.split('|')
+  record = {}
+  for annotator in annotators:
+    annotator(fields, record)
+  return b'>' + '|'.join(fields).encode('utf-8', 'surrogateescape') + ending
+
+def output_file_name(fasta_file_name, suffix):
+  '''file name with suffix added before the extension'''
+  if '.' not in os.path.basename(fasta_file_name):
+    return fasta_file_name + suffix
+  name, ext = fasta_file_name.rsplit('.', 1)
+  return name + suffix + '.' + ext
+
+def annotate_fasta(fasta_file_name, annotators, suffix):
+  '''write a copy of a FASTA file with annotated headers, reading it line by line as bytes; returns the new file name'''
+  new_file_name = output_file_name(fasta_file_name, suffix)
+  with open(fasta_file_name, 'rb') as infile, open(new_file_name, 'wb') as outfile:
+    for line in infile:
+      if line.startswith(b'>'):
+        line = annotate_header(line, annotators)
+      outfile.write(line)
+  return new_file_name
+
+## annotators shared with the worker processes; annotators are closures, which cannot be pickled, so they are set
+## before the pool is forked. An annotator may keep a report dictionary (e.g. of fuzzy species matches), which is sent
+## back from the worker processes and merged
+shared_annotators = []
+
+def annotate_shared_fasta(fasta_file_name, suffix):
+  new_file_name = annotate_fasta(fasta_file_name, shared_annotators, suffix)
+  return new_file_name, [getattr(annotator, 'report', None) for annotator in shared_annotators]
+
+def annotate_fastas(fasta_file_names, annotators, cores = None):
+  '''annotate every FASTA file in fasta_file_names in one pass each, each file in its own process; annotators is a
+  list of (annotator, suffix) as returned by build_annotators'''
+  import multiprocessing as mp
+  suffix = ''.join(suffix for annotator, suffix in annotators)
+  shared_annotators[:] = [annotator for annotator, suffix in annotators]
+  cores = min(cores or mp.cpu_count(), len(fasta_file_names))
+  if cores <= 1:
+    return [annotate_shared_fasta(file_name, suffix)[0] for file_name in fasta_file_names]
+  with mp.get_context('fork').Pool(cores) as pool:
+    results = pool.starmap(annotate_shared_fasta, [(file_name, suffix) for file_name in fasta_file_names])
+  for new_file_name, reports in results:
+    for annotator, report in zip(shared_annotators, reports):
+      if report:
+        annotator.report.update(report)
+  return [new_file_name for new_file_name, reports in results]
+
+def return_species_report(annotators):
+  '''the fuzzy species matches made by the species annotator in annotators, or an empty dictionary'''
+  report = {}
+  for annotator, suffix in annotators:
+    report.update(getattr(annotator, 'report', {}))
+  return report
+
+if __name__ == '__main__':
+  annotators = build_annotators(annotator_names, synonyms_path, species_orders_path, clade_tsv_path, species_threshold)
+
+  ## write new FASTA file for all files in list
+  annotate_fastas([os.path.join(fasta_dir, file) for file in fasta_file_names], annotators, cores)
+
+  ## write fuzzy species matches for review
+  if species_report_path is not None:
+    load_renamer('order_renamer', os.path.join(repo_dir, 'get-avian-orders', 'order_renamer.py')).write_species_report(return_species_report(annotators), species_report_path)
@@ -1,45 +1,49 @@
-from Bio import SeqIO
-from Bio.SeqRecord import SeqRecord
-import os
-
-## change to directory with fasta files
-os.chdir("/Users/jort/coding/AvianOrders/")
+## specify directory containing fasta files and the species synonyms and orders files
+## output files will be saved here (with '_avian_orders' appended to file name)
+fasta_dir = "/Users/jort/coding/AvianOrders/"
 
 ## specify names of fasta files
 fasta_file_names = ["h5n1_ha.fasta", "h5n1_pb2.fasta"]
 
 
+##### user input above #####
+
+
 
 ## make dictionary to standardize species name
-species_dict = {}
+def read_species_dict(synonyms_path):
+  species_dict = {}
 
-with open('avian-species-synonyms.txt', 'r') as synfile:
-    lines = synfile.read()
+  with open(synonyms_path, 'r') as synfile:
+      lines = synfile.read()
 
-for entry in lines.split("\n"):
-  entry_list = entry.split("\t")
-  if(len(entry_list)) > 1 and entry_list[0][0] != "#":
-    species_dict[entry_list[0]] = entry_list[1]
+  for entry in lines.split("\n"):
+    entry_list = entry.split("\t")
+    if(len(entry_list)) > 1 and entry_list[0][0] != "#":
+      species_dict[entry_list[0]] = entry_list[1]
+  return species_dict
 
 
 ## make dictionary to get avian order
-orders_dict = {}
+def read_orders_dict(orders_path):
+  orders_dict = {}
 
-with open('avian-species-orders.txt', 'r') as orderfile:
-    lines = orderfile.read()
+  with open(orders_path, 'r') as orderfile:
+      lines = orderfile.read()
 
-for entry in lines.split("\n"):
-  entry_list = entry.split("\t")
-  if entry_list[1] == "a":
-    orders_dict[entry_list[0]] = "anseriforme"
-  elif entry_list[1] == "g":
-    orders_dict[entry_list[0]] = "galliforme"
-  elif entry_list[1] == "o":
-    orders_dict[entry_list[0]] = "avian"
+  for entry in lines.split("\n"):
+    entry_list = entry.split("\t")
+    if entry_list[1] == "a":
+      orders_dict[entry_list[0]] = "anseriforme"
+    elif entry_list[1] == "g":
+      orders_dict[entry_list[0]] = "galliforme"
+    elif entry_list[1] == "o":
+      orders_dict[entry_list[0]] = "avian"
+  return orders_dict
 
 
 ## get FASTA id with avian order as host
-def get_order_name(name):
+def get_order_name(name, species_dict, orders_dict):
   order = ""
   name_comps = name.split("|")
   if name_comps[8] == "avian":
@@ -53,20 +57,144 @@ def get_order_name(name):
   return("|".join(name_comps))
 
 
-## write FASTA file with new ids
-def write_order_fasta(fasta_file_name):
-  file_name_list = fasta_file_name.split(".")
-  new_file_name = "".join([".".join(file_name_list[0:len(file_name_list)-1]), "_avian_orders.", file_name_list[-1]])
-  fasta_sequences = SeqIO.parse(open(fasta_file_name),'fasta')
-  records = []
-  for fasta in fasta_sequences:
-    name, sequence = fasta.id, fasta.seq
-    new_name = get_order_name(name)
-    record = SeqRecord(sequence, new_name, "", "")
-    records.append(record)
-  SeqIO.write(records, new_file_name, "fasta")
-
-
-## write new FASTA file for all files in list
-for name in fasta_file_names:
-  write_order_fasta(name)
\ No newline at end of file
+## fuzzy species name index
+## names that are not in avian-species-synonyms.txt (misspellings such as commonkestel) are matched to the closest
+## known name: the synonyms and the standard names in avian-species-orders.txt, compared without case, spaces, '_' or
+## '-'. Candidates are found with a trigram index (names sharing enough 3-letter substrings with the query), and the
+## edit distance is only computed for those, so a name is never compared to every known name. The confidence of a match
+## is 1 - edit distance / length of the longer name. Each distinct name is only looked up once
+def normalize_species_name(name):
+  return "".join(c for c in name.lower() if c.isalnum())
+
+def return_trigrams(name):
+  padded = "  " + name + " "
+  return set(padded[i:i+3] for i in range(len(padded) - 2))
+
+def edit_distance(a, b, max_distance):
+  '''Levenshtein distance between a and b, or max_distance + 1 if it is larger than max_distance'''
+  if abs(len(a) - len(b)) > max_distance:
+    return max_distance + 1
+  previous = list(range(len(b) + 1))
+  for i, ca in enumerate(a, 1):
+    current = [i]
+    for j, cb in enumerate(b, 1):
+      current.append(min(previous[j] + 1, current[j-1] + 1, previous[j-1] + (ca != cb)))
+    if min(current) > max_distance:
+      return max_distance + 1
+    previous = current
+  return previous[-1]
+
+def build_species_index(species_dict, orders_dict):
+  '''index of known species names: {'standard': {normalized name: standard name}, 'trigrams': {trigram: [normalized
+  names]}}. Synonyms keep their correction; standard names that only differ by case map to the first one listed'''
+  standard = {}
+  for name, std_name in species_dict.items():
+    standard.setdefault(normalize_species_name(name), std_name)
+  for std_name in orders_dict:
+    standard.setdefault(normalize_species_name(std_name), std_name)
+  standard.pop("", None)
+  trigrams = {}
+  for name in standard:
+    for trigram in return_trigrams(name):
+      trigrams.setdefault(trigram, []).append(name)
+  return {'standard': standard, 'trigrams': trigrams}
+
+def match_species_name(name, species_index, threshold = 0.85, report_threshold = 0.6, candidates = 20):
+  '''return (status, standard name, confidence, closest names) for a species name. status is 'resolved' if the
+  closest known names all have the same standard name and a confidence of at least threshold, 'ambiguous' if the
+  closest have different standard names, or the confidence is below threshold but at least report_threshold, and
+  'unmatched' otherwise. The standard name is None unless resolved'''
+  from collections import Counter
+  query = normalize_species_name(name)
+  if query in species_index['standard']:
+    return 'resolved', species_index['standard'][query], 1.0, [query]
+  query_trigrams = return_trigrams(query)
+  shared = Counter()
+  for trigram in query_trigrams:
+    shared.update(species_index['trigrams'].get(trigram, []))
+  max_distance = int((1 - report_threshold) * len(query))
+  best_distance = max_distance + 1
+  best_names = []
+  ## each edit changes at most 3 trigrams, so names sharing fewer trigrams are further than max_distance
+  min_shared = len(query_trigrams) - 3 * max_distance
+  for known, count in shared.most_common(candidates):
+    if count < min_shared:
+      break
+    distance = edit_distance(query, known, max_distance)
+    if distance < best_distance:
+      best_distance, best_names = distance, [known]
+    elif distance == best_distance and distance <= max_distance:
+      best_names.append(known)
+  if not best_names:
+    return 'unmatched', None, 0.0, []
+  confidence = 1 - best_distance / max(len(query), max(len(known) for known in best_names))
+  std_names = set(normalize_species_name(species_index['standard'][known]) for known in best_names)
+  if len(std_names) == 1 and confidence >= threshold:
+    return 'resolved', species_index['standard'][best_names[0]], confidence, best_names
+  if confidence < report_threshold:
+    return 'unmatched', None, confidence, best_names
+  return 'ambiguous', None, confidence, best_names
+
+def write_species_report(report, report_path):
+  '''write a tsv with the fuzzy match of each species name that was not in the synonyms file, for review (resolved
+  matches can be added to avian-species-synonyms.txt)'''
+  with open(report_path, "w") as outfile:
+    outfile.write("species\tstatus\tstandard_name\tconfidence\tclosest\n")
+    for name in sorted(report):
+      status, std_name, confidence, closest = report[name]
+      outfile.write("\t".join([name, status, std_name or "", "%.3f" % confidence, ",".join(closest)]) + "\n")
+
+
+## annotators for fasta-headers/header_annotator.py, which rewrites the fields of every header in one pass
+def species_annotator(species_dict, species_index = None, threshold = 0.85):
+  '''annotator that looks up the standardized species name of an avian strain, and keeps it as record['species'] for
+  the annotators that follow. With a species index, names that are not in species_dict are matched with
+  match_species_name, and every such name is kept in the annotator's report'''
+  report = {}
+  def annotate(fields, record):
+    name_comps = fields[0].split("/")
+    if len(fields) > 8 and fields[8] == "avian" and len(name_comps) > 1:
+      nonstd_name = name_comps[1].lower()
+      std_name = species_dict.get(nonstd_name)
+      if std_name is None and species_index is not None:
+        if nonstd_name not in report:
+          report[nonstd_name] = match_species_name(nonstd_name, species_index, threshold)
+        std_name = report[nonstd_name][1]
+      record['species'] = std_name
+  annotate.report = report
+  return annotate
+
+def order_annotator(orders_dict):
+  '''annotator that replaces the host of an avian strain with its order, as get_order_name does, using the species
+  found by species_annotator'''
+  def annotate(fields, record):
+    order = orders_dict.get(record.get('species'), "")
+    if order != "":
+      fields[8] = order
+  return annotate
+
+
+## FASTA files are rewritten by fasta-headers/header_annotator.py, which reads each file once and copies its
+## sequence lines as they are
+def load_header_annotator():
+  import os
+  import sys
+  if 'header_annotator' not in sys.modules:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fasta-headers'))
+  import header_annotator
+  return header_annotator
+
+def write_order_fasta(fasta_file_name, species_dict, orders_dict):
+  '''write FASTA file with new IDs'''
+  headers = load_header_annotator()
+  return headers.annotate_fastas([fasta_file_name], [(species_annotator(species_dict), ''), (order_annotator(orders_dict), '_avian_orders')], 1)[0]
+
+
+if __name__ == '__main__':
+  import os
+  headers = load_header_annotator()
+  annotators = headers.build_annotators(['orders'], os.path.join(fasta_dir, 'avian-species-synonyms.txt'),
+                                        os.path.join(fasta_dir, 'avian-species-orders.txt'), None)
+
+  ## write new FASTA file for all files in list, each in its own process
+  headers.annotate_fastas([os.path.join(fasta_dir, name) for name in fasta_file_names], annotators)
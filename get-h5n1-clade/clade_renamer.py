@@ -1,8 +1,3 @@
-from Bio import SeqIO
-from Bio.SeqRecord import SeqRecord
-import pandas as pd
-
-
 ## specify directory containing fasta files
 ## output files will be saved here (with '_clades' appended to file name)
 fasta_dir = '/Users/jort/Desktop/test/'
@@ -13,37 +8,60 @@ fasta_file_names = ['h5n1_ha.fasta', 'h5n1_pb2.fasta']
 ## specify path to h5nx-clades.tsv
 tsv_path = '/Users/jort/coding/h5n1-mutations-rotation/get-h5n1-clade/h5nx-clades.tsv'
 
+## specify number of fasta files to rename at once (None for one per file, up to the number of cores)
+cores = None
+
 
 ##### user input above #####
 
 
-## make dataframe from clade tsv file
-clade_df = pd.read_table(tsv_path)
+## make clade index from clade tsv file
+## the index is a dictionary from strain name to clade, built once, so looking up a strain does not scan the table.
+## strains listed more than once keep their first clade
+def read_clade_index(tsv_path):
+  import csv
+  clade_index = {}
+  with open(tsv_path, newline='') as tsvfile:
+    for row in csv.DictReader(tsvfile, delimiter='\t'):
+      if row['name'] not in clade_index:
+        clade_index[row['name']] = row['clade']
+  return clade_index
 
 ## functions for re-writing FASTA file
-def get_clade_id(name):
+def get_clade_id(name, clade_index):
   '''get FASTA ID with H5N1 clade'''
-  clade = ""
   name_comps = name.split("|")
-  if name_comps[0] in clade_df.name.values:
-    clade = str(clade_df[clade_df['name'] == name_comps[0]].clade.tolist()[0])
+  clade = clade_index.get(name_comps[0], "")
   if clade != "":
     name_comps[12] = clade
   return("|".join(name_comps))
 
-def write_order_fasta(fasta_file_name):
+def clade_annotator(clade_index):
+  '''annotator for fasta-headers/header_annotator.py that adds the clade of a strain, as get_clade_id does'''
+  def annotate(fields, record):
+    clade = clade_index.get(fields[0], "")
+    if clade != "":
+      fields[12] = clade
+  return annotate
+
+## FASTA files are rewritten by fasta-headers/header_annotator.py, which reads each file once and copies its
+## sequence lines as they are
+def load_header_annotator():
+  import os
+  import sys
+  if 'header_annotator' not in sys.modules:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fasta-headers'))
+  import header_annotator
+  return header_annotator
+
+def write_order_fasta(fasta_file_name, clade_index):
   '''write FASTA file with new IDs'''
-  new_file_name = "".join([fasta_file_name.split(".")[0], "_clades.", fasta_file_name.split(".")[1]])
-  fasta_sequences = SeqIO.parse(open(fasta_file_name),'fasta')
-  records = []
-  for fasta in fasta_sequences:
-    name, sequence = fasta.id, fasta.seq
-    new_name = get_clade_id(name)
-    record = SeqRecord(sequence, new_name, "", "")
-    records.append(record)
-  SeqIO.write(records, new_file_name, "fasta")
-
-## write new FASTA file for all files in list
-for file in fasta_file_names:
-  file_path = fasta_dir+file
-  write_order_fasta(file_path)
\ No newline at end of file
+  headers = load_header_annotator()
+  return headers.annotate_fastas([fasta_file_name], [(clade_annotator(clade_index), '_clades')], 1)[0]
+
+if __name__ == '__main__':
+  headers = load_header_annotator()
+  annotators = headers.build_annotators(['clades'], None, None, tsv_path)
+
+  ## write new FASTA file for all files in list, each in its own process
+  headers.annotate_fastas([fasta_dir + file for file in fasta_file_names], annotators, cores)
@@ -0,0 +1,86 @@
+## Bootstrap confidence intervals for enrichment scores
+##
+## With only a few host1 tips, the odds ratio of a mutation can change a lot with the tips that happened to be sampled.
+## To show this, tips (or clusters of tips, such as clades) are resampled with replacement B times, and each mutation is
+## rescored in every replicate. Rather than rescanning the tree B times, each replicate is a row of weights (how many
+## times each leaf was drawn), and the host1 and host2 counts of every mutation in every replicate are the product of the
+## (2B x leaves) weight matrix, with host1 and host2 weights in separate rows, and the (leaves x mutations) presence
+## matrix of Part 1. The odds ratio of each table is calculated as in calculate_enrichment_score_counts, and the
+## percentiles of the B odds ratios of a mutation are its confidence interval.
+##
+## When tips are resampled, host1 and host2 tips are resampled separately, so every replicate has the same number of
+## tips of each host as the tree. When clusters are resampled, whole clusters are drawn, so the number of tips of each
+## host varies between replicates.
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+import clade_strata
+import presence
+
+
+
+def return_tip_weights(leaf_hosts, replicates, rng):
+    """return a sparse (replicates x leaves) matrix with the number of times each host1 and host2 leaf is drawn in each
+    replicate, when the leaves of each host are resampled with replacement"""
+    rows, columns = [], []
+    for host in (0, 1):
+        host_leaves = np.nonzero(leaf_hosts == host)[0]
+        draws = host_leaves[rng.integers(0, len(host_leaves), size=(replicates, len(host_leaves)))] if len(host_leaves) else np.zeros((replicates, 0), dtype=np.int64)
+        rows.append(np.repeat(np.arange(replicates), draws.shape[1]))
+        columns.append(draws.ravel())
+    rows, columns = np.concatenate(rows), np.concatenate(columns)
+    return csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, columns)), shape=(replicates, len(leaf_hosts)))
+
+
+
+def return_cluster_weights(leaf_clusters, replicates, rng):
+    """return a sparse (replicates x leaves) matrix with the number of times the cluster of each leaf is drawn in each
+    replicate, when clusters are resampled with replacement. Leaves without a cluster (an empty string) each form their
+    own cluster"""
+    leaf_clusters = np.asarray(leaf_clusters, dtype=object).astype(str)
+    unclustered = leaf_clusters == ''
+    leaf_clusters[unclustered] = ['leaf ' + str(i) for i in np.nonzero(unclustered)[0]]
+    clusters, leaf_cluster_index = np.unique(leaf_clusters, return_inverse=True)
+    leaf_cluster_index = leaf_cluster_index.ravel()
+    draws = rng.integers(0, len(clusters), size=(replicates, len(clusters)))
+    cluster_counts = csr_matrix((np.ones(draws.size, dtype=np.int64), (np.repeat(np.arange(replicates), len(clusters)), draws.ravel())),
+                                shape=(replicates, len(clusters)))
+    membership = csr_matrix((np.ones(len(leaf_cluster_index), dtype=np.int64), (leaf_cluster_index, np.arange(len(leaf_cluster_index)))),
+                            shape=(len(clusters), len(leaf_cluster_index)))
+    return cluster_counts @ membership
+
+
+
+def return_odds_ratios(presence_host1, presence_host2, total_host1, total_host2):
+    """odds ratios for arrays of host1 and host2 counts and totals, with the pseudocounts of
+    calculate_enrichment_score_counts (the same odds ratio as fisher_exact returns)"""
+    presence_host1, absence_host1, presence_host2, absence_host2 = presence.return_count_tables(presence_host1, presence_host2, total_host1, total_host2)
+    return (presence_host1 * absence_host2) / (presence_host2 * absence_host1)
+
+
+
+def return_bootstrap_odds_ratios(presence_matrix, leaf_hosts, weights):
+    """return a (replicates x mutations) array with the odds ratio of every mutation in every replicate of weights"""
+    counts, totals = presence.return_weighted_host_counts(presence_matrix, leaf_hosts, weights, (0, 1))
+    return return_odds_ratios(counts[0], counts[1], totals[0][:, None], totals[1][:, None])
+
+
+
+def run_bootstrap(tree, gene, host1, host2, host_annotation, mutations, replicates = 1000, alpha = 0.05, clusters = None, cluster_annotation = None, seed = None):
+    """return a table with the lower and upper percentile confidence interval (alpha / 2 and 1 - alpha / 2) of the
+    enrichment score of each mutation in mutations, from replicates bootstrap replicates of tips, or of clusters of tips
+    if clusters ({strain name: cluster}, e.g. read_clade_table of h5nx-clades.tsv) or cluster_annotation (a node
+    attribute) is given"""
+    presence_matrix, leaves, mutations = presence.return_presence_matrix(tree, gene, list(mutations))
+    leaf_hosts = presence.return_leaf_host_index(leaves, host1, host2, host_annotation)
+    rng = np.random.default_rng(seed)
+    if clusters is None and cluster_annotation is None:
+        weights = return_tip_weights(leaf_hosts, replicates, rng)
+    else:
+        weights = return_cluster_weights(clade_strata.return_leaf_clades(leaves, clusters, cluster_annotation), replicates, rng)
+    odds_ratios = return_bootstrap_odds_ratios(presence_matrix, leaf_hosts, weights)
+    ci_low, ci_high = np.percentile(odds_ratios, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+    return pd.DataFrame({'enrichment_score_ci_low': ci_low, 'enrichment_score_ci_high': ci_high},
+                        index=pd.Index(mutations, name='mutation'))
@@ -13,6 +13,9 @@
 # 
 # In this module, this code is written for parsing a tree json format, output from Nextstrain.
 
+import heapq
+import multiprocessing as mp
+
 
 def return_all_host_tips(tree, host1, host2, host_annotation):
     """count the number of tips on the tree corresponding to each host category"""
@@ -327,4 +330,95 @@ def calculate_enrichment_scores(tree, aa_muts, nt_muts, host1, host2, host_annot
             #print(enrichment_score, total_tips_with_mut, host_counts_dict)
             scores_dict[a] = {"enrichment_score": enrichment_score, "pvalue":p_value}
     
-    return scores_dict, times_detected_dict, branch_lengths_dict, host_counts_dict2
\ No newline at end of file
+    return scores_dict, times_detected_dict, branch_lengths_dict, host_counts_dict2
+
+
+
+## Calculate the enrichment scores in parallel
+##
+## Scoring a mutation means walking from every branch it arises on to each of that branch's descendant leaves, so the
+## time needed to score a mutation grows with the number of descendant leaves it affects. To use multiple cores, the
+## mutations are split into chunks of roughly equal total work, weighted by descendant leaves, and each chunk is
+## scored in a separate process. The pool uses fork, so the tree is shared with the worker processes rather than
+## pickled and sent to each of them.
+
+_shared_tree = None
+
+
+
+def return_mutation_weights(tree, aa_muts, gene):
+    """for each mutation, return the number of branches on the tree plus the number of descendant leaves of every branch
+    the mutation arises on, as an estimate of the work needed to score it"""
+
+    weights = dict((a, len(tree.Objects)) for a in aa_muts)
+    for k in tree.Objects:
+        for mut in return_muts_on_branch(k, gene):
+            if mut in weights:
+                if k.branchType == "leaf":
+                    weights[mut] += 1
+                else:
+                    weights[mut] += len(k.leaves)
+    return weights
+
+
+
+def split_mutations_by_weight(aa_muts, weights, n_chunks):
+    """split mutations into n_chunks lists with roughly equal total weight, assigning the heaviest mutations first
+    to whichever chunk currently has the least weight"""
+
+    chunks = [[] for _ in range(n_chunks)]
+    heap = [(0, i) for i in range(n_chunks)]
+    for a in sorted(aa_muts, key=lambda a: weights[a], reverse=True):
+        total, i = heapq.heappop(heap)
+        chunks[i].append(a)
+        heapq.heappush(heap, (total + weights[a], i))
+    return [chunk for chunk in chunks if chunk]
+
+
+
+def set_shared_tree(tree):
+    """set the tree that score_chunk will use; must be called before the worker processes are forked"""
+    global _shared_tree
+    _shared_tree = tree
+
+
+
+def score_chunk(chunk, nt_muts, host1, host2, host_annotation, min_required_count, host_counts, gene):
+    """calculate_enrichment_scores for a chunk of mutations on the shared tree; run in worker processes"""
+    return calculate_enrichment_scores(_shared_tree, chunk, nt_muts, host1, host2, host_annotation, min_required_count, host_counts, gene)
+
+
+
+def return_part1_chunks(tree, aa_muts, gene, n_chunks):
+    """split mutations into n_chunks chunks of roughly equal work for score_chunk"""
+    weights = return_mutation_weights(tree, aa_muts, gene)
+    return split_mutations_by_weight(aa_muts, weights, n_chunks)
+
+
+
+def merge_partial_scores(partial_results, aa_muts):
+    """merge the dictionaries returned by score_chunk for each chunk, keeping mutations in their original order"""
+    merged = [{}, {}, {}, {}]
+    for result in partial_results:
+        for i in range(4):
+            merged[i].update(result[i])
+    scores_dict, times_detected_dict, branch_lengths_dict, host_counts_dict2 = [dict((a, d[a]) for a in aa_muts if a in d) for d in merged]
+    return scores_dict, times_detected_dict, branch_lengths_dict, host_counts_dict2
+
+
+
+def calculate_enrichment_scores_parallel(tree, aa_muts, nt_muts, host1, host2, host_annotation, min_required_count, host_counts, gene, cores = None, chunks_per_core = 4):
+    """calculate_enrichment_scores, with the mutations split among cores. Returns the same four dictionaries, in the
+    same order, as calculate_enrichment_scores"""
+
+    cores = cores or mp.cpu_count()
+    chunks = return_part1_chunks(tree, aa_muts, gene, cores * chunks_per_core)
+
+    set_shared_tree(tree)
+    try:
+        with mp.get_context('fork').Pool(cores) as pool:
+            partial_results = pool.starmap(score_chunk, [(chunk, nt_muts, host1, host2, host_annotation, min_required_count, host_counts, gene) for chunk in chunks])
+    finally:
+        set_shared_tree(None)
+
+    return merge_partial_scores(partial_results, aa_muts)
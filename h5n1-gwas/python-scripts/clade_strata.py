@@ -0,0 +1,127 @@
+## Clade-stratified enrichment scan
+##
+## Clades are sampled unevenly across hosts, so a mutation fixed in a clade with many human samples looks enriched in
+## humans even if it has nothing to do with host adaptation. Here, every leaf is assigned a clade (from
+## get-h5n1-clade/h5nx-clades.tsv, or from a clade annotation on the tree), and the number of leaves of each host with
+## each mutation is counted within each clade. All of these counts come from one pass over the tree: the presence
+## matrix is built in one traversal, and its entries are tallied by mutation, clade and host with a single bincount.
+##
+## Each mutation is then scored within every clade it is found in (as in calculate_enrichment_score_counts), and across
+## all clades with a Cochran-Mantel-Haenszel test, which pools the host1 vs. host2 tables of the clades and so compares
+## hosts within clades rather than across them. For each clade, the table is
+##       [[host1 leaves with the mutation, host1 leaves without it],
+##        [host2 leaves with the mutation, host2 leaves without it]]
+## Leaves without a clade are not counted.
+
+import csv
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import presence
+
+
+
+def load_residue_module(name):
+    """import a module of the residue analysis from its path, without adding residue-analysis to sys.path. The module is
+    registered in sys.modules, which is where cmh_analysis finds residue_matrix when it imports it"""
+    if name in sys.modules:
+        return sys.modules[name]
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'residue-analysis', name + '.py')
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+## the CMH test is the one of the residue analysis
+load_residue_module('residue_matrix')
+cmh = load_residue_module('cmh_analysis')
+
+
+
+def read_clade_table(tsv_path):
+    """return {strain name: clade} from a tsv file with name and clade columns, such as h5nx-clades.tsv"""
+    with open(tsv_path, newline='') as tsv_file:
+        return dict((row['name'], row['clade']) for row in csv.DictReader(tsv_file, delimiter='\t'))
+
+
+
+def return_leaf_clades(leaves, clades = None, clade_annotation = None):
+    """return the clade of each leaf, looked up by its name (or the strain name before the first | in its name) in
+    clades, or otherwise read from the clade_annotation node attribute. Leaves without a clade get an empty string"""
+    leaf_clades = []
+    for k in leaves:
+        clade = ''
+        if clades is not None:
+            clade = clades.get(k.name, clades.get(k.name.split('|')[0], ''))
+        if clade == '' and clade_annotation is not None and clade_annotation in k.traits['node_attrs']:
+            clade = k.traits['node_attrs'][clade_annotation]
+            if isinstance(clade, dict):
+                clade = clade.get('value', '')
+        leaf_clades.append(str(clade))
+    return leaf_clades
+
+
+
+def return_clade_counts(presence_matrix, leaf_hosts, leaf_clades):
+    """return (mutation counts, host totals, clades): a (mutations x clades x 3) array with the number of host1, host2
+    and other leaves with each mutation in each clade, a (clades x 3) array with the number of leaves of each host in
+    each clade, and the clade of each slice"""
+    clades, leaf_clade_index = np.unique(np.asarray(leaf_clades, dtype=object).astype(str), return_inverse=True)
+    keep = clades != ''
+    clades = clades[keep]
+    leaf_clade_index = np.where(keep[leaf_clade_index], np.cumsum(keep)[leaf_clade_index] - 1, -1)
+    n_clades = len(clades)
+    n_mutations = presence_matrix.shape[1]
+
+    coo = presence_matrix.tocoo()
+    counted = leaf_clade_index[coo.row] >= 0
+    rows, columns = coo.row[counted], coo.col[counted]
+    flat = (columns * n_clades + leaf_clade_index[rows]) * 3 + leaf_hosts[rows]
+    mutation_counts = np.bincount(flat, minlength=n_mutations * n_clades * 3).reshape(n_mutations, n_clades, 3)
+    counted_leaves = leaf_clade_index >= 0
+    host_totals = np.bincount(leaf_clade_index[counted_leaves] * 3 + leaf_hosts[counted_leaves], minlength=n_clades * 3).reshape(n_clades, 3)
+    return mutation_counts, host_totals, list(clades)
+
+
+
+def run_clade_stratified(tree, gene, host1, host2, host_annotation, min_required_count, clades = None, clade_annotation = None):
+    """return (clades_df, pooled_df): the host counts, enrichment score and pvalue of every mutation in every clade in
+    which it is present in at least min_required_count tips (and at least one), and the CMH test of every mutation
+    pooled over clades"""
+    presence_matrix, leaves, mutations = presence.return_presence_matrix(tree, gene)
+    leaf_hosts = presence.return_leaf_host_index(leaves, host1, host2, host_annotation)
+    leaf_clades = return_leaf_clades(leaves, clades, clade_annotation)
+    mutation_counts, host_totals, clade_names = return_clade_counts(presence_matrix, leaf_hosts, leaf_clades)
+    mutations = np.array(mutations, dtype=object)
+
+    ## per-clade scores
+    mutation_index, clade_index = np.nonzero(mutation_counts.sum(axis=2) >= max(min_required_count, 1))
+    counts = mutation_counts[mutation_index, clade_index]
+    totals = host_totals[clade_index]
+    enrichment_score, pvalue = presence.score_counts(counts, totals)
+    clades_df = pd.DataFrame({'mutation': mutations[mutation_index], 'clade': np.array(clade_names, dtype=object)[clade_index],
+                              'enrichment_score': enrichment_score, 'pvalue': pvalue,
+                              host1: counts[:, 0], host2: counts[:, 1], 'other': counts[:, 2],
+                              'total_' + host1: totals[:, 0], 'total_' + host2: totals[:, 1], 'total_other': totals[:, 2]})
+
+    ## pooled over clades
+    a = mutation_counts[:, :, 0]
+    b = host_totals[None, :, 0] - a
+    c = mutation_counts[:, :, 1]
+    d = host_totals[None, :, 1] - c
+    statistic, oddsratio, pvalue = cmh.cmh_test(a, b, c, d, axis=-1)
+    ## clades that contribute to the test of each mutation: those with a nonzero CMH variance term, i.e. with host1 and
+    ## host2 leaves, and leaves both with and without the mutation
+    strata = ((a + b > 0) & (c + d > 0) & (a + c > 0) & (b + d > 0)).sum(axis=1)
+    pooled_counts = mutation_counts.sum(axis=1)
+    scored = pooled_counts.sum(axis=1) >= min_required_count
+    pooled_df = pd.DataFrame({'cmh_statistic': statistic, 'mh_oddsratio': oddsratio, 'pvalue': pvalue,
+                              'clades_present': (mutation_counts.sum(axis=2) > 0).sum(axis=1), 'clades_informative': strata,
+                              host1: pooled_counts[:, 0], host2: pooled_counts[:, 1], 'other': pooled_counts[:, 2]},
+                             index=pd.Index(mutations, name='mutation'))[scored]
+    return clades_df, pooled_df
@@ -22,9 +22,23 @@ host1 = "Human"
 host2 = "Avian"
 minimum_required_count = 0
 
+## Specify the number of cores used to calculate enrichment scores in Part 1. With 1, mutations are scored one after 
+## another on a single core; with more, mutations are split among that many processes. Set to None to use all cores
+part1_cores = 1
+
+## If pipeline == True, Part 1 and the simulations in Part 2 are run at the same time in one pool of worker processes,
+## rather than one after the other, and output files are written while the simulations are still running. The pool
+## uses pipeline_cores cores; set to None to use all cores
+pipeline = False
+pipeline_cores = None
+
 ## Specify the number of simulations to perform
 iterations = 10000
 
+## Specify a random seed for the simulations, or None for unseeded simulations. With a seed, every simulated iteration
+## draws the same random numbers regardless of how many cores are used, so runs are reproducible
+seed = None
+
 ## Specify path and naming scheme for output folder
 ## Sequential numbers will be added to the folder name to prevent overwriting data
     ## e.g., for naming_scheme = "test_data", folders will be named "test_data_0", "test_data_1", etc.
@@ -41,5 +55,67 @@ naming_scheme = "H5N1_" + gene
 reload_trees = False
 output_folder_path = "/Users/jort/coding/GWAS Data/H5N1_PB2_0"
 
+## If use_run_store == True, results are kept in a run store rather than a new numbered folder for every run. Part 1 results
+## and simulations are stored by a hash of the tree file and the settings above, so rerunning with an unchanged tree and
+## config reuses them instead of recomputing, and raising iterations only simulates the additional iterations. Output
+## files for each run are written to a folder within run_store_path named after the hash of that run's inputs. Simulations
+## are only stored and reused when seed is set; unseeded runs reuse Part 1 but simulate a new null each time, and write
+## to a new numbered folder. A run with fewer iterations than are stored uses the first iterations, and does not write
+## df9 and df10, whose branch tallies cover all stored iterations
+use_run_store = False
+run_store_path = "GWAS Data/run_store/"
+
+## If bootstrap_replicates is set, add a bootstrap confidence interval for the enrichment score of every mutation to
+## the Part 1 output (the bootstrap_alpha / 2 and 1 - bootstrap_alpha / 2 percentiles of the scores of
+## bootstrap_replicates resamples). Tips are resampled within each host, or if bootstrap_cluster_path (a tsv file with
+## name and clade columns, such as get-h5n1-clade/h5nx-clades.tsv) or bootstrap_cluster_annotation (a node attribute) is
+## set, whole clusters of tips are resampled. Resamples are drawn with seed
+bootstrap_replicates = None
+bootstrap_alpha = 0.05
+bootstrap_cluster_path = None
+bootstrap_cluster_annotation = None
+
+## If previous_run_path is set to the output folder of a previous run (on an earlier build of the same segment), Part 1 is
+## run incrementally: mutations that arise on subtrees with the same tips in both trees keep their host counts from the
+## previous run, and only mutations whose descendant tips changed are rescored. The previous run must have been written
+## by run_scan (or the pipelined run), which saves the pickled tree alongside the data files. It cannot be used with
+## pipeline
+previous_run_path = None
+
+## If window_width is set (in years), run a time-windowed scan instead of the full scan: tips are split into rolling
+## windows of window_width years by sampling date, starting every window_step years, and every mutation is scored
+## within each window. Only Part 1 is run, and the output is a table of scores for every mutation and window
+window_width = None
+window_step = 1
+
+## If clade_stratified == True, run a clade-stratified scan instead of the full scan: every mutation is scored within each
+## clade, and pooled across clades with a Cochran-Mantel-Haenszel test. Leaf clades are looked up by strain name in
+## clade_path (a tsv file with name and clade columns, such as get-h5n1-clade/h5nx-clades.tsv), or read from the
+## clade_annotation node attribute for leaves that are not in the file. Only Part 1 is run
+clade_stratified = False
+clade_path = "/Users/jort/coding/h5n1-mutations-rotation/get-h5n1-clade/h5nx-clades.tsv"
+clade_annotation = None
+
+## If event_index == True, index the independent origins of every mutation instead of running the full scan: every branch a
+## mutation arises on is written with the host inferred at its parent and child node (e.g. by augur traits) and the
+## number of tips of each host below it, along with origin counts by host transition for each mutation
+event_index = False
+
+## If pair_min_support is set, run a pairwise co-occurrence scan instead of the full scan: every pair of mutations present
+## together in at least pair_min_support tips is scored for enrichment in host1, using packed bitsets of the tips with
+## each mutation. Mutations are compared in blocks of pair_block_size, on part1_cores cores. Only Part 1 is run
+pair_min_support = None
+pair_block_size = 256
+
+## If subsamples is set, run a sampling sensitivity scan instead of the full scan: tips are subsampled subsamples times,
+## keeping subsample_sequences_per_group tips per group of the subsample_group_by attributes (as in the filter rule of
+## base-build/Snakefile; 'month' and 'year' are taken from sampling dates), every mutation is scored in every subsample,
+## and the output is the fraction of subsamples in which each mutation is significant (pvalue <= subsample_alpha and an
+## enrichment score above 1). Subsamples are drawn with seed. Only Part 1 is run
+subsamples = None
+subsample_group_by = ["host", "region", "month"]
+subsample_sequences_per_group = 2
+subsample_alpha = 0.05
+
 ## If testing_mode == True, write additional simulation dataframes to csv files (df9, df10)
 testing_mode = True
\ No newline at end of file
@@ -0,0 +1,131 @@
+## Pairwise co-occurrence scan
+##
+## Some mutations may only be host-enriched together (e.g. PB2 E627K with D701N or Q591K). To find these pairs, the
+## tips counted as having each mutation in Part 1 (the columns of the presence matrix) are packed into a bitset, one bit
+## per leaf. Leaves are sorted by host first, and the leaves of each host are padded to a whole number of 64-bit words,
+## so the number of host1, host2 and other leaves that have both mutations of a pair is the popcount of the bitwise AND
+## of their bitsets over the words of each host. Only mutations present in at least min_support tips are included, and
+## only pairs present together in at least min_support tips are kept, so the output is a sparse table of pairs.
+##
+## With thousands of mutations there are millions of pairs, so mutations are split into blocks, and every pair of blocks
+## is compared a few rows of the first block at a time, so that the AND of the rows with the second block stays below a
+## fixed number of words however many tips the tree has. Blocks are spread over worker processes, which share the bitsets
+## from the parent process. Every pair is then scored against the number of tips of each host on the tree, as a single
+## mutation is in calculate_enrichment_score_counts.
+
+import multiprocessing as mp
+
+import numpy as np
+import pandas as pd
+
+import presence
+
+
+
+def popcount(words):
+    """number of set bits in each element of a uint64 array"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    return table[np.ascontiguousarray(words).view(np.uint8)].reshape(words.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+
+def return_bitsets(presence_matrix, leaf_hosts):
+    """return (bitsets, host_words): a (mutations x words) uint64 array with a bit for every leaf that has each
+    mutation, with the leaves of host1, host2 and other in that order, each padded to whole words, and the range of
+    words of each host"""
+    columns = presence_matrix.tocsc().T.tocsr()
+    segments = []
+    host_words = []
+    first_word = 0
+    for host in range(3):
+        host_leaves = np.nonzero(leaf_hosts == host)[0]
+        n_words = (len(host_leaves) + 63) // 64
+        host_columns = columns[:, host_leaves]
+        segment = np.zeros((columns.shape[0], n_words), dtype=np.uint64)
+        ## unpacked a few rows at a time, so that only the packed bitsets of all mutations are held in memory
+        for start in range(0, columns.shape[0], 1024):
+            dense = np.zeros((min(1024, columns.shape[0] - start), n_words * 64), dtype=bool)
+            rows = host_columns[start:start + 1024].tocoo()
+            dense[rows.row, rows.col] = True
+            segment[start:start + len(dense)] = np.packbits(dense, axis=1, bitorder='little').view(np.uint64).reshape(len(dense), n_words)
+        segments.append(segment)
+        host_words.append((first_word, first_word + n_words))
+        first_word += n_words
+    return np.ascontiguousarray(np.concatenate(segments, axis=1)), host_words
+
+
+
+def return_block_pairs(bitsets, host_words, first, second, min_support, max_words = 1 << 22):
+    """return (rows, columns, counts) of the pairs of mutations in blocks first and second (ranges of rows of bitsets)
+    present together in at least min_support tips, with their joint host1, host2 and other counts. Within one block,
+    only pairs with row < column are returned. Rows of the first block are ANDed with the second block a few at a time,
+    so that at most max_words words are ANDed at once"""
+    a = bitsets[first[0]:first[1]]
+    b = bitsets[second[0]:second[1]]
+    counts = np.zeros((len(a), len(b), 3), dtype=np.int64)
+    step = max(1, max_words // max(len(b) * bitsets.shape[1], 1))
+    for row in range(0, len(a), step):
+        for host, (start, end) in enumerate(host_words):
+            joint = np.bitwise_and(a[row:row + step, None, start:end], b[None, :, start:end])
+            counts[row:row + step, :, host] = popcount(joint).sum(axis=2, dtype=np.int64)
+    keep = counts.sum(axis=2) >= max(min_support, 1)
+    if first == second:
+        keep &= np.triu(np.ones(keep.shape, dtype=bool), 1)
+    rows, columns = np.nonzero(keep)
+    return rows + first[0], columns + second[0], counts[rows, columns]
+
+
+
+## bitsets shared with the worker processes; set before the pool is forked
+shared_bitsets = {}
+
+def return_shared_block_pairs(first, second, min_support):
+    return return_block_pairs(shared_bitsets['bitsets'], shared_bitsets['host_words'], first, second, min_support)
+
+
+
+def return_pair_counts(bitsets, host_words, min_support, block_size = 256, cores = 1):
+    """return (rows, columns, counts) for every pair of mutations present together in at least min_support tips,
+    comparing blocks of block_size mutations on cores worker processes (0 for all cores)"""
+    blocks = [(start, min(start + block_size, len(bitsets))) for start in range(0, len(bitsets), block_size)]
+    block_pairs = [(first, second, min_support) for i, first in enumerate(blocks) for second in blocks[i:]]
+    shared_bitsets.update(bitsets=bitsets, host_words=host_words)
+    cores = cores or mp.cpu_count()
+    if cores == 1 or len(block_pairs) == 1:
+        results = [return_shared_block_pairs(*block_pair) for block_pair in block_pairs]
+    else:
+        with mp.get_context('fork').Pool(min(cores, len(block_pairs))) as pool:
+            results = pool.starmap(return_shared_block_pairs, block_pairs)
+    if not results:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros((0, 3), dtype=np.int64)
+    return (np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results]),
+            np.concatenate([r[2] for r in results]).reshape(-1, 3))
+
+
+
+def run_cooccurrence(tree, gene, host1, host2, host_annotation, min_support = 5, block_size = 256, cores = 1):
+    """return a table of every pair of mutations present together in at least min_support tips, with the number of
+    host1, host2 and other tips that have both, the enrichment score and pvalue of the pair against the host totals of
+    the tree, and the number of host1 and host2 tips with each mutation of the pair"""
+    presence_matrix, leaves, mutations = presence.return_presence_matrix(tree, gene)
+    leaf_hosts = presence.return_leaf_host_index(leaves, host1, host2, host_annotation)
+    host_totals = np.bincount(leaf_hosts, minlength=3)
+
+    ## mutations in fewer than min_support tips cannot be in a pair that is
+    mutation_counts = presence.return_mutation_host_counts(presence_matrix, leaf_hosts)
+    supported = np.nonzero(mutation_counts.sum(axis=1) >= max(min_support, 1))[0]
+    order = supported[np.argsort(np.array(mutations, dtype=object)[supported], kind='stable')]
+    bitsets, host_words = return_bitsets(presence_matrix[:, order], leaf_hosts)
+    rows, columns, counts = return_pair_counts(bitsets, host_words, min_support, block_size, cores)
+
+    enrichment_score, pvalue = presence.score_counts(counts, np.tile(host_totals, (len(counts), 1))) if len(counts) else (np.zeros(0), np.zeros(0))
+    mutations = np.array(mutations, dtype=object)[order]
+    first_counts, second_counts = mutation_counts[order][rows], mutation_counts[order][columns]
+    pairs_df = pd.DataFrame({'mutation_1': mutations[rows], 'mutation_2': mutations[columns],
+                             'enrichment_score': enrichment_score, 'pvalue': pvalue,
+                             host1: counts[:, 0], host2: counts[:, 1], 'other': counts[:, 2],
+                             'mutation_1_' + host1: first_counts[:, 0], 'mutation_1_' + host2: first_counts[:, 1],
+                             'mutation_2_' + host1: second_counts[:, 0], 'mutation_2_' + host2: second_counts[:, 1]})
+    return pairs_df.sort_values(['mutation_1', 'mutation_2'], kind='stable').reset_index(drop=True)
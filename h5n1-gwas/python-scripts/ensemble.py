@@ -0,0 +1,140 @@
+## Scanning an ensemble of trees
+##
+## The scan scores mutations on one tree, so its results depend on one topology. To see how much they depend on it, the
+## scan is run on an ensemble of trees built from the same alignment, such as bootstrap replicates or trees from a
+## posterior sample, each exported with mutations and hosts as an auspice json (like the tree of the main build). Each
+## tree is read and scored in its own worker process with the presence matrix of Part 1 (presence.py), and, if
+## iterations is above 0, a null of that many simulations is run on it (simulate_mutation_gain_loss_markov_chain.py), from
+## which it gets its own empirical cutoffs (simulation_dfs.return_empirical_cutoffs). Without simulations, a mutation is called
+## significant on a tree if its pvalue is at most alpha and it is enriched in host1.
+##
+## The trees share their tips, so the tip names and hosts are read once, from the main tree of the build (or the first
+## tree of the ensemble), into a tip dictionary that the worker processes share, and every tree's leaves are looked up
+## in it, so every tree is scored with the hosts of the main tree, not with the host annotations of its own tips; a tree
+## with a tip that is not in the dictionary is an error.
+## Scores are sent back with the mutation names of each tree, which are kept in one mutation dictionary, so the scores
+## of a mutation on every tree are gathered under one name. For each mutation, the output has the distribution of its
+## enrichment score across the trees it is scored on, and the fraction of all trees on which it is called significant.
+
+import multiprocessing as mp
+import pickle
+
+import numpy as np
+import pandas as pd
+
+import calculate_enrichment_scores_across_tree_JSON as calenr
+import config as cfg
+import presence
+import simulation_dfs as simdfs
+import simulate_mutation_gain_loss_markov_chain as simmut
+import tree_manager as tm
+
+
+
+def return_tip_dictionary(tree, host1, host2, host_annotation):
+    """return ({tip name: tip index}, host index of each tip from presence.return_leaf_host_index)"""
+    leaves = [k for k in tree.Objects if k.branchType == "leaf"]
+    return dict((k.name, i) for i, k in enumerate(leaves)), presence.return_leaf_host_index(leaves, host1, host2, host_annotation)
+
+
+
+## settings and tip dictionary shared with the worker processes; set before the pool is forked
+shared_ensemble = {}
+
+def scan_tree(tree_number, tree_path):
+    """return (tree number, mutations, enrichment scores, pvalues, significant, (pvalue cutoff, enrichment score cutoff))
+    for the mutations scored on one tree of the ensemble"""
+    s = shared_ensemble
+    json_tree, tree = tm.read_in_tree_json(tree_path)
+    presence_matrix, leaves, mutations = presence.return_presence_matrix(tree, s['gene'])
+    missing = [k.name for k in leaves if k.name not in s['tips']]
+    if missing:
+        raise ValueError(F"{tree_path} has {len(missing)} tips that are not in the tip dictionary, e.g. {missing[0]}")
+    leaf_hosts = s['hosts'][[s['tips'][k.name] for k in leaves]]
+    host_totals = np.bincount(leaf_hosts, minlength=3)
+
+    ## host counts of every mutation, and scores of the mutations in at least min_required_count tips
+    mutation_counts = presence.return_mutation_host_counts(presence_matrix, leaf_hosts)
+    scored = np.nonzero(mutation_counts.sum(axis=1) >= s['min_required_count'])[0]
+    if len(scored):
+        enrichment_score, pvalue = presence.score_counts(mutation_counts[scored], np.tile(host_totals, (len(scored), 1)))
+    else:
+        enrichment_score, pvalue = np.zeros(0), np.zeros(0)
+
+    ## null for this tree
+    if s['iterations'] > 0:
+        host_counts = {s['host1']: int(host_totals[0]), s['host2']: int(host_totals[1]), 'other': int(host_totals[2])}
+        total_tree_branch_length, tree_branch_lengths = calenr.return_total_tree_branch_length(tree)
+        pickled_tree = pickle.dumps(tm.get_no_muts_tree(tree, s['gene']), -1)
+        seed = None if s['seed'] is None else F"{s['seed']}-tree{tree_number}"
+        sim_data = simmut.perform_simulations(pickled_tree, s['gene'], total_tree_branch_length, s['host1'], s['host2'], s['host_annotation'],
+                                              s['min_required_count'], host_counts, s['iterations'], seed)
+        df8, df9, df10 = simdfs.sim_data_to_dfs([sim_data])
+        cutoffs = simdfs.return_empirical_cutoffs(df8, s['alpha'])
+        significant = (pvalue <= cutoffs[0]) & (enrichment_score >= cutoffs[1])
+    else:
+        cutoffs = (s['alpha'], np.nan)
+        significant = (pvalue <= s['alpha']) & (enrichment_score > 1)
+    return tree_number, [mutations[i] for i in scored], enrichment_score, pvalue, significant, cutoffs
+
+
+
+def run_ensemble(tree_paths, gene, host1, host2, host_annotation, min_required_count, iterations = 0, alpha = 0.05, seed = None, cores = None, tip_tree_path = None):
+    """scan every tree in tree_paths on cores worker processes (None or 0 for all cores), with tips and hosts read from
+    tip_tree_path (or the first tree), and return (summary_df, scores_df, cutoffs_df): the distribution of the enrichment
+    score and the fraction of trees called significant for every mutation, the score of every mutation on every tree it
+    is scored on, and the cutoffs of every tree"""
+    json_tree, tip_tree = tm.read_in_tree_json(tip_tree_path or tree_paths[0])
+    tips, hosts = return_tip_dictionary(tip_tree, host1, host2, host_annotation)
+    shared_ensemble.update(tips=tips, hosts=hosts, gene=gene, host1=host1, host2=host2, host_annotation=host_annotation,
+                           min_required_count=min_required_count, iterations=iterations, alpha=alpha, seed=seed)
+    cores = min(cores or mp.cpu_count(), len(tree_paths))
+    if cores == 1:
+        results = [scan_tree(tree_number, tree_path) for tree_number, tree_path in enumerate(tree_paths)]
+    else:
+        with mp.get_context('fork').Pool(cores) as pool:
+            results = pool.starmap(scan_tree, enumerate(tree_paths), chunksize=1)
+
+    ## mutation dictionary: the same column for a mutation on every tree
+    mutation_index = {}
+    tree_numbers, columns, scores, pvalues, significant, cutoffs = [], [], [], [], [], []
+    for tree_number, mutations, tree_scores, tree_pvalues, tree_significant, tree_cutoffs in results:
+        tree_numbers.append(np.full(len(mutations), tree_number))
+        columns.append(np.array([mutation_index.setdefault(mut, len(mutation_index)) for mut in mutations], dtype=np.int64))
+        scores.append(tree_scores)
+        pvalues.append(tree_pvalues)
+        significant.append(tree_significant)
+        cutoffs.append((tree_number, tree_paths[tree_number]) + tuple(tree_cutoffs))
+    tree_numbers, columns = np.concatenate(tree_numbers), np.concatenate(columns)
+    scores, pvalues, significant = np.concatenate(scores), np.concatenate(pvalues), np.concatenate(significant)
+    mutations = np.array(list(mutation_index), dtype=object)
+
+    scores_df = pd.DataFrame({'tree': tree_numbers, 'mutation': mutations[columns], 'enrichment_score': scores, 'pvalue': pvalues, 'significant': significant})
+    cutoffs_df = pd.DataFrame(cutoffs, columns=['tree', 'tree_path', 'pvalue_cutoff', 'enrichment_score_cutoff'])
+
+    ## distribution across trees; trees on which a mutation is not scored do not call it significant
+    grouped = scores_df.groupby('mutation', sort=True)
+    summary_df = pd.DataFrame({'trees_scored': grouped.size(),
+                               'fraction_significant': grouped['significant'].sum() / len(tree_paths),
+                               'enrichment_score_mean': grouped['enrichment_score'].mean(),
+                               'enrichment_score_q025': grouped['enrichment_score'].quantile(0.025),
+                               'enrichment_score_median': grouped['enrichment_score'].median(),
+                               'enrichment_score_q975': grouped['enrichment_score'].quantile(0.975),
+                               'pvalue_median': grouped['pvalue'].median()})
+    summary_df.index.name = 'mutation'
+    return summary_df.sort_values('fraction_significant', ascending=False, kind='stable'), scores_df, cutoffs_df
+
+
+
+def run_ensemble_job(tree_paths, output_path, scores_path = None, cutoffs_path = None, cores = None, alpha = 0.05):
+    """run the ensemble scan with the settings in config.py (cfg.iterations simulations per tree, and tips and hosts from
+    cfg.tree_path), and write the summary of every mutation to output_path, and the scores of every tree and the cutoffs
+    of every tree if paths are given"""
+    summary_df, scores_df, cutoffs_df = run_ensemble(tree_paths, cfg.gene, cfg.host1, cfg.host2, cfg.host_annotation, cfg.minimum_required_count,
+                                                     cfg.iterations, alpha, cfg.seed, cores, cfg.tree_path)
+    summary_df.to_csv(output_path, sep="\t", header=True, index_label="mutation")
+    if scores_path is not None:
+        scores_df.to_csv(scores_path, sep="\t", header=True, index=False)
+    if cutoffs_path is not None:
+        cutoffs_df.to_csv(cutoffs_path, sep="\t", header=True, index=False)
+    return summary_df
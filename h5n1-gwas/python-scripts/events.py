@@ -0,0 +1,95 @@
+## Independent origins of mutations and host transitions
+##
+## return_number_times_on_tree counts the branches a mutation arises on, but not where on the tree they are. augur
+## traits infers the host of internal nodes as well as tips, so each branch a mutation arises on also has a parent host
+## (the host inferred at the node above the branch) and a child host (the host at the node or tip it leads to), and a
+## mutation that repeatedly arises on branches where the host changes is a candidate for host adaptation. Here every
+## branch a mutation arises on is recorded as an event, with its parent and child host and the number of tips of each
+## host below it, in a single traversal of the tree (children come before their parent in reversed preorder, so the tips
+## below each branch are counted from those of its children). Statistics by mutation and host transition are then
+## tallies of the event table, and do not need another walk of the tree.
+
+import numpy as np
+import pandas as pd
+
+import calculate_enrichment_scores_across_tree_JSON as calenr
+
+
+
+def return_node_host(k, host_annotation):
+    """return the host of a node or tip, or an empty string if it has none (e.g. the parent of the root)"""
+    node_attrs = k.traits.get('node_attrs', {}) if k is not None else {}
+    if host_annotation not in node_attrs:
+        return ''
+    host = node_attrs[host_annotation]
+    return host.get('value', '') if isinstance(host, dict) else host
+
+
+
+def return_branch_divergence(k):
+    """return the length of the branch leading to a node or tip in divergence, as in
+    calenr.return_total_tree_branch_length (the parent divergence of the root is 0)"""
+    parent_attrs = k.parent.traits.get('node_attrs', {}) if k.parent is not None else {}
+    return k.traits['node_attrs']['div'] - parent_attrs.get('div', 0)
+
+
+
+def return_event_index(tree, gene, host1, host2, host_annotation):
+    """return a table with one row for every branch that every mutation arises on (its independent origins): the
+    preorder index of the branch, its parent and child host, whether they differ, its length and date, and the number of
+    host1, host2 and other tips below it. Branch lengths are in divergence, as elsewhere in the scan"""
+    index = dict((id(k), i) for i, k in enumerate(tree.Objects))
+    tip_counts = {}
+    events = []
+    for k in reversed(tree.Objects):
+        if k.branchType == 'leaf':
+            host = return_node_host(k, host_annotation)
+            counts = np.array([host == host1, host == host2, host not in (host1, host2)], dtype=np.int64)
+        else:
+            counts = sum(tip_counts[id(child)] for child in k.children)
+        tip_counts[id(k)] = counts
+
+        muts = set(calenr.return_muts_on_branch(k, gene))
+        if muts:
+            parent_host = return_node_host(k.parent, host_annotation)
+            child_host = return_node_host(k, host_annotation)
+            for mut in muts:
+                events.append((mut, index[id(k)], parent_host, child_host, return_branch_divergence(k), getattr(k, 'absoluteTime', None),
+                               counts[0], counts[1], counts[2]))
+
+    events_df = pd.DataFrame(events, columns=['mutation', 'branch', 'parent_host', 'child_host', 'branch_length', 'date',
+                                              'tips_' + host1, 'tips_' + host2, 'tips_other'])
+    events_df['host_change'] = (events_df['parent_host'] != events_df['child_host']) & (events_df['parent_host'] != '')
+    events_df['descendant_tips'] = events_df[['tips_' + host1, 'tips_' + host2, 'tips_other']].sum(axis=1)
+    return events_df.sort_values(['mutation', 'branch'], kind='stable').reset_index(drop=True)
+
+
+
+def return_transition_table(events_df):
+    """return the number of origins and descendant tips of every mutation for each (parent host, child host) pair"""
+    return events_df.groupby(['mutation', 'parent_host', 'child_host'], sort=True).agg(
+        origins=('branch', 'size'), descendant_tips=('descendant_tips', 'sum')).reset_index()
+
+
+
+def return_origin_summary(events_df, host1, host2):
+    """return, for every mutation, the number of independent origins, the number on branches where the host changes,
+    the number on branches into host1 and host2 from another host and within host1 and host2, and the tips below all
+    origins"""
+    parent, child, change = events_df['parent_host'], events_df['child_host'], events_df['host_change']
+    flags = pd.DataFrame({'mutation': events_df['mutation'],
+                          'origins': 1,
+                          'host_change_origins': change.astype(int),
+                          'origins_into_' + host1: (change & (child == host1)).astype(int),
+                          'origins_into_' + host2: (change & (child == host2)).astype(int),
+                          'origins_within_' + host1: ((parent == host1) & (child == host1)).astype(int),
+                          'origins_within_' + host2: ((parent == host2) & (child == host2)).astype(int),
+                          'descendant_tips': events_df['descendant_tips']})
+    return flags.groupby('mutation', sort=True).sum()
+
+
+
+def run_event_index(tree, gene, host1, host2, host_annotation):
+    """return (events_df, transitions_df, summary_df) for every mutation on the tree"""
+    events_df = return_event_index(tree, gene, host1, host2, host_annotation)
+    return events_df, return_transition_table(events_df), return_origin_summary(events_df, host1, host2)
@@ -0,0 +1,183 @@
+## Incremental Part 1 between successive builds
+##
+## Successive builds of the same segment mostly share their tree: new sequences are added and a few clades are
+## rearranged, but most mutations still arise on subtrees with the same tips. Scoring a mutation means walking from every
+## branch it arises on to each descendant leaf, so rather than rescoring every mutation, the tip counts of unchanged
+## mutations are taken from the previous run and only the changed ones are recounted.
+##
+## Subtrees are matched between the two trees by their tip sets. Each tip is hashed with its host, and the hash of a
+## subtree is the sum of the hashes of its tips, so two subtrees with the same tips (with the same hosts) have the same
+## hash regardless of how they are resolved. The tips that a mutation arising on branch k is counted in are the tips
+## below k, minus the tips below any branch further down with the back mutation (or the same mutation again), so a
+## mutation is described by the subtree hash of every branch it arises on, together with the subtree hashes of those
+## branches further down. If this signature is the same in both trees, its host counts are the same, and they are
+## reused; otherwise the mutation is rescored. Times detected and branch lengths are recounted for every mutation in a
+## single pass, since branch lengths change between builds even when the topology does not. Enrichment scores depend on
+## the number of tips of each host on the whole tree, so the cached scores are only reused if those are unchanged;
+## otherwise they are recalculated from the reused host counts, which only needs the Fisher's exact test.
+
+import glob
+import hashlib
+import os
+import pickle
+
+import pandas as pd
+
+import calculate_enrichment_scores_across_tree_JSON as calenr
+import tree_manager as tm
+
+
+
+def hash_tip(name, host):
+    """return a 64 bit hash of a tip name and its host"""
+    return int.from_bytes(hashlib.blake2b((name + "\0" + str(host)).encode(), digest_size=8).digest(), "little")
+
+
+
+def return_subtree_hashes(tree, host_annotation):
+    """return the tip set hash of the subtree below each branch, and the preorder index and end of the subtree of each
+    branch, keyed by id(branch). tree.Objects is in preorder, so children are always visited before their parents when
+    it is walked backwards"""
+    index = dict((id(k), i) for i, k in enumerate(tree.Objects))
+    subtree_hash = {}
+    subtree_end = {}
+    for i in range(len(tree.Objects) - 1, -1, -1):
+        k = tree.Objects[i]
+        if k.branchType == "leaf":
+            subtree_hash[id(k)] = hash_tip(k.name, k.traits['node_attrs'][host_annotation]['value'])
+            subtree_end[id(k)] = i + 1
+        else:
+            subtree_hash[id(k)] = sum(subtree_hash[id(child)] for child in k.children) % (1 << 64)
+            subtree_end[id(k)] = max([i + 1] + [subtree_end[id(child)] for child in k.children])
+    return index, subtree_hash, subtree_end
+
+
+
+def return_mutation_branches(tree, gene):
+    """return {mutation: [branches the mutation arises on]} for every mutation on the tree"""
+    mutation_branches = {}
+    for k in tree.Objects:
+        for mut in set(calenr.return_muts_on_branch(k, gene)):
+            mutation_branches.setdefault(mut, []).append(k)
+    return mutation_branches
+
+
+
+def return_mutation_signatures(tree, gene, host_annotation):
+    """return {mutation: signature}, where a mutation's signature determines the host counts of the tips it is counted
+    in: for every branch it arises on, the tip set hash of that branch and of each branch further down that carries the
+    back mutation or the same mutation again"""
+    index, subtree_hash, subtree_end = return_subtree_hashes(tree, host_annotation)
+    mutation_branches = return_mutation_branches(tree, gene)
+    signatures = {}
+    for mut, branches in mutation_branches.items():
+        excluding = branches + mutation_branches.get(calenr.return_opposite_mutation(mut), [])
+        signature = []
+        for k in branches:
+            start, end = index[id(k)], subtree_end[id(k)]
+            below = sorted(subtree_hash[id(j)] for j in excluding if start < index[id(j)] < end)
+            signature.append((subtree_hash[id(k)], tuple(below)))
+        signatures[mut] = tuple(sorted(signature))
+    return signatures
+
+
+
+def return_times_and_branch_lengths(tree, gene):
+    """return the number of times each mutation arises on the tree and the total length of the branches it arises on,
+    as return_number_times_on_tree and return_branch_length_mut_on_tree would, for all mutations in one pass"""
+    times_detected_dict = {}
+    branch_lengths_dict = {}
+    for k in tree.Objects:
+        muts = set(calenr.return_muts_on_branch(k, gene))
+        if not muts:
+            continue
+        if k.parent.traits == {} or 'node_attrs' not in k.parent.traits:
+            parent_div = 0
+        else:
+            parent_div = k.parent.traits['node_attrs']['div']
+        local_branch_length = k.traits['node_attrs']['div'] - parent_div
+        for mut in muts:
+            times_detected_dict[mut] = times_detected_dict.get(mut, 0) + 1
+            branch_lengths_dict[mut] = branch_lengths_dict.get(mut, 0) + local_branch_length
+    return times_detected_dict, branch_lengths_dict
+
+
+
+def read_previous_config(previous_folder):
+    """return the settings in a previous run's config.txt as a dictionary of strings"""
+    config = {}
+    with open(os.path.join(previous_folder, "config.txt")) as config_file:
+        for line in config_file:
+            key, _, value = line.rstrip("\n").partition(": ")
+            config[key] = value
+    return config
+
+
+
+def load_previous_run(previous_folder, gene, host1, host2, host_annotation):
+    """return the tree and df5 of a previous run folder written by run_scan. Raises a ValueError if the previous run
+    scanned a different gene or hosts"""
+    config = read_previous_config(previous_folder)
+    for key, value in (('gene', gene), ('host1', host1), ('host2', host2), ('host_annotation', host_annotation)):
+        if config.get(key) != value:
+            raise ValueError(F"previous run in {previous_folder} has {key} {config.get(key)}, not {value}")
+
+    baltic_tree_path = os.path.join(previous_folder, "pickled_baltic_tree.obj")
+    if not os.path.exists(baltic_tree_path):
+        raise FileNotFoundError(F"{baltic_tree_path} not found; incremental runs need the tree pickled by a previous run_scan")
+    tm.load_baltic() # pickled baltic trees can only be loaded once baltic has been imported
+    with open(baltic_tree_path, 'rb') as pickled_baltic_tree:
+        previous_tree = pickle.load(pickled_baltic_tree)
+
+    ## data files are dated, so take the most recent one
+    data_paths = sorted(glob.glob(os.path.join(previous_folder, "data", gene + "_" + host1 + "_vs_" + host2 + "_data_*.tsv")))
+    if not data_paths:
+        raise FileNotFoundError(F"no Part 1 data file found in {previous_folder}/data")
+    previous_df5 = pd.read_csv(data_paths[-1], sep="\t", index_col="mutation", keep_default_na=False, na_values=[""])
+    return previous_tree, previous_df5
+
+
+
+def calculate_enrichment_scores_incremental(tree, previous_tree, previous_df5, host1, host2, host_annotation, min_required_count, host_counts, gene, cores = 1):
+    """calculate_enrichment_scores for every mutation on tree, reusing the host counts (and, if the number of tips of
+    each host is unchanged, the scores) in previous_df5 for mutations whose signature is the same on previous_tree.
+    Returns the same four dictionaries as calculate_enrichment_scores, and the list of mutations that were rescored"""
+    aa_muts, nt_muts = calenr.gather_all_mut_on_tree(tree, gene)
+    signatures = return_mutation_signatures(tree, gene, host_annotation)
+    previous_signatures = return_mutation_signatures(previous_tree, gene, host_annotation)
+    same_host_counts = calenr.return_all_host_tips(previous_tree, host1, host2, host_annotation) == host_counts
+
+    ## a mutation can only be reused if it was scored in the previous run; df5 only has rows for scored mutations
+    reused = [a for a in aa_muts if a in previous_df5.index and previous_signatures.get(a) == signatures[a]]
+    reused_set = set(reused)
+    changed = [a for a in aa_muts if a not in reused_set]
+
+    if cores == 1:
+        partial = calenr.calculate_enrichment_scores(tree, changed, nt_muts, host1, host2, host_annotation, min_required_count, host_counts, gene)
+    else:
+        partial = calenr.calculate_enrichment_scores_parallel(tree, changed, nt_muts, host1, host2, host_annotation, min_required_count, host_counts, gene, cores)
+    changed_scores, _, _, changed_host_counts = partial
+
+    times_detected_dict, branch_lengths_dict = return_times_and_branch_lengths(tree, gene)
+    scores_dict = {}
+    host_counts_dict2 = {}
+    for a in aa_muts:
+        if a in reused_set:
+            row = previous_df5.loc[a]
+            host_counts_dict = {host1: int(row[host1]), host2: int(row[host2]), "other": int(row["other"])}
+            if sum(host_counts_dict.values()) >= min_required_count:
+                if same_host_counts:
+                    scores_dict[a] = {"enrichment_score": row["enrichment_score"], "pvalue": row["pvalue"]}
+                else:
+                    enrichment_score, p_value = calenr.calculate_enrichment_score_counts(host_counts_dict, host1, host2, host_counts)
+                    scores_dict[a] = {"enrichment_score": enrichment_score, "pvalue": p_value}
+        else:
+            host_counts_dict = changed_host_counts[a]
+            if a in changed_scores:
+                scores_dict[a] = changed_scores[a]
+        host_counts_dict2[a] = host_counts_dict
+
+    ## keep the order of times_detected_dict and branch_lengths_dict the same as calculate_enrichment_scores
+    times_detected_dict = dict((a, times_detected_dict[a]) for a in aa_muts)
+    branch_lengths_dict = dict((a, branch_lengths_dict[a]) for a in aa_muts)
+    return scores_dict, times_detected_dict, branch_lengths_dict, host_counts_dict2, changed
@@ -0,0 +1,85 @@
+## Pipelined execution of Part 1 and Part 2
+##
+## The simulations in Part 2 only need the total tree branch length, the total host tips on the tree, and the tree
+## stripped of its mutations; none of them depend on the enrichment scores from Part 1. Rather than running Part 1 on a
+## single core and then starting the simulations, both parts are split into chunks and submitted to a single pool of
+## worker processes, alternating between simulation chunks and Part 1 chunks, so that all cores are busy from the
+## start and both parts finish at about the same time. The main process is left free while the workers compute, and is
+## used to write output files: the config and pickled trees as soon as work is submitted, and the Part 1 results as
+## soon as the last Part 1 chunk finishes, while the simulations are still running.
+##
+## The pool is forked after the tree and the pickled no_muts_tree are set as module level variables, so the workers
+## share them instead of having them pickled and sent with every chunk.
+
+import multiprocessing as mp
+from itertools import zip_longest
+
+import calculate_enrichment_scores_across_tree_JSON as calenr
+import simulate_mutation_gain_loss_markov_chain as simmut
+
+_shared_pickled_tree = None
+
+
+
+def simulate_chunk(gene, total_tree_branch_length, host1, host2, host_annotation, min_required_count, host_counts, iterations, seed, first_iteration):
+    """simmut.perform_simulations on the shared pickled tree; run in worker processes"""
+    return simmut.perform_simulations(_shared_pickled_tree, gene, total_tree_branch_length, host1, host2, host_annotation, min_required_count, host_counts, iterations, seed, first_iteration)
+
+
+
+def interleave(first, second):
+    """return a list alternating between items of first and second, continuing with the rest of the longer list"""
+    items = []
+    for a, b in zip_longest(first, second):
+        if a is not None:
+            items.append(a)
+        if b is not None:
+            items.append(b)
+    return items
+
+
+
+def run_pipelined(tree, pickled_tree, gene, host1, host2, host_annotation, min_required_count, total_host_tips_on_tree, total_tree_branch_length,
+                  sim_chunks, cores = None, chunks_per_core = 4, while_running = None, on_part1_done = None):
+    """run Part 1 and Part 2 at the same time in one pool of worker processes.
+
+    sim_chunks is a list of (iterations, seed, first iteration) tuples for simmut.perform_simulations. while_running is
+    called with no arguments once all work has been submitted, and on_part1_done is called with the four Part 1
+    dictionaries as soon as Part 1 has finished; both run in the main process while the workers are still computing.
+    Returns the Part 1 dictionaries (as from calenr.calculate_enrichment_scores) and sim_data (as from pool.starmap over
+    simmut.perform_simulations, one entry per chunk in sim_chunks)"""
+    global _shared_pickled_tree
+
+    cores = cores or mp.cpu_count()
+    aa_muts, nt_muts = calenr.gather_all_mut_on_tree(tree, gene)
+    part1_chunks = calenr.return_part1_chunks(tree, aa_muts, gene, cores * chunks_per_core)
+
+    calenr.set_shared_tree(tree)
+    _shared_pickled_tree = pickled_tree
+    try:
+        with mp.get_context('fork').Pool(cores) as pool:
+            sim_tasks = [('sim', (gene, total_tree_branch_length, host1, host2, host_annotation, min_required_count, total_host_tips_on_tree) + chunk) for chunk in sim_chunks]
+            part1_tasks = [('part1', (chunk, nt_muts, host1, host2, host_annotation, min_required_count, total_host_tips_on_tree, gene)) for chunk in part1_chunks]
+
+            ## submit simulations first, so that workers start simulating while Part 1 is still being queued
+            sim_results = []
+            part1_results = []
+            for kind, args in interleave(sim_tasks, part1_tasks):
+                if kind == 'sim':
+                    sim_results.append(pool.apply_async(simulate_chunk, args))
+                else:
+                    part1_results.append(pool.apply_async(calenr.score_chunk, args))
+
+            if while_running is not None:
+                while_running()
+
+            part1 = calenr.merge_partial_scores([result.get() for result in part1_results], aa_muts)
+            if on_part1_done is not None:
+                on_part1_done(*part1)
+
+            sim_data = [result.get() for result in sim_results]
+    finally:
+        calenr.set_shared_tree(None)
+        _shared_pickled_tree = None
+
+    return part1, sim_data
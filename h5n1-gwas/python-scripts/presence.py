@@ -0,0 +1,137 @@
+## Tip by mutation presence data
+##
+## In Part 1, a mutation that arises on a branch is counted in every tip below that branch, unless the back mutation (or
+## the same mutation again) arises on the path from that branch down to the tip. return_host_distribution_mutation finds
+## these tips by walking from the branch to each tip, which is the slowest step of Part 1. Here they are found from leaf
+## ranges instead: with leaves in the order of tree.Objects (preorder), the tips below a branch are a contiguous range of
+## leaves, so the tips a mutation is counted in are the range below the branch it arises on, minus the ranges below the
+## branches further down that carry the back mutation or the same mutation again. The tips of different branches that a
+## mutation arises on never overlap, so each tip either has or does not have a mutation, and the counts of Part 1 are
+## the number of tips of each host in a (leaves x mutations) presence matrix.
+
+import numpy as np
+
+import calculate_enrichment_scores_across_tree_JSON as calenr
+
+
+
+def return_leaf_ranges(tree):
+    """return the leaves of the tree in the order of tree.Objects, the preorder index of each branch, and the range
+    [start, end) of leaves below each branch, keyed by id(branch)"""
+    leaves = [k for k in tree.Objects if k.branchType == "leaf"]
+    index = dict((id(k), i) for i, k in enumerate(tree.Objects))
+    leaf_range = {}
+    n_leaves = len(leaves)
+    for k in reversed(tree.Objects):
+        if k.branchType == "leaf":
+            n_leaves -= 1
+            leaf_range[id(k)] = (n_leaves, n_leaves + 1)
+        else:
+            child_ranges = [leaf_range[id(child)] for child in k.children]
+            leaf_range[id(k)] = (min(r[0] for r in child_ranges), max(r[1] for r in child_ranges))
+    return leaves, index, leaf_range
+
+
+
+def return_carrier_ranges(tree, gene, mutations = None):
+    """return the leaves of the tree and {mutation: [(start, end), ...]}, the ranges of leaves counted as having each
+    mutation in Part 1. If mutations is None, every mutation on the tree is included"""
+    leaves, index, leaf_range = return_leaf_ranges(tree)
+    mutation_branches = {}
+    for k in tree.Objects:
+        for mut in set(calenr.return_muts_on_branch(k, gene)):
+            mutation_branches.setdefault(mut, []).append(k)
+    if mutations is None:
+        mutations = list(mutation_branches)
+
+    carrier_ranges = {}
+    for mut in mutations:
+        branches = mutation_branches.get(mut, [])
+        excluding = branches + mutation_branches.get(calenr.return_opposite_mutation(mut), [])
+        ranges = []
+        for k in branches:
+            start, end = leaf_range[id(k)]
+            ## branches below k are the ones whose leaf range is within k's, and that come after k in preorder
+            below = sorted(leaf_range[id(j)] for j in excluding if index[id(j)] > index[id(k)] and start <= leaf_range[id(j)][0] and leaf_range[id(j)][1] <= end)
+            for below_start, below_end in below:
+                if below_start > start:
+                    ranges.append((start, below_start))
+                start = max(start, below_end)
+            if start < end:
+                ranges.append((start, end))
+        carrier_ranges[mut] = ranges
+    return leaves, carrier_ranges
+
+
+
+def return_presence_matrix(tree, gene, mutations = None):
+    """return (presence, leaves, mutations), where presence is a sparse (leaves x mutations) csr matrix with a 1 where a
+    leaf is counted as having a mutation in Part 1"""
+    from scipy.sparse import csr_matrix
+    leaves, carrier_ranges = return_carrier_ranges(tree, gene, mutations)
+    mutations = list(carrier_ranges)
+    rows = []
+    columns = []
+    for column, mut in enumerate(mutations):
+        for start, end in carrier_ranges[mut]:
+            rows.append(np.arange(start, end))
+            columns.append(np.full(end - start, column))
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    columns = np.concatenate(columns) if columns else np.zeros(0, dtype=np.int64)
+    presence = csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, columns)), shape=(len(leaves), len(mutations)))
+    return presence, leaves, mutations
+
+
+
+def return_leaf_host_index(leaves, host1, host2, host_annotation):
+    """return an array with 0 for host1 leaves, 1 for host2 leaves and 2 for all other leaves, the order of the host
+    count dictionaries in Part 1"""
+    hosts = [k.traits['node_attrs'][host_annotation]['value'] for k in leaves]
+    return np.array([0 if host == host1 else 1 if host == host2 else 2 for host in hosts], dtype=np.int64)
+
+
+
+def return_mutation_host_counts(presence_matrix, leaf_hosts):
+    """return a (mutations x 3) array with the number of host1, host2 and other leaves with each mutation, for leaf_hosts
+    from return_leaf_host_index"""
+    return np.stack([np.asarray(presence_matrix[leaf_hosts == host].sum(axis=0)).ravel() for host in range(3)], axis=1)
+
+
+
+def return_weighted_host_counts(presence_matrix, leaf_hosts, weights, hosts = (0, 1, 2)):
+    """return (counts, totals) for a sparse (rows x leaves) matrix of leaf weights (e.g. resamples or subsamples of
+    leaves): a (hosts x rows x mutations) array with the weighted number of leaves of each host in hosts with each
+    mutation, and a (hosts x rows) array with the total weight of the leaves of each host"""
+    from scipy.sparse import vstack
+    rows = weights.shape[0]
+    host_weights = [weights.multiply((leaf_hosts == host)[None, :]).tocsr() for host in hosts]
+    totals = np.stack([np.asarray(w.sum(axis=1)).ravel() for w in host_weights])
+
+    ## one product for the counts of every host in every row
+    counts = (vstack(host_weights).tocsr() @ presence_matrix.astype(np.int64)).toarray()
+    return counts.reshape(len(hosts), rows, presence_matrix.shape[1]), totals
+
+
+
+def return_count_tables(presence_host1, presence_host2, total_host1, total_host2):
+    """return the cells (presence_host1, absence_host1, presence_host2, absence_host2) of the 2x2 tables of arrays of
+    host1 and host2 counts with a mutation and host1 and host2 totals, as calculate_enrichment_score_counts tests them"""
+    absence_host1 = total_host1 - presence_host1
+    absence_host2 = total_host2 - presence_host2
+
+    ## add a pseudocount for denominator values that are equal to 0, as in calculate_enrichment_score_counts
+    presence_host2 = np.where(presence_host2 == 0, 1, presence_host2)
+    absence_host1 = np.where(absence_host1 == 0, 1, absence_host1)
+    return presence_host1, absence_host1, presence_host2, absence_host2
+
+
+
+def score_counts(mutation_counts, host_totals):
+    """enrichment scores and pvalues for arrays of host1 and host2 counts with a mutation and host1 and host2 totals, as
+    calculate_enrichment_score_counts would for each. Each distinct table is only tested once"""
+    from scipy.stats import fisher_exact
+    presence_host1, absence_host1, presence_host2, absence_host2 = return_count_tables(mutation_counts[:, 0], mutation_counts[:, 1],
+                                                                                       host_totals[:, 0], host_totals[:, 1])
+    tables, inverse = np.unique(np.stack([presence_host1, absence_host1, presence_host2, absence_host2], axis=1), axis=0, return_inverse=True)
+    results = np.array([fisher_exact([[a, b], [c, d]], alternative='two-sided') for a, b, c, d in tables]).reshape(-1, 2)
+    return results[inverse.ravel(), 0], results[inverse.ravel(), 1]
@@ -25,6 +25,7 @@
 ## Import modules we will need
 import pandas as pd 
 import time
+import os
 import multiprocessing as mp
 from functools import partial
 
@@ -39,6 +40,16 @@ import simulate_mutation_gain_loss_markov_chain as simmut
 import tree_manager as tm
 import config as cfg
 import write_files
+import run_store
+import pipeline
+import incremental
+import time_windows
+import bootstrap
+import clade_strata
+import cooccurrence
+import events
+import subsample
+from simulation_dfs import sim_data_to_dfs
 
 
 ## One thing I really like doing is appending the current date to all my code and output files. This helps me 
@@ -57,28 +68,20 @@ def get_iteration_list(iterations, cores):
 
 
 
-if __name__ == "__main__":
-    ## Part 1: Infer mutations on tree, and calculate enrichment scores and p-values
-    ## 
-    ## In this first part of the notebook, we will be reading in a tree, enumerating every mutation on the tree and returning each mutation with an enrichment score (odds ratio) and p-value as assessed by a Fisher's exact test. There are a few required inputs here, which the user should specify which stem from me writing this to be flexible. 
-    ## 
-    ## 1. **minimum required count:** For every amino acid on the tree, the enrichment score will not be returned if it is present in less than `minimum required count` tips. I played around with this a little bit, and ended up setting it to 0. The reason is that regardless of counts, I wanted to calculate the score for every mutation, and then post-filter afterwards. 
-    ## 
-    ## 2. **method:** there are 2 possible methods: `proportions` and `counts`. In `counts`, we calculate an odds ratio as: `(A*D)/(B*C)`, where `A`,`B`,`C`, and `D` are counts of tips. In `proportions`, we calculate `(A+D)-(B+C)` where the cells are the proportion of total tips in each category. The `counts` method output is the exact odds ratio calculated with a Fisher's exact test, and is more appropriate. 
-    ## 
-    ## There are a few outputs: the `times_detected_dict` outputs the number of times that the mutation arose on the tree. The counts in `scores_dict` represent the number of tips with each mutation. 
-    ## 
-    ## To run this on amino acids, put in the gene name under `gene`. To run on nucleotide mutations, replace gene with `nuc`. 
+def get_iteration_chunks(iterations, cores, first_iteration = 0):
+    """Function to split iterations first_iteration, ..., first_iteration + iterations - 1 evenly among cores, as a 
+    list of (number of iterations, seed, first iteration) tuples for pool.starmap"""
+    chunks = []
+    start = first_iteration
+    for n in get_iteration_list(iterations, cores):
+        chunks.append((n, cfg.seed, start))
+        start += n
+    return chunks
 
 
-    ## Load tree, no_muts_tree, and pickled_tree
-    if cfg.reload_trees == True:
-        print("Reloading trees...")
-        json_tree, tree, no_muts_tree, pickled_tree = tm.init_pickled_trees(cfg.output_folder_path)
-        print("Finished loading trees")
-    else:
-        json_tree, tree, no_muts_tree, pickled_tree = tm.init_trees()
-    
+
+def run_part1(tree):
+    """Part 1: enumerate all mutations on the tree and calculate enrichment scores, returning them as df5"""
 
     ## Gather all mutations. The outputs, aa_muts and nt_muts, are lists of amino acid mutations
     ## and nucleotide mutations on the tree. Every mutation on the tree is included.
@@ -88,16 +91,38 @@ if __name__ == "__main__":
     ## of the number of tips corresponding to each host on the tree
     total_host_tips_on_tree = calenr.return_all_host_tips(tree, cfg.host1, cfg.host2, cfg.host_annotation)
 
-    ## Calculate the total branch length of the tree, in terms of mutations
-    total_tree_branch_length, tree_branch_lengths = calenr.return_total_tree_branch_length(tree)
-
     ## Calculate enrichment scores for all mutations along the tree. must set method to be counts or proportions; 
-    ## the host_counts variable in calculate_enrichmenet_scores is total_host_tips_on_tree
-    scores_dict, times_detected_dict, branch_lengths_dict, host_counts_dict2 = calenr.calculate_enrichment_scores(tree, aa_muts, nt_muts, cfg.host1, cfg.host2, cfg.host_annotation, cfg.minimum_required_count, total_host_tips_on_tree, cfg.gene)
+    ## the host_counts variable in calculate_enrichmenet_scores is total_host_tips_on_tree. If part1_cores is not 1,
+    ## mutations are split among multiple cores. If previous_run_path is set, only mutations whose descendant tips
+    ## changed since the previous run are rescored
+    if cfg.previous_run_path is not None:
+        previous_tree, previous_df5 = incremental.load_previous_run(cfg.previous_run_path, cfg.gene, cfg.host1, cfg.host2, cfg.host_annotation)
+        scores_dict, times_detected_dict, branch_lengths_dict, host_counts_dict2, changed = incremental.calculate_enrichment_scores_incremental(tree, previous_tree, previous_df5, cfg.host1, cfg.host2, cfg.host_annotation, cfg.minimum_required_count, total_host_tips_on_tree, cfg.gene, cfg.part1_cores)
+        print("Rescored", len(changed), "of", len(aa_muts), "mutations; reused the rest from", cfg.previous_run_path)
+    elif cfg.part1_cores == 1:
+        scores_dict, times_detected_dict, branch_lengths_dict, host_counts_dict2 = calenr.calculate_enrichment_scores(tree, aa_muts, nt_muts, cfg.host1, cfg.host2, cfg.host_annotation, cfg.minimum_required_count, total_host_tips_on_tree, cfg.gene)
+    else:
+        scores_dict, times_detected_dict, branch_lengths_dict, host_counts_dict2 = calenr.calculate_enrichment_scores_parallel(tree, aa_muts, nt_muts, cfg.host1, cfg.host2, cfg.host_annotation, cfg.minimum_required_count, total_host_tips_on_tree, cfg.gene, cfg.part1_cores)
+
+    return add_bootstrap_cis(part1_to_df(scores_dict, times_detected_dict, branch_lengths_dict, host_counts_dict2), tree)
+
+
+
+def add_bootstrap_cis(df5, tree):
+    """If bootstrap_replicates is set, add the bootstrap confidence interval of the enrichment score of every mutation in
+    df5, from one product of the resampling weights and the presence matrix"""
+    if cfg.bootstrap_replicates is None:
+        return df5
+    clusters = clade_strata.read_clade_table(cfg.bootstrap_cluster_path) if cfg.bootstrap_cluster_path is not None else None
+    cis = bootstrap.run_bootstrap(tree, cfg.gene, cfg.host1, cfg.host2, cfg.host_annotation, df5.index, cfg.bootstrap_replicates, cfg.bootstrap_alpha,
+                                  clusters, cfg.bootstrap_cluster_annotation, cfg.seed)
+    return df5.join(cis)
+
 
 
+def part1_to_df(scores_dict, times_detected_dict, branch_lengths_dict, host_counts_dict2):
+    """Convert tree data to dataframes, returning the merged df5"""
 
-    ## Convert tree data to dataframes
     ## Create dataframes from each dictionary
     df1 = pd.DataFrame.from_dict(scores_dict, orient="index")
     df2 = pd.DataFrame.from_dict(times_detected_dict, orient="index", columns=["total_times_detected_on_tree"])
@@ -106,35 +131,26 @@ if __name__ == "__main__":
 
     ## Merge dataframes together; pandas join is a merge on the index
     df5 = df1.join(df2.join(df3.join(df4)))
+    return df5
 
 
 
+def run_part2(pickled_tree, total_tree_branch_length, total_host_tips_on_tree, iterations, first_iteration = 0, cores = None):
+    """Part 2: simulate mutation gain and loss across the tree, returning sim_data as described below"""
 
+    ## Get number of cores (all cores unless given) and split iterations evenly among them
+    cores = cores or mp.cpu_count()
+    chunks = get_iteration_chunks(iterations, cores, first_iteration)
 
-    ## Part 2: simulate mutation gain and loss across the tree to generate a null 
-    ## 
-    ## The output for `sims_times_detected` will be the number of times in each iteration that the simulated mutation arose. This includes occurrences on internal nodes and on terminal nodes. 
-    ## 
-    ## Scores of 0 occur when the mutation was never detected/present in host 1. 
-    ## 
-    ## For this analysis, you will need to specify a few things: 
-    ## 1. **iterations:** iterations specifies how many times to simulate mutation gain or loss across the tree.
-
-
-    ## Get number of cores and create a list to split iterations evenly among them
-    cores = mp.cpu_count()
-    iter_list = get_iteration_list(cfg.iterations, cores)
-
-    ## Create partial function for simmut.perform_simulations with all arguments excluding iterations
+    ## Create partial function for simmut.perform_simulations with all arguments excluding iterations, seed and first iteration
     sim_part = partial(simmut.perform_simulations, pickled_tree, cfg.gene, total_tree_branch_length, cfg.host1, cfg.host2, cfg.host_annotation, cfg.minimum_required_count, total_host_tips_on_tree)
 
     ## Start timer
     start_time = time.time()
 
     ## Start multiprocessing pool, run simulations, then close the pool once all cores have finished
-    mp.set_start_method('fork')
-    pool = mp.Pool()
-    sim_data = pool.map(sim_part, iter_list) # Run simmut.perform_simulations using arguments specified in sim_part, with iterations split among cores as specified in iter_list
+    pool = mp.get_context('fork').Pool(cores)
+    sim_data = pool.starmap(sim_part, chunks) # Run simmut.perform_simulations using arguments specified in sim_part, with iterations split among cores as specified in chunks
     pool.close()
     pool.join()
 
@@ -142,65 +158,262 @@ if __name__ == "__main__":
     total_time_seconds = time.time() - start_time
     total_time_minutes = total_time_seconds/60
     total_time_hours = total_time_minutes/60
-    print("This took", total_time_seconds, "seconds (", total_time_minutes," minutes,", total_time_hours," hours) to generate", cfg.iterations, "simulated trees")
-
-
-
-    ## Convert simulation data to dataframes
-    ## sim_data[core][field][iteration]
-        ## core = [0, ..., mp.cpu_count() - 1]
-        ## field = [0, 1, 2, 3]; 0 = sim_scores, 1 = sim_times_detected, 2 = branches_that_mutated, 3 = all_branches_dict
-        ## iteration = iter_list[core]
-    ## These dictionaries are nested, and each core uses same indexing, so need to manually create idx
-
-    ## Create dataframe with sim_scores
-    df6list = []
-    idx = 0
-    for core in range(len(sim_data)):
-        for iteration in sim_data[core][0]:
-            x = pd.DataFrame.from_dict(sim_data[core][0][iteration], orient="index")
-            x['simulation_iteration'] = idx
-            idx += 1
-            x.reset_index(inplace=True)
-            df6list.append(x)
-    df6 = pd.concat(df6list)
-
-    ## Create dataframe with sim_times_detected
-    df7list = []
-    idx = 0
-    for core in range(len(sim_data)):
-        for iteration in sim_data[core][1]:
-            y = pd.DataFrame.from_dict(sim_data[core][1][iteration], orient="index", columns=["times_detected_on_tree"])
-            y["simulation_iteration"] = idx
-            idx += 1
-            y.reset_index(inplace=True)
-            df7list.append(y)
-    df7 = pd.concat(df7list)
-
-    ## Merge them together; pandas join is a merge on the index
-    df8 = df6.merge(df7, on=["simulation_iteration","index"])
-
-    ## If in testing mode, create additional dataframes for simulation validation
+    print("This took", total_time_seconds, "seconds (", total_time_minutes," minutes,", total_time_hours," hours) to generate", iterations, "simulated trees")
+    return sim_data
+
+
+
+def run_scan_pipelined():
+    """Run the full scan with Part 1 and Part 2 running at the same time in one pool of worker processes, writing
+    output files while the workers are still computing"""
+
+    json_tree, tree, no_muts_tree, pickled_tree = load_trees()
+    total_host_tips_on_tree = calenr.return_all_host_tips(tree, cfg.host1, cfg.host2, cfg.host_annotation)
+    total_tree_branch_length, tree_branch_lengths = calenr.return_total_tree_branch_length(tree)
+
+    ## Split simulations into a few chunks per core, so that cores that finish their Part 1 chunks early can pick up
+    ## simulations (and vice versa)
+    cores = cfg.pipeline_cores or mp.cpu_count()
+    sim_chunks = get_iteration_chunks(cfg.iterations, cores * 2)
+    folder_name = write_files.make_next_folder()
+    results = {}
+
+    def write_inputs():
+        write_files.write_config(folder_name)
+        write_files.write_baltic_tree(folder_name, tree)
+        write_files.write_json_tree(folder_name, json_tree)
+
+    def write_part1(*part1):
+        results['df5'] = add_bootstrap_cis(part1_to_df(*part1), tree)
+        write_files.write_data_df(folder_name, results['df5'])
+
+    start_time = time.time()
+    part1, sim_data = pipeline.run_pipelined(tree, pickled_tree, cfg.gene, cfg.host1, cfg.host2, cfg.host_annotation, cfg.minimum_required_count,
+                                             total_host_tips_on_tree, total_tree_branch_length, sim_chunks, cores,
+                                             while_running=write_inputs, on_part1_done=write_part1)
+    print("This took", time.time() - start_time, "seconds to score", len(part1[0]), "mutations and generate", cfg.iterations, "simulated trees")
+
+    df8, df9, df10 = sim_data_to_dfs(sim_data)
     if cfg.testing_mode == True:
-        ## Create dataframe with branch lengths and the number of times mutated in all simulations (excludes non-mutated branches)
-        sim_branch_length_dict = {}
-        sim_branch_mut_times_dict = {}
-        for core in range(len(sim_data)):
-            for x in sim_data[core][2]:
-                sim_branch_length_dict[x] = sim_data[core][2][x]['branch_length']
-                sim_branch_mut_times_dict[x] = sim_branch_mut_times_dict.get(x, 0) + sim_data[core][2][x]['times_mutated']
-        df9 = pd.DataFrame({'Length':pd.Series(sim_branch_length_dict),'Times':pd.Series(sim_branch_mut_times_dict)})
-
-        ## Create dataframe with all branches, lengths and the number of times mutated in all simulations
-        sim_branch_name_dict = {}
-        sim_branch_length_dict = {}
-        sim_branch_mut_times_dict = {}
-        for core in range(len(sim_data)):
-            for x in sim_data[core][3]:
-                sim_branch_name_dict[x] = x
-                sim_branch_length_dict[x] = sim_data[core][3][x]['branch_length']
-                sim_branch_mut_times_dict[x] = sim_branch_mut_times_dict.get(x, 0) + sim_data[core][3][x]['times_mutated']
-        df10 = pd.DataFrame({'Name':pd.Series(sim_branch_name_dict),'Length':pd.Series(sim_branch_length_dict),'Times':pd.Series(sim_branch_mut_times_dict)})
+        write_files.write_simulated_dfs(folder_name, df8, df9, df10)
+    else:
+        write_files.write_simulated_dfs(folder_name, df8)
+    return results['df5'], df8
+
+
+
+def load_trees():
+    """Load tree, no_muts_tree, and pickled_tree"""
+    if cfg.reload_trees == True:
+        print("Reloading trees...")
+        json_tree, tree, no_muts_tree, pickled_tree = tm.init_pickled_trees(cfg.output_folder_path)
+        print("Finished loading trees")
+    else:
+        json_tree, tree, no_muts_tree, pickled_tree = tm.init_trees()
+    return json_tree, tree, no_muts_tree, pickled_tree
+
+
+
+def return_tree_digest():
+    """hash of the tree file that load_trees reads: the pickled baltic tree if reload_trees, otherwise the json"""
+    if cfg.reload_trees == True:
+        return run_store.hash_file(cfg.output_folder_path + "/pickled_baltic_tree.obj")
+    return run_store.hash_file(cfg.tree_path)
+
+
+
+def run_with_store():
+    """Run the scan through the run store. Part 1 results and simulations are looked up by a hash of the tree file and
+    config settings; only the stages (or the additional iterations) that are not already stored are computed.
+    Unseeded simulations are never stored or reused, since every unseeded run should draw its own null"""
+    tree_digest = return_tree_digest()
+    bootstrap_settings = None
+    if cfg.bootstrap_replicates is not None:
+        cluster_digest = run_store.hash_file(cfg.bootstrap_cluster_path) if cfg.bootstrap_cluster_path is not None else None
+        bootstrap_settings = (cfg.bootstrap_replicates, cfg.bootstrap_alpha, cluster_digest, cfg.bootstrap_cluster_annotation, cfg.seed)
+    ## simulations do not depend on the bootstrap, so they are keyed on Part 1 without it
+    sims_key = run_store.simulations_key(run_store.part1_key(tree_digest, cfg.gene, cfg.host1, cfg.host2, cfg.host_annotation, cfg.minimum_required_count), cfg.seed)
+    part1_key = run_store.part1_key(tree_digest, cfg.gene, cfg.host1, cfg.host2, cfg.host_annotation, cfg.minimum_required_count, bootstrap_settings)
+    run_key = run_store.run_key(sims_key if bootstrap_settings is None else run_store.hash_key(sims_key, part1_key), cfg.iterations)
+
+    df5 = run_store.load_part1(cfg.run_store_path, part1_key)
+    stored_sims = run_store.load_simulations(cfg.run_store_path, sims_key) if cfg.seed is not None else None
+    stored_iterations = stored_sims[2] if stored_sims is not None else 0
+
+    if df5 is None or stored_iterations < cfg.iterations:
+        json_tree, tree, no_muts_tree, pickled_tree = load_trees()
+
+    if df5 is None:
+        df5 = run_part1(tree)
+        run_store.save_part1(cfg.run_store_path, part1_key, df5)
+    else:
+        print("Reusing stored Part 1 results", part1_key)
+
+    if stored_iterations < cfg.iterations:
+        if stored_iterations > 0:
+            print("Extending", stored_iterations, "stored simulations to", cfg.iterations)
+        total_host_tips_on_tree = calenr.return_all_host_tips(tree, cfg.host1, cfg.host2, cfg.host_annotation)
+        total_tree_branch_length, tree_branch_lengths = calenr.return_total_tree_branch_length(tree)
+        extra = cfg.iterations - stored_iterations
+        sim_data = run_part2(pickled_tree, total_tree_branch_length, total_host_tips_on_tree, extra, stored_iterations)
+        df8, df9, df10 = sim_data_to_dfs(sim_data, stored_iterations)
+        if cfg.seed is not None:
+            df8, branches_df = run_store.append_simulations(cfg.run_store_path, sims_key, df8, df10, extra)
+        else:
+            branches_df = df10.set_index("Name")[["Length", "Times"]]
+    else:
+        print("Reusing", cfg.iterations, "of", stored_iterations, "stored simulations", sims_key)
+        df8, branches_df, _ = stored_sims
+
+    ## Take the first cfg.iterations simulations. Branch tallies are only kept for the full set of stored simulations, so
+    ## they are not written when fewer iterations are used
+    df8 = df8[df8["simulation_iteration"] < cfg.iterations]
+    branch_tallies_match = stored_iterations <= cfg.iterations
+
+    ## Write output files to the run folder, unless this exact run has been written before. Unseeded runs are not
+    ## repeatable, so each is written to a new numbered folder
+    if cfg.seed is None:
+        folder_name = write_files.make_next_folder()
+    else:
+        folder_name = run_store.run_folder(cfg.run_store_path, run_key)
+        if os.path.exists(folder_name + "/config.txt"):
+            print("Results for this run are stored in", folder_name)
+            return df5, df8
+        os.makedirs(folder_name + "/data", exist_ok=True)
+    write_files.write_config(folder_name)
+    if cfg.testing_mode == True and branch_tallies_match:
+        df9, df10 = run_store.branch_dfs(branches_df)
+        write_files.write_dfs(folder_name, df5, df8, df9, df10)
+    else:
+        if cfg.testing_mode == True:
+            print("Not writing branch tallies: they cover all", stored_iterations, "stored simulations, not the", cfg.iterations, "used here")
+        write_files.write_dfs(folder_name, df5, df8)
+    print("Results for this run are stored in", folder_name)
+    return df5, df8
+
+
+
+def run_time_windowed_scan():
+    """Score every mutation within rolling windows of sampling dates and write the mutation x window table to a new
+    output folder. Only Part 1 is run"""
+    json_tree, tree, no_muts_tree, pickled_tree = load_trees()
+    start_time = time.time()
+    windows_df = time_windows.run_time_windows(tree, cfg.gene, cfg.host1, cfg.host2, cfg.host_annotation, cfg.minimum_required_count, cfg.window_width, cfg.window_step)
+    print("This took", time.time() - start_time, "seconds to score", windows_df['mutation'].nunique(), "mutations in", windows_df['window_start'].nunique(), "windows")
+
+    folder_name = write_files.make_next_folder()
+    write_files.write_config(folder_name)
+    write_files.write_windows_df(folder_name, windows_df)
+    return windows_df
+
+
+
+def run_clade_stratified_scan():
+    """Score every mutation within each clade and pooled over clades with a CMH test, and write both tables to a new
+    output folder. Only Part 1 is run"""
+    json_tree, tree, no_muts_tree, pickled_tree = load_trees()
+    clades = clade_strata.read_clade_table(cfg.clade_path) if cfg.clade_path is not None else None
+    start_time = time.time()
+    clades_df, pooled_df = clade_strata.run_clade_stratified(tree, cfg.gene, cfg.host1, cfg.host2, cfg.host_annotation, cfg.minimum_required_count, clades, cfg.clade_annotation)
+    print("This took", time.time() - start_time, "seconds to score", len(pooled_df), "mutations in", clades_df['clade'].nunique(), "clades")
+
+    folder_name = write_files.make_next_folder()
+    write_files.write_config(folder_name)
+    write_files.write_clade_dfs(folder_name, clades_df, pooled_df)
+    return clades_df, pooled_df
+
+
+
+def run_event_index_scan():
+    """Index the independent origins of every mutation with their parent and child hosts, and write the event,
+    transition and per-mutation origin tables to a new output folder"""
+    json_tree, tree, no_muts_tree, pickled_tree = load_trees()
+    start_time = time.time()
+    events_df, transitions_df, summary_df = events.run_event_index(tree, cfg.gene, cfg.host1, cfg.host2, cfg.host_annotation)
+    print("This took", time.time() - start_time, "seconds to index", len(events_df), "origins of", len(summary_df), "mutations")
+
+    folder_name = write_files.make_next_folder()
+    write_files.write_config(folder_name)
+    write_files.write_event_dfs(folder_name, events_df, transitions_df, summary_df)
+    return events_df, transitions_df, summary_df
+
+
+
+def run_cooccurrence_scan():
+    """Score every pair of mutations present together in at least pair_min_support tips, and write the pair table to a
+    new output folder. Only Part 1 is run"""
+    json_tree, tree, no_muts_tree, pickled_tree = load_trees()
+    start_time = time.time()
+    pairs_df = cooccurrence.run_cooccurrence(tree, cfg.gene, cfg.host1, cfg.host2, cfg.host_annotation, cfg.pair_min_support, cfg.pair_block_size, cfg.part1_cores)
+    print("This took", time.time() - start_time, "seconds to score", len(pairs_df), "pairs of mutations")
+
+    folder_name = write_files.make_next_folder()
+    write_files.write_config(folder_name)
+    write_files.write_pairs_df(folder_name, pairs_df)
+    return pairs_df
+
+
+
+def run_sampling_sensitivity_scan():
+    """Score every mutation in repeated subsamples of tips, and write the fraction of subsamples in which each is
+    significant to a new output folder. Only Part 1 is run"""
+    json_tree, tree, no_muts_tree, pickled_tree = load_trees()
+    start_time = time.time()
+    stability_df = subsample.run_sampling_sensitivity(tree, cfg.gene, cfg.host1, cfg.host2, cfg.host_annotation, cfg.minimum_required_count, cfg.subsample_group_by,
+                                                      cfg.subsample_sequences_per_group, cfg.subsamples, cfg.subsample_alpha, cfg.seed)
+    print("This took", time.time() - start_time, "seconds to score", len(stability_df), "mutations in", cfg.subsamples, "subsamples")
+
+    folder_name = write_files.make_next_folder()
+    write_files.write_config(folder_name)
+    write_files.write_stability_df(folder_name, stability_df)
+    return stability_df
+
+
+
+def run_scan():
+    """Run the full scan (Part 1 and Part 2) and write results to a new output folder"""
+
+    ## Part 1: Infer mutations on tree, and calculate enrichment scores and p-values
+    ## 
+    ## In this first part of the notebook, we will be reading in a tree, enumerating every mutation on the tree and returning each mutation with an enrichment score (odds ratio) and p-value as assessed by a Fisher's exact test. There are a few required inputs here, which the user should specify which stem from me writing this to be flexible. 
+    ## 
+    ## 1. **minimum required count:** For every amino acid on the tree, the enrichment score will not be returned if it is present in less than `minimum required count` tips. I played around with this a little bit, and ended up setting it to 0. The reason is that regardless of counts, I wanted to calculate the score for every mutation, and then post-filter afterwards. 
+    ## 
+    ## 2. **method:** there are 2 possible methods: `proportions` and `counts`. In `counts`, we calculate an odds ratio as: `(A*D)/(B*C)`, where `A`,`B`,`C`, and `D` are counts of tips. In `proportions`, we calculate `(A+D)-(B+C)` where the cells are the proportion of total tips in each category. The `counts` method output is the exact odds ratio calculated with a Fisher's exact test, and is more appropriate. 
+    ## 
+    ## There are a few outputs: the `times_detected_dict` outputs the number of times that the mutation arose on the tree. The counts in `scores_dict` represent the number of tips with each mutation. 
+    ## 
+    ## To run this on amino acids, put in the gene name under `gene`. To run on nucleotide mutations, replace gene with `nuc`. 
+
+    ## Load tree, no_muts_tree, and pickled_tree
+    json_tree, tree, no_muts_tree, pickled_tree = load_trees()
+
+    ## Determine all host tips. The output, total_host_tips_on_tree, is a dictionary with counts
+    ## of the number of tips corresponding to each host on the tree
+    total_host_tips_on_tree = calenr.return_all_host_tips(tree, cfg.host1, cfg.host2, cfg.host_annotation)
+
+    ## Calculate the total branch length of the tree, in terms of mutations
+    total_tree_branch_length, tree_branch_lengths = calenr.return_total_tree_branch_length(tree)
+
+    ## Calculate enrichment scores for all mutations and merge them into df5
+    df5 = run_part1(tree)
+
+
+
+
+
+    ## Part 2: simulate mutation gain and loss across the tree to generate a null 
+    ## 
+    ## The output for `sims_times_detected` will be the number of times in each iteration that the simulated mutation arose. This includes occurrences on internal nodes and on terminal nodes. 
+    ## 
+    ## Scores of 0 occur when the mutation was never detected/present in host 1. 
+    ## 
+    ## For this analysis, you will need to specify a few things: 
+    ## 1. **iterations:** iterations specifies how many times to simulate mutation gain or loss across the tree.
+    sim_data = run_part2(pickled_tree, total_tree_branch_length, total_host_tips_on_tree, cfg.iterations)
+
+    ## Convert simulation data to dataframes. df9 and df10 are only written in testing mode
+    df8, df9, df10 = sim_data_to_dfs(sim_data)
 
 
 
@@ -212,4 +425,58 @@ if __name__ == "__main__":
     if cfg.testing_mode == True:
         write_files.write_dfs(folder_name, df5, df8, df9, df10)
     else:
-        write_files.write_dfs(folder_name, df5, df8)
\ No newline at end of file
+        write_files.write_dfs(folder_name, df5, df8)
+    return df5, df8
+
+
+
+def return_scan_modes():
+    """return the config.py settings that are set of those that replace the full scan with another kind of scan, and of
+    those that only apply to the full scan"""
+    modes = [name for name, is_set in [("window_width", cfg.window_width is not None), ("clade_stratified", cfg.clade_stratified == True),
+                                       ("event_index", cfg.event_index == True), ("pair_min_support", cfg.pair_min_support is not None),
+                                       ("subsamples", cfg.subsamples is not None)] if is_set]
+    full_scan_settings = [name for name, is_set in [("bootstrap_replicates", cfg.bootstrap_replicates is not None), ("use_run_store", cfg.use_run_store == True),
+                                                    ("pipeline", cfg.pipeline == True), ("previous_run_path", cfg.previous_run_path is not None)] if is_set]
+    return modes, full_scan_settings
+
+
+
+def run_configured_scan():
+    """Run the kind of scan selected in config.py. If window_width is set or clade_stratified == True, only the
+    time-windowed or clade-stratified Part 1 is run, and if event_index == True, only the origins of mutations are
+    indexed. If pair_min_support is set, only pairs of mutations are scored, and if subsamples is set, only the sampling
+    sensitivity of every mutation is scored. If the run store is in use, stored results are reused and only missing
+    stages are computed. Otherwise, Part 1 and Part 2 are run either one after the other or, if pipeline == True, at
+    the same time. Settings that would be ignored by the selected scan are an error"""
+    modes, full_scan_settings = return_scan_modes()
+    if len(modes) > 1:
+        raise ValueError(F"only one of {', '.join(modes)} can be set")
+    if modes and full_scan_settings:
+        raise ValueError(F"{', '.join(full_scan_settings)} only apply to the full scan, not to {modes[0]}")
+    if cfg.use_run_store == True and cfg.pipeline == True:
+        raise ValueError("pipeline cannot be used with the run store")
+    if cfg.pipeline == True and cfg.previous_run_path is not None:
+        raise ValueError("pipeline cannot be used with previous_run_path")
+
+    if cfg.window_width is not None:
+        run_time_windowed_scan()
+    elif cfg.clade_stratified == True:
+        run_clade_stratified_scan()
+    elif cfg.event_index == True:
+        run_event_index_scan()
+    elif cfg.pair_min_support is not None:
+        run_cooccurrence_scan()
+    elif cfg.subsamples is not None:
+        run_sampling_sensitivity_scan()
+    elif cfg.use_run_store == True:
+        run_with_store()
+    elif cfg.pipeline == True:
+        run_scan_pipelined()
+    else:
+        run_scan()
+
+
+
+if __name__ == "__main__":
+    run_configured_scan()
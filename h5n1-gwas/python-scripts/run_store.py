@@ -0,0 +1,145 @@
+## Content-addressed store for scan results
+##
+## Results are stored by stage, under keys that are hashes of everything the stage depends on:
+##
+## 1. **part1/<key>.npz:** df5, keyed by the tree file contents, gene, hosts, host annotation and minimum required count
+## 2. **simulations/<key>.npz:** df8 and the per-branch simulation tallies used for df9 and df10, keyed by the Part 1 key
+##    and the seed. The number of stored iterations is not part of the key, so that raising `iterations` only needs to
+##    simulate the additional iterations, which are appended to the stored ones
+## 3. **runs/<key>/:** config and output files for a single run, keyed by the simulations key and number of iterations
+##
+## Dataframes are stored column by column in compressed numpy archives, which are much smaller and faster to read than
+## pickles or tsv files, and can be read back without unpickling.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+
+def hash_file(path, chunk_size = 1 << 20):
+    """return the sha256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+
+def hash_key(*parts):
+    """return a short key from the hash of a list of json-serializable values"""
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()[:24]
+
+
+
+def part1_key(tree_digest, gene, host1, host2, host_annotation, minimum_required_count, bootstrap = None):
+    ## bootstrap settings are only part of the key when confidence intervals are added, so keys of runs without them
+    ## are unchanged
+    if bootstrap is None:
+        return hash_key('part1', tree_digest, gene, host1, host2, host_annotation, minimum_required_count)
+    return hash_key('part1', tree_digest, gene, host1, host2, host_annotation, minimum_required_count, *bootstrap)
+
+
+
+def simulations_key(part1_key, seed):
+    return hash_key('simulations', part1_key, seed)
+
+
+
+def run_key(simulations_key, iterations):
+    return hash_key('run', simulations_key, iterations)
+
+
+
+def run_folder(store_path, key):
+    return os.path.join(store_path, "runs", key)
+
+
+
+def save_frame(path, df, **metadata):
+    """write a dataframe, including its index, to a compressed numpy archive with one array per column. Any additional
+    keyword arguments are stored alongside as json"""
+    index = df.index.to_numpy()
+    if index.dtype == object:
+        index = index.astype(str)
+    arrays = {"__index__": index, "__index_name__": np.asarray(df.index.name or ""), "__columns__": np.asarray([str(c) for c in df.columns]),
+              "__metadata__": np.asarray(json.dumps(metadata))}
+    for i, column in enumerate(df.columns):
+        values = df[column].to_numpy()
+        if values.dtype == object:
+            values = values.astype(str)
+        arrays[F"column_{i}"] = values
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    ## write to a temporary file first, so that an interrupted run never leaves a partial stage in the store
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+
+def load_frame(path):
+    """read a dataframe written by save_frame, returning (df, metadata), or (None, None) if it does not exist"""
+    if not os.path.exists(path):
+        return None, None
+    with np.load(path, allow_pickle=False) as arrays:
+        columns = arrays["__columns__"].tolist()
+        index = pd.Index(arrays["__index__"], name=str(arrays["__index_name__"]) or None)
+        df = pd.DataFrame({column: arrays[F"column_{i}"] for i, column in enumerate(columns)}, index=index)
+        metadata = json.loads(str(arrays["__metadata__"]))
+    return df, metadata
+
+
+
+def load_part1(store_path, key):
+    """return the stored df5 for this key, or None"""
+    df5, _ = load_frame(os.path.join(store_path, "part1", key + ".npz"))
+    return df5
+
+
+
+def save_part1(store_path, key, df5):
+    save_frame(os.path.join(store_path, "part1", key + ".npz"), df5)
+
+
+
+def load_simulations(store_path, key):
+    """return (df8, branches_df, number of stored iterations) for this key, or None if nothing is stored"""
+    df8, metadata = load_frame(os.path.join(store_path, "simulations", key + ".npz"))
+    if df8 is None:
+        return None
+    branches_df, _ = load_frame(os.path.join(store_path, "simulations", key + "_branches.npz"))
+    return df8.reset_index(drop=True), branches_df, metadata["iterations"]
+
+
+
+def append_simulations(store_path, key, df8, df10, iterations):
+    """append newly simulated iterations (df8, and df10 with per-branch tallies) to the stored simulations for this key.
+    Branch lengths are the same in every simulation, so tallies are combined by adding the number of times mutated.
+    Returns the combined (df8, branches_df)"""
+    stored = load_simulations(store_path, key)
+    branches_df = df10.set_index("Name")[["Length", "Times"]]
+    branches_df.index.name = "Name"
+    if stored is not None:
+        stored_df8, stored_branches_df, stored_iterations = stored
+        df8 = pd.concat([stored_df8, df8], ignore_index=True)
+        times = stored_branches_df["Times"].add(branches_df["Times"], fill_value=0).astype(int)
+        branches_df = pd.DataFrame({"Length": stored_branches_df["Length"].combine_first(branches_df["Length"]), "Times": times})
+        branches_df.index.name = "Name"
+        iterations += stored_iterations
+    df8 = df8.reset_index(drop=True)
+    save_frame(os.path.join(store_path, "simulations", key + "_branches.npz"), branches_df)
+    save_frame(os.path.join(store_path, "simulations", key + ".npz"), df8, iterations=iterations)
+    return df8, branches_df
+
+
+
+def branch_dfs(branches_df):
+    """rebuild df9 (mutated branches only) and df10 (all branches) from stored branch tallies"""
+    df10 = pd.DataFrame({'Name': branches_df.index, 'Length': branches_df["Length"].values, 'Times': branches_df["Times"].values}, index=branches_df.index.values)
+    df9 = df10.loc[df10['Times'] > 0, ['Length', 'Times']]
+    return df9, df10
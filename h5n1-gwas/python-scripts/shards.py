@@ -0,0 +1,93 @@
+## Running the scan as separate jobs
+##
+## run_scan runs Part 1 and all simulations in one process on one machine. In a workflow (see the gwas rules in
+## base-build/Snakefile), the scan of each segment and host pair is split into a small DAG of jobs instead, so that a
+## cluster, or a local run with many cores, can spread the simulations over all of its slots:
+##
+## 1. **Part 1:** score every mutation on the tree, and write df5
+## 2. **simulation shards:** each of N shard jobs runs its share of the iterations, and writes df8 for those iterations.
+##    Each shard knows the number of the first iteration it runs, so with a seed, every iteration draws the same random
+##    numbers as it would in a single run, and the merged simulations do not depend on the number of shards
+## 3. **reduce:** merge the shards into one df8, find the empirical cutoffs (the most extreme alpha of simulated
+##    pvalues and enrichment scores), and add an empirical pvalue and significance call for each mutation to df5
+
+import numpy as np
+import pandas as pd
+
+import calculate_enrichment_scores_across_tree_JSON as calenr
+import config as cfg
+import run_phylogenetic_scan_clean_commented as run
+import simulation_dfs as simdfs
+
+
+
+def return_shard_iterations(iterations, shard, shards):
+    """return (number of iterations, first iteration) of shard (0, ..., shards - 1) when iterations are split evenly
+    among shards"""
+    iteration_list = run.get_iteration_list(iterations, shards)
+    return iteration_list[shard], sum(iteration_list[:shard])
+
+
+
+def run_part1_job(output_path):
+    """run Part 1 on cfg.tree_path and write df5 to output_path"""
+    json_tree, tree, no_muts_tree, pickled_tree = run.load_trees()
+    df5 = run.run_part1(tree)
+    df5.to_csv(output_path, sep="\t", header=True, index_label="mutation")
+    return df5
+
+
+
+def run_simulation_shard(shard, shards, output_path, cores = None):
+    """run shard (0, ..., shards - 1) of cfg.iterations simulations on cores cores and write its df8 to output_path"""
+    json_tree, tree, no_muts_tree, pickled_tree = run.load_trees()
+    total_host_tips_on_tree = calenr.return_all_host_tips(tree, cfg.host1, cfg.host2, cfg.host_annotation)
+    total_tree_branch_length, tree_branch_lengths = calenr.return_total_tree_branch_length(tree)
+    iterations, first_iteration = return_shard_iterations(cfg.iterations, shard, shards)
+    sim_data = run.run_part2(pickled_tree, total_tree_branch_length, total_host_tips_on_tree, iterations, first_iteration, cores)
+    df8, df9, df10 = simdfs.sim_data_to_dfs(sim_data, first_iteration)
+    df8.to_csv(output_path, sep="\t", header=True, index=False)
+    return df8
+
+
+
+def check_shard_coverage(shard_paths, shard_dfs, iterations):
+    """raise a ValueError unless the shards are the len(shard_dfs) shards of iterations iterations, each once. An
+    iteration in which no mutation reaches the minimum required count has no rows, so shards are matched to the range
+    of iterations they should run rather than to the iterations that appear in them"""
+    shards = len(shard_dfs)
+    ranges = [(first, first + n) for n, first in (return_shard_iterations(iterations, shard, shards) for shard in range(shards))]
+    claimed = set()
+    for path, df in zip(shard_paths, shard_dfs):
+        numbers = df["simulation_iteration"]
+        if len(numbers) == 0:
+            continue
+        shard = [i for i, (first, end) in enumerate(ranges) if first <= numbers.min() and numbers.max() < end]
+        if not shard:
+            raise ValueError(F"{path} has iterations {numbers.min()} to {numbers.max()}, which are not the iterations of one of {shards} shards of {iterations} iterations")
+        if shard[0] in claimed:
+            raise ValueError(F"{path} has the iterations of shard {shard[0]}, which is in more than one file")
+        claimed.add(shard[0])
+
+
+
+def reduce_shards(part1_path, shard_paths, output_path, simulated_path, cutoffs_path, iterations, alpha = 0.05):
+    """merge the simulation shards of iterations iterations, and write df5 with the empirical pvalue of each mutation
+    (the fraction of simulated pvalues at least as small, counting the observed one) and whether it passes both
+    empirical cutoffs"""
+    df5 = pd.read_csv(part1_path, sep="\t", index_col="mutation", keep_default_na=False, na_values=[""])
+    shard_dfs = [pd.read_csv(path, sep="\t", keep_default_na=False, na_values=[""]) for path in shard_paths]
+    check_shard_coverage(shard_paths, shard_dfs, iterations)
+    df8 = pd.concat(shard_dfs, ignore_index=True)
+    df8 = df8.sort_values("simulation_iteration", kind="stable").reset_index(drop=True)
+
+    pvalue_cutoff, enrichment_score_cutoff = simdfs.return_empirical_cutoffs(df8, alpha)
+    simulated_pvalues = np.sort(df8["pvalue"].to_numpy())
+    df5["empirical_pvalue"] = (np.searchsorted(simulated_pvalues, df5["pvalue"].to_numpy(), side="right") + 1) / (len(simulated_pvalues) + 1)
+    df5["significant"] = (df5["pvalue"] <= pvalue_cutoff) & (df5["enrichment_score"] >= enrichment_score_cutoff)
+
+    df5.to_csv(output_path, sep="\t", header=True, index_label="mutation")
+    df8.to_csv(simulated_path, sep="\t", header=True, index=False)
+    pd.DataFrame({"iterations": [iterations], "shards": [len(shard_paths)], "alpha": [alpha], "pvalue_cutoff": [pvalue_cutoff],
+                  "enrichment_score_cutoff": [enrichment_score_cutoff]}).to_csv(cutoffs_path, sep="\t", header=True, index=False)
+    return df5, df8
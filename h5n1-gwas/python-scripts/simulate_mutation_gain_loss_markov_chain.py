@@ -117,13 +117,19 @@ def simulate_gain_loss_as_markov_chain(tree, gene, total_tree_branch_length, bra
 
 
 
-def perform_simulations(pickled_tree, gene, total_tree_branch_length, host1, host2,host_annotation, min_required_count, host_counts, iterations):
+def perform_simulations(pickled_tree, gene, total_tree_branch_length, host1, host2,host_annotation, min_required_count, host_counts, iterations, seed = None, first_iteration = 0):
+    """run the given number of simulations. If a seed is given, the random number generator is re-seeded from the seed 
+    and the overall iteration number (first_iteration + i) before each simulation, so every iteration is reproducible 
+    no matter how the iterations are split among cores or between runs"""
     times_detected_all = {}
     branches_that_mutated = {}
     scores_dict_all = {}
     all_branches = {}
     
     for i in range(iterations):
+        if seed is not None:
+            random.seed(F"{seed}-{first_iteration + i}")
+
         # We need to get a fresh copy of no_muts_tree from pickled_tree.
         # If not, then the new mutations will be appended to the original tree or to previous simulated trees.
         no_muts_tree = tm.get_clean_tree_copy(pickled_tree)
@@ -0,0 +1,75 @@
+## Simulation data as dataframes
+##
+## Part 2 returns the results of its simulations as nested dictionaries, one list of them for each core (or chunk of
+## iterations). The full scan, the simulation shards (shards.py) and the ensemble scan (ensemble.py) all turn them into
+## the same dataframes: df8 with the score of every simulated mutation in every iteration, and df9 and df10 with the
+## branches that mutated in the simulations, for validation. The empirical cutoffs of the scan are taken from df8.
+
+import pandas as pd
+
+
+
+def sim_data_to_dfs(sim_data, first_iteration = 0):
+    """Convert simulation data to dataframes df8, df9 and df10, numbering iterations from first_iteration"""
+
+    ## sim_data[core][field][iteration]
+        ## core = [0, ..., mp.cpu_count() - 1]
+        ## field = [0, 1, 2, 3]; 0 = sim_scores, 1 = sim_times_detected, 2 = branches_that_mutated, 3 = all_branches_dict
+        ## iteration = iter_list[core]
+    ## These dictionaries are nested, and each core uses same indexing, so need to manually create idx
+
+    ## Create dataframe with sim_scores
+    df6list = []
+    idx = first_iteration
+    for core in range(len(sim_data)):
+        for iteration in sim_data[core][0]:
+            x = pd.DataFrame.from_dict(sim_data[core][0][iteration], orient="index")
+            x['simulation_iteration'] = idx
+            idx += 1
+            x.reset_index(inplace=True)
+            df6list.append(x)
+    df6 = pd.concat(df6list)
+
+    ## Create dataframe with sim_times_detected
+    df7list = []
+    idx = first_iteration
+    for core in range(len(sim_data)):
+        for iteration in sim_data[core][1]:
+            y = pd.DataFrame.from_dict(sim_data[core][1][iteration], orient="index", columns=["times_detected_on_tree"])
+            y["simulation_iteration"] = idx
+            idx += 1
+            y.reset_index(inplace=True)
+            df7list.append(y)
+    df7 = pd.concat(df7list)
+
+    ## Merge them together; pandas join is a merge on the index
+    df8 = df6.merge(df7, on=["simulation_iteration","index"])
+
+    ## Create dataframes for simulation validation
+    ## Create dataframe with branch lengths and the number of times mutated in all simulations (excludes non-mutated branches)
+    sim_branch_length_dict = {}
+    sim_branch_mut_times_dict = {}
+    for core in range(len(sim_data)):
+        for x in sim_data[core][2]:
+            sim_branch_length_dict[x] = sim_data[core][2][x]['branch_length']
+            sim_branch_mut_times_dict[x] = sim_branch_mut_times_dict.get(x, 0) + sim_data[core][2][x]['times_mutated']
+    df9 = pd.DataFrame({'Length':pd.Series(sim_branch_length_dict),'Times':pd.Series(sim_branch_mut_times_dict)})
+
+    ## Create dataframe with all branches, lengths and the number of times mutated in all simulations
+    sim_branch_name_dict = {}
+    sim_branch_length_dict = {}
+    sim_branch_mut_times_dict = {}
+    for core in range(len(sim_data)):
+        for x in sim_data[core][3]:
+            sim_branch_name_dict[x] = x
+            sim_branch_length_dict[x] = sim_data[core][3][x]['branch_length']
+            sim_branch_mut_times_dict[x] = sim_branch_mut_times_dict.get(x, 0) + sim_data[core][3][x]['times_mutated']
+    df10 = pd.DataFrame({'Name':pd.Series(sim_branch_name_dict),'Length':pd.Series(sim_branch_length_dict),'Times':pd.Series(sim_branch_mut_times_dict)})
+
+    return df8, df9, df10
+
+
+
+def return_empirical_cutoffs(df8, alpha = 0.05):
+    """return the pvalue below which, and the enrichment score above which, alpha of the simulated scores fall"""
+    return df8['pvalue'].quantile(alpha), df8['enrichment_score'].quantile(1 - alpha)
@@ -0,0 +1,110 @@
+## Sampling sensitivity of enrichment scores
+##
+## The filter rule of base-build/Snakefile keeps at most a few sequences per group (for H5N1, 2 per host, region and
+## month), so the tips on the tree are one of many possible draws. To see whether a mutation is significant because of
+## the draw, the tips of the tree are subsampled again many times with the same grouping, from the leaf attributes on the
+## tree (month and year are taken from the sampling date). Each subsample is a mask of the leaves it keeps, so the tree is
+## not rebuilt: the host totals and the number of host1, host2 and other leaves with each mutation in every subsample
+## are the product of the (subsamples x leaves) masks of each host and the (leaves x mutations) presence matrix of Part 1.
+## Every mutation is scored in every subsample as in calculate_enrichment_score_counts, and its stability is the fraction
+## of subsamples in which it is significant (pvalue <= alpha and enriched in host1).
+
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+import presence
+
+
+
+def return_leaf_groups(leaves, group_by):
+    """return the group of each leaf: a tuple of its values of the attributes in group_by, where 'year' and 'month' are
+    taken from the sampling date (num_date) and any other attribute is a node attribute. Missing values are empty"""
+    groups = []
+    for k in leaves:
+        date = getattr(k, 'absoluteTime', None)
+        group = []
+        for attribute in group_by:
+            if attribute in ('year', 'month'):
+                if date is None:
+                    group.append('')
+                elif attribute == 'year':
+                    group.append(str(int(np.floor(date))))
+                else:
+                    group.append(str(int(np.floor(date))) + '-' + str(min(int((date - np.floor(date)) * 12) + 1, 12)))
+            else:
+                value = k.traits['node_attrs'].get(attribute, '')
+                group.append(str(value.get('value', '') if isinstance(value, dict) else value))
+        groups.append(tuple(group))
+    return groups
+
+
+
+def return_subsample_masks(leaf_groups, sequences_per_group, subsamples, rng):
+    """return a sparse (subsamples x leaves) matrix with a 1 for each leaf kept in each subsample, keeping
+    sequences_per_group leaves (or all leaves, if there are fewer) drawn at random from every group"""
+    group_names, group_index = np.unique(np.array(['\t'.join(group) for group in leaf_groups], dtype=object).astype(str), return_inverse=True)
+    group_index = group_index.ravel()
+    n_leaves = len(group_index)
+
+    ## sorting leaves by group plus a random number in [0, 1) shuffles the leaves within every group; the first
+    ## sequences_per_group leaves of each group in this order are kept
+    order = np.argsort(group_index[None, :] + rng.random((subsamples, n_leaves)), axis=1, kind='stable')
+    sorted_groups = np.sort(group_index)
+    rank = np.arange(n_leaves) - np.searchsorted(sorted_groups, sorted_groups, side='left')
+    kept = rank < sequences_per_group
+    rows = np.repeat(np.arange(subsamples), kept.sum())
+    columns = order[:, kept].ravel()
+    return csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, columns)), shape=(subsamples, n_leaves))
+
+
+
+def return_subsample_counts(presence_matrix, leaf_hosts, masks):
+    """return (mutation counts, host totals): a (subsamples x mutations x 3) array with the number of host1, host2 and
+    other leaves with each mutation in each subsample, and a (subsamples x 3) array with the number of leaves of each
+    host in each subsample"""
+    counts, totals = presence.return_weighted_host_counts(presence_matrix, leaf_hosts, masks)
+    return np.moveaxis(counts, 0, 2), totals.T
+
+
+
+def run_sampling_sensitivity(tree, gene, host1, host2, host_annotation, min_required_count, group_by = ('host', 'region', 'month'),
+                             sequences_per_group = 2, subsamples = 100, alpha = 0.05, seed = None):
+    """return a table with, for every mutation, its enrichment score and pvalue on the whole tree, and the fraction of
+    subsamples (of sequences_per_group tips per group_by group) in which it is present in at least min_required_count
+    tips and in at least one, in which it is significant (stability), and the median of its scores and pvalues"""
+    presence_matrix, leaves, mutations = presence.return_presence_matrix(tree, gene)
+    leaf_hosts = presence.return_leaf_host_index(leaves, host1, host2, host_annotation)
+    rng = np.random.default_rng(seed)
+    masks = return_subsample_masks(return_leaf_groups(leaves, group_by), sequences_per_group, subsamples, rng)
+    mutation_counts, host_totals = return_subsample_counts(presence_matrix, leaf_hosts, masks)
+
+    ## scores of each mutation in each subsample; each distinct table is only tested once
+    n_mutations = len(mutations)
+    flat_counts = mutation_counts.reshape(-1, 3)
+    flat_totals = np.repeat(host_totals, n_mutations, axis=0)
+    enrichment_score, pvalue = presence.score_counts(flat_counts, flat_totals) if len(flat_counts) else (np.zeros(0), np.zeros(0))
+    enrichment_score, pvalue = enrichment_score.reshape(subsamples, n_mutations), pvalue.reshape(subsamples, n_mutations)
+    scored = mutation_counts.sum(axis=2) >= max(min_required_count, 1)
+    significant = scored & (pvalue <= alpha) & (enrichment_score > 1)
+
+    ## scores on the whole tree
+    tree_counts = presence.return_mutation_host_counts(presence_matrix, leaf_hosts)
+    tree_totals = np.tile(np.bincount(leaf_hosts, minlength=3), (n_mutations, 1))
+    tree_score, tree_pvalue = presence.score_counts(tree_counts, tree_totals) if n_mutations else (np.zeros(0), np.zeros(0))
+
+    ## mutations that are not scored in any subsample have no median
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        stability_df = pd.DataFrame({'enrichment_score': tree_score, 'pvalue': tree_pvalue,
+                                     'significant': (tree_pvalue <= alpha) & (tree_score > 1),
+                                     'stability': significant.mean(axis=0),
+                                     'fraction_present': scored.mean(axis=0),
+                                     'median_enrichment_score': np.nanmedian(np.where(scored, enrichment_score, np.nan), axis=0),
+                                     'median_pvalue': np.nanmedian(np.where(scored, pvalue, np.nan), axis=0),
+                                     host1: tree_counts[:, 0], host2: tree_counts[:, 1], 'other': tree_counts[:, 2]},
+                                    index=pd.Index(mutations, name='mutation'))
+    scored_on_tree = tree_counts.sum(axis=1) >= min_required_count
+    return stability_df[scored_on_tree].sort_values('stability', ascending=False, kind='stable')
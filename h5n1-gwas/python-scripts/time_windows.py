@@ -0,0 +1,87 @@
+## Time-windowed enrichment scan
+##
+## Part 1 counts the tips with each mutation over all sampling dates at once. To see when host-enriched mutations
+## appear, the counts are also split into rolling windows of sampling dates (e.g. 5 years, moved forward 1 year at a
+## time). Leaves are sorted by date once, so that the leaves in a window are a contiguous range of rows of the date-sorted
+## presence matrix, and the number of leaves of each host with each mutation before every window boundary is a prefix
+## sum over those rows. The counts in a window are the difference between the prefix sums at its two boundaries, so the
+## tree is only traversed once however many windows there are. Each mutation is then scored in each window against the
+## number of tips of each host sampled in that window, as in calculate_enrichment_score_counts.
+
+import numpy as np
+import pandas as pd
+
+import presence
+
+
+
+def return_leaf_dates(leaves):
+    """return the sampling date of each leaf as a decimal year, or nan for leaves without a date"""
+    dates = []
+    for k in leaves:
+        date = getattr(k, 'absoluteTime', None)
+        dates.append(np.nan if date is None else float(date))
+    return np.array(dates)
+
+
+
+def return_windows(dates, window_width, window_step):
+    """return (start, end) of rolling windows of window_width years every window_step years, from the year of the
+    earliest date until the window that contains the latest date"""
+    first, last = np.nanmin(dates), np.nanmax(dates)
+    starts = np.arange(np.floor(first), last + 1e-9, window_step)
+    return [(start, start + window_width) for start in starts]
+
+
+
+def return_window_counts(presence_matrix, leaf_hosts, dates, windows):
+    """return (mutation counts, host totals): a (windows x mutations x 3) array with the number of host1, host2 and other
+    leaves sampled in each window that have each mutation, and a (windows x 3) array with the number of leaves of each
+    host sampled in each window. Leaves without a date are not counted"""
+    dated = np.nonzero(~np.isnan(dates))[0]
+    order = dated[np.argsort(dates[dated], kind='stable')]
+    sorted_dates = dates[order]
+    rank = np.full(len(dates), -1, dtype=np.int64)
+    rank[order] = np.arange(len(order))
+
+    ## window edges as positions in the date-sorted leaves; a window [start, end) holds leaves edge[start] to edge[end]
+    edges = np.array([[np.searchsorted(sorted_dates, start, side='left'), np.searchsorted(sorted_dates, end, side='left')] for start, end in windows], dtype=np.int64)
+    boundaries = np.unique(edges)
+    n_mutations = presence_matrix.shape[1]
+
+    ## prefix sums at each boundary: entries are bucketed by the number of boundaries at or before their rank, and
+    ## the running total over buckets gives the number of entries with a rank before each boundary
+    coo = presence_matrix.tocoo()
+    keep = rank[coo.row] >= 0
+    rows, columns = coo.row[keep], coo.col[keep]
+    bucket = np.searchsorted(boundaries, rank[rows], side='right')
+    flat = (bucket * n_mutations + columns) * 3 + leaf_hosts[rows]
+    prefix = np.cumsum(np.bincount(flat, minlength=(len(boundaries) + 1) * n_mutations * 3).reshape(len(boundaries) + 1, n_mutations, 3), axis=0)
+    leaf_bucket = np.searchsorted(boundaries, rank[order], side='right')
+    leaf_prefix = np.cumsum(np.bincount(leaf_bucket * 3 + leaf_hosts[order], minlength=(len(boundaries) + 1) * 3).reshape(len(boundaries) + 1, 3), axis=0)
+
+    ## prefix[i] counts entries with a rank before boundaries[i]
+    start_index = np.searchsorted(boundaries, edges[:, 0])
+    end_index = np.searchsorted(boundaries, edges[:, 1])
+    return prefix[end_index] - prefix[start_index], leaf_prefix[end_index] - leaf_prefix[start_index]
+
+
+
+def run_time_windows(tree, gene, host1, host2, host_annotation, min_required_count, window_width = 5, window_step = 1):
+    """return a dataframe with the host counts, enrichment score and pvalue of every mutation in every window in which
+    it is present in at least min_required_count tips (and at least one)"""
+    presence_matrix, leaves, mutations = presence.return_presence_matrix(tree, gene)
+    leaf_hosts = presence.return_leaf_host_index(leaves, host1, host2, host_annotation)
+    dates = return_leaf_dates(leaves)
+    windows = return_windows(dates, window_width, window_step)
+    mutation_counts, host_totals = return_window_counts(presence_matrix, leaf_hosts, dates, windows)
+
+    window_index, mutation_index = np.nonzero(mutation_counts.sum(axis=2) >= max(min_required_count, 1))
+    counts = mutation_counts[window_index, mutation_index]
+    totals = host_totals[window_index]
+    enrichment_score, pvalue = presence.score_counts(counts, totals)
+    windows = np.array(windows).reshape(-1, 2)
+    return pd.DataFrame({'mutation': np.array(mutations, dtype=object)[mutation_index], 'window_start': windows[window_index, 0],
+                         'window_end': windows[window_index, 1], 'enrichment_score': enrichment_score, 'pvalue': pvalue,
+                         host1: counts[:, 0], host2: counts[:, 1], 'other': counts[:, 2],
+                         'total_' + host1: totals[:, 0], 'total_' + host2: totals[:, 1], 'total_other': totals[:, 2]})
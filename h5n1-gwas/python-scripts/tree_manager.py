@@ -1,14 +1,20 @@
 import copy
 import pickle
 import json
-import imp
 
 import config as cfg
 
-if cfg.baltic_path == None or cfg.baltic_path == "pip":
-    import baltic as bt
-else:
-    bt = imp.load_source('baltic', cfg.baltic_path)
+
+
+def load_baltic():
+    """import baltic from pip or from the local source file in the config file. This is done when a tree is first read 
+    rather than when this module is imported, so that steps which do not read trees do not pay for the import"""
+    if cfg.baltic_path == None or cfg.baltic_path == "pip":
+        import baltic as bt
+    else:
+        import imp
+        bt = imp.load_source('baltic', cfg.baltic_path)
+    return bt
 
 
 
@@ -24,6 +30,7 @@ def init_trees(tree_path = None, gene = None):
 
 def init_pickled_trees(output_folder_path, gene = None):
     gene = gene or cfg.gene
+    load_baltic() # pickled baltic trees can only be loaded once baltic has been imported
     json_tree_path = output_folder_path + "/pickled_json_tree.obj"
     with open(json_tree_path, 'rb') as pickled_json_tree:
         json_tree = pickle.load(pickled_json_tree)
@@ -43,6 +50,7 @@ def read_in_tree_json(input_tree):
         json_tree = json.load(json_file)
 
     # Nextstrain tree jsons are broken into 2 components: metadata and tree. We just need the tree
+    bt = load_baltic()
     json_translation = {'absoluteTime':lambda k: k.traits['node_attrs']['num_date']['value'],'name':'name'} ## allows baltic to find correct attributes in JSON, height and name are required at a minimum
     tree, meta = bt.loadJSON(json_tree, json_translation)
 
@@ -27,6 +27,7 @@ def write_config(folder_name):
         'host1': cfg.host1,
         'host2': cfg.host2,
         'minimum_required_count': cfg.minimum_required_count,
+        'seed': cfg.seed,
         'iterations':cfg.iterations
         }
     config_path = folder_name + "/config.txt"
@@ -50,9 +51,43 @@ def write_json_tree(folder_name, json_tree):
     pickled_json_tree_file.close()
 
 def write_dfs(folder_name, df5, df8, df9 = None, df10 = None):
+    write_data_df(folder_name, df5)
+    write_simulated_dfs(folder_name, df8, df9, df10)
+
+def write_data_df(folder_name, df5):
     output_filename = folder_name + "/data/" + cfg.gene + "_" + cfg.host1 + "_vs_" + cfg.host2 + "_data_" + current_date + ".tsv"
     df5.to_csv(output_filename, sep="\t", header=True, index_label="mutation")
 
+def write_windows_df(folder_name, windows_df):
+    output_filename = folder_name + "/data/" + cfg.gene + "_" + cfg.host1 + "_vs_" + cfg.host2 + "_windows_" + current_date + ".tsv"
+    windows_df.to_csv(output_filename, sep="\t", header=True, index=False)
+
+def write_clade_dfs(folder_name, clades_df, pooled_df):
+    output_filename = folder_name + "/data/" + cfg.gene + "_" + cfg.host1 + "_vs_" + cfg.host2 + "_clades_" + current_date + ".tsv"
+    clades_df.to_csv(output_filename, sep="\t", header=True, index=False)
+
+    output_filename = folder_name + "/data/" + cfg.gene + "_" + cfg.host1 + "_vs_" + cfg.host2 + "_cmh_" + current_date + ".tsv"
+    pooled_df.to_csv(output_filename, sep="\t", header=True, index_label="mutation")
+
+def write_event_dfs(folder_name, events_df, transitions_df, summary_df):
+    output_filename = folder_name + "/data/" + cfg.gene + "_" + cfg.host1 + "_vs_" + cfg.host2 + "_events_" + current_date + ".tsv"
+    events_df.to_csv(output_filename, sep="\t", header=True, index=False)
+
+    output_filename = folder_name + "/data/" + cfg.gene + "_" + cfg.host1 + "_vs_" + cfg.host2 + "_transitions_" + current_date + ".tsv"
+    transitions_df.to_csv(output_filename, sep="\t", header=True, index=False)
+
+    output_filename = folder_name + "/data/" + cfg.gene + "_" + cfg.host1 + "_vs_" + cfg.host2 + "_origins_" + current_date + ".tsv"
+    summary_df.to_csv(output_filename, sep="\t", header=True, index_label="mutation")
+
+def write_pairs_df(folder_name, pairs_df):
+    output_filename = folder_name + "/data/" + cfg.gene + "_" + cfg.host1 + "_vs_" + cfg.host2 + "_pairs_" + current_date + ".tsv"
+    pairs_df.to_csv(output_filename, sep="\t", header=True, index=False)
+
+def write_stability_df(folder_name, stability_df):
+    output_filename = folder_name + "/data/" + cfg.gene + "_" + cfg.host1 + "_vs_" + cfg.host2 + "_stability_" + current_date + ".tsv"
+    stability_df.to_csv(output_filename, sep="\t", header=True, index_label="mutation")
+
+def write_simulated_dfs(folder_name, df8, df9 = None, df10 = None):
     output_filename = folder_name + "/data/" + cfg.gene + "_" + cfg.host1 + "_vs_" + cfg.host2 + "_simulated_" + current_date + ".tsv"
     df8.to_csv(output_filename, sep="\t", header=True, index=False)
 
@@ -0,0 +1,441 @@
+"""
+Command-line entry point for the scan and residue analysis scripts in this repository. Rather than editing the
+constants at the top of each script (or config.py), pass them as arguments:
+
+    python h5n1.py scan --tree flu_avian_h5n1_pb2.json --gene PB2 --hosts Human,Avian --iterations 10000 --output "GWAS Data/"
+    python h5n1.py scan --tree flu_avian_h5n1_pb2.json --gene PB2 --previous "GWAS Data/H5N1_PB2_0" --output "GWAS Data/"
+    python h5n1.py scan --tree flu_avian_h5n1_pb2.json --gene PB2 --window-width 5 --window-step 1 --output "GWAS Data/"
+    python h5n1.py scan --tree flu_avian_h5n1_pb2.json --gene PB2 --clades get-h5n1-clade/h5nx-clades.tsv --output "GWAS Data/"
+    python h5n1.py scan --tree flu_avian_h5n1_pb2.json --gene PB2 --hosts Human,Avian --bootstrap 1000 --seed 1 --output "GWAS Data/"
+    python h5n1.py scan --tree flu_avian_h5n1_pb2.json --gene PB2 --hosts Human,Avian --subsamples 100 --group-by host region month --seed 1 --output "GWAS Data/"
+    python h5n1.py scan --tree flu_avian_h5n1_pb2.json --gene PB2 --events --output "GWAS Data/"
+    python h5n1.py scan --tree flu_avian_h5n1_pb2.json --gene PB2 --pairs 5 --cores 0 --output "GWAS Data/"
+    python h5n1.py part1 --tree flu_avian_h5n1_pb2.json --gene PB2 --hosts Human,Avian --output part1.tsv
+    python h5n1.py shard --tree flu_avian_h5n1_pb2.json --gene PB2 --hosts Human,Avian --iterations 10000 --seed 1 --shard 0 --shards 8 --output shard_0.tsv
+    python h5n1.py reduce --part1 part1.tsv --shards shard_*.tsv --iterations 10000 --output data.tsv --simulated simulated.tsv --cutoffs cutoffs.tsv
+    python h5n1.py ensemble --tree flu_avian_h5n1_pb2.json --ensemble bootstrap/flu_avian_h5n1_pb2_*.json --gene PB2 --iterations 100 --seed 1 --output ensemble.tsv
+    python h5n1.py simulate --tree flu_avian_h5n1_pb2.json --hosts Human,Avian --iterations 10000 --output simulation_data_greater.csv
+    python h5n1.py simulate --per-site --gene PB2 --tree flu_avian_h5n1_pb2.json --iterations 10000 --output simulation_cutoffs_greater.csv
+    python h5n1.py propagate --tree flu_avian_h5n1_pb2.json --root-sequence flu_avian_h5n1_pb2_root-sequence.json --gene PB2 --output flu_avian_h5n1_pb2_mutprop.json
+    python h5n1.py matrix --tree flu_avian_h5n1_pb2.json --root-sequence flu_avian_h5n1_pb2_root-sequence.json --gene PB2 --output flu_avian_h5n1_pb2_residues
+    python h5n1.py count --tree flu_avian_h5n1_pb2_mutprop.json --gene PB2 --hosts Human,Avian --output counts/
+    python h5n1.py count --matrix flu_avian_h5n1_pb2_residues --hosts Human,Avian,Mammal --output counts/
+    python h5n1.py analyze --counts counts/human_all_aa_counts.tsv counts/avian_all_aa_counts.tsv --output all_aa_or_pv.csv
+    python h5n1.py analyze --matrix flu_avian_h5n1_pb2_residues --hosts Human,Avian --strata tree_clusters.tsv --output all_aa_or_pv_cmh.csv
+    python h5n1.py permute --matrix flu_avian_h5n1_pb2_residues --hosts Human,Avian --strata tree_clusters.tsv --permutations 10000 --output all_aa_permutation_pv.csv
+    python h5n1.py genome --trees base-build/auspice --references base-build/config --hosts Human,Avian --output genome-scan/
+    python h5n1.py annotate --fasta h5n1_ha.fasta h5n1_pb2.fasta --orders --clades
+    python h5n1.py annotate --fasta h5n1_ha.fasta h5n1_pb2.fasta --orders --species-threshold 0.85 --species-report species_matches.tsv
+
+Each subcommand imports the scripts it runs (and with them pandas, scipy, Bio or baltic) only when it is called,
+so printing help or running a light subcommand does not wait on imports that it does not use.
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+gwas_dir = os.path.join(repo_dir, 'h5n1-gwas', 'python-scripts')
+residue_dir = os.path.join(repo_dir, 'residue-analysis')
+
+
+
+def load_script(name, path):
+    '''import a script from its path; the residue analysis scripts have names that are not valid module names. The
+    module is registered in sys.modules so that its functions can be pickled and sent to worker processes'''
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+
+def split_hosts(hosts):
+    '''split "Human,Avian" into host1 (the host to screen for enrichment in) and host2 (the background host)'''
+    host1, host2 = [h.strip() for h in hosts.split(',')]
+    return host1, host2
+
+
+
+def configure_scan(args):
+    '''set the config.py settings shared by the scan subcommands, and return the config module'''
+    sys.path.insert(0, gwas_dir)
+    import config as cfg
+    cfg.tree_path = args.tree
+    cfg.gene = args.gene
+    cfg.host1, cfg.host2 = split_hosts(args.hosts)
+    cfg.host_annotation = args.host_annotation
+    cfg.minimum_required_count = args.minimum_required_count
+    cfg.seed = args.seed
+    cfg.baltic_path = args.baltic_path
+    return cfg
+
+
+
+def run_scan(args):
+    cfg = configure_scan(args)
+    cfg.iterations = args.iterations
+    cfg.folder_path = os.path.join(args.output, '')
+    cfg.naming_scheme = 'H5N1_' + args.gene
+    cfg.part1_cores = args.cores
+    cfg.pipeline = args.pipeline
+    cfg.pipeline_cores = args.pipeline_cores or None
+    cfg.testing_mode = args.testing_mode
+    cfg.previous_run_path = args.previous
+    cfg.window_width = args.window_width
+    cfg.window_step = args.window_step
+    cfg.clade_stratified = args.clades is not None or args.clade_annotation is not None
+    cfg.clade_path = args.clades
+    cfg.clade_annotation = args.clade_annotation
+    cfg.event_index = args.events
+    cfg.bootstrap_replicates = args.bootstrap
+    cfg.bootstrap_alpha = args.bootstrap_alpha
+    cfg.bootstrap_cluster_path = args.bootstrap_clusters
+    cfg.bootstrap_cluster_annotation = args.bootstrap_cluster_annotation
+    cfg.pair_min_support = args.pairs
+    cfg.pair_block_size = args.pair_block_size
+    cfg.subsamples = args.subsamples
+    cfg.subsample_group_by = args.group_by
+    cfg.subsample_sequences_per_group = args.sequences_per_group
+    cfg.subsample_alpha = args.subsample_alpha
+    if args.store is not None:
+        cfg.use_run_store = True
+        cfg.run_store_path = args.store
+    os.makedirs(cfg.folder_path, exist_ok=True)
+
+    import run_phylogenetic_scan_clean_commented as scan
+    scan.run_configured_scan()
+
+
+
+def run_part1(args):
+    ## Part 1 of the scan as a single workflow job
+    cfg = configure_scan(args)
+    cfg.part1_cores = args.cores or None
+    import shards
+    shards.run_part1_job(args.output)
+
+
+
+def run_shard(args):
+    ## one shard of the scan's simulations as a single workflow job
+    cfg = configure_scan(args)
+    cfg.iterations = args.iterations
+    import shards
+    shards.run_simulation_shard(args.shard, args.shards, args.output, args.cores or None)
+
+
+
+def run_reduce(args):
+    ## merge the simulation shards of a scan and add empirical cutoffs to the Part 1 results
+    sys.path.insert(0, gwas_dir)
+    import shards
+    shards.reduce_shards(args.part1, args.shards, args.output, args.simulated, args.cutoffs, args.iterations, args.alpha)
+
+
+
+def run_ensemble(args):
+    ## the scan on an ensemble of trees (e.g. bootstrap replicates), with tips and hosts from --tree
+    cfg = configure_scan(args)
+    cfg.iterations = args.iterations
+    import ensemble
+    ensemble.run_ensemble_job(args.ensemble, args.output, args.scores, args.cutoffs, args.cores or None, args.alpha)
+
+
+
+def run_simulate(args):
+    if args.per_site:
+        ## a null matched to the number of substitutions at each position, with a cutoff for each position
+        if args.gene is None:
+            raise SystemExit('simulate: --gene is required with --per-site')
+        sys.path.insert(0, residue_dir)
+        matched = load_script('matched_null', os.path.join(residue_dir, 'matched_null.py'))
+        host1, host2 = split_hosts(args.hosts)
+        matched.simulate_matched_null(args.tree, args.gene, args.output, host1, host2, args.iterations, args.alpha, args.seed, args.alternative)
+        return
+    sims = load_script('perform_simulations', os.path.join(residue_dir, '4-perform-simulations.py'))
+    sims.host1, sims.host2 = split_hosts(args.hosts)
+    sims.alternative = args.alternative
+    sims.simulate_tree_file(args.tree, args.output, args.iterations)
+
+
+
+def run_propagate(args):
+    propagate = load_script('propagate_mutations', os.path.join(residue_dir, '1-propagate-mutations.py'))
+    propagate.propagate_tree_file(args.tree, args.root_sequence, args.output, args.gene)
+
+
+
+def run_matrix(args):
+    matrix = load_script('residue_matrix', os.path.join(residue_dir, 'residue_matrix.py'))
+    matrix.write_residue_matrix(args.tree, args.root_sequence, args.gene, args.output, args.host_annotation, args.clade_annotation)
+
+
+
+def run_count(args):
+    if (args.tree is None) == (args.matrix is None):
+        raise SystemExit('count: specify one of --tree or --matrix')
+    os.makedirs(args.output, exist_ok=True)
+    if args.matrix is not None:
+        ## counts any number of hosts at once from a residue matrix written by the matrix subcommand
+        matrix = load_script('residue_matrix', os.path.join(residue_dir, 'residue_matrix.py'))
+        hosts = None if args.hosts == 'all' else [h.strip() for h in args.hosts.split(',')]
+        matrix.write_host_counts(args.matrix, args.output, hosts)
+        return
+    if args.gene is None:
+        raise SystemExit('count: --gene is required with --tree')
+    counts = load_script('get_all_aa_counts', os.path.join(residue_dir, '2-get-all-aa-counts.py'))
+    counts.baltic_path = args.baltic_path
+    host1, host2 = split_hosts(args.hosts)
+    counts.write_all_aa_counts(args.tree, args.gene, host1, host2,
+                               os.path.join(args.output, host1.lower() + '_all_aa_counts.tsv'),
+                               os.path.join(args.output, host2.lower() + '_all_aa_counts.tsv'))
+
+
+
+def run_analyze(args):
+    if (args.counts is None) == (args.matrix is None):
+        raise SystemExit('analyze: specify one of --counts or --matrix')
+    if args.matrix is not None:
+        ## CMH tests stratified by tree cluster (or Fisher's exact tests without strata) from a residue matrix
+        sys.path.insert(0, residue_dir)
+        cmh = load_script('cmh_analysis', os.path.join(residue_dir, 'cmh_analysis.py'))
+        host1, host2 = split_hosts(args.hosts)
+        cmh.analyze_residue_matrix(args.matrix, host1, host2, args.output, args.strata, args.strata_column, args.alternative)
+        return
+    analyze = load_script('analyze_aa_counts', os.path.join(residue_dir, '3-analyze-aa-counts.py'))
+    host1_file, host2_file = args.counts
+    analyze.analyze_aa_counts(host1_file, host2_file, args.output, args.alternative)
+
+
+
+def run_permute(args):
+    sys.path.insert(0, residue_dir)
+    permute = load_script('permutation_null', os.path.join(residue_dir, 'permutation_null.py'))
+    host1, host2 = split_hosts(args.hosts)
+    permute.permute_residue_matrix(args.matrix, host1, host2, args.output, args.strata, args.strata_column, args.permutations,
+                                   args.batch_size, args.seed, args.alternative)
+
+
+
+def run_genome(args):
+    sys.path.insert(0, residue_dir)
+    genome = load_script('genome_scan', os.path.join(residue_dir, 'genome_scan.py'))
+    host1, host2 = split_hosts(args.hosts)
+    genome.run_genome_scan(args.trees, args.references, args.output, args.output_file, host1, host2, args.strata, args.alternative,
+                           args.tree_prefix, args.reference_prefix, args.cores)
+
+
+
+def run_annotate(args):
+    if not (args.orders or args.clades):
+        raise SystemExit('annotate: specify --orders, --clades, or both')
+    headers = load_script('header_annotator', os.path.join(repo_dir, 'fasta-headers', 'header_annotator.py'))
+    annotator_names = (['orders'] if args.orders else []) + (['clades'] if args.clades else [])
+    annotators = headers.build_annotators(annotator_names, args.synonyms, args.species_orders, args.clade_tsv, args.species_threshold)
+    headers.annotate_fastas(args.fasta, annotators, args.cores)
+    if args.species_report is not None:
+        orders = headers.load_renamer('order_renamer', os.path.join(repo_dir, 'get-avian-orders', 'order_renamer.py'))
+        orders.write_species_report(headers.return_species_report(annotators), args.species_report)
+
+
+
+def add_scan_arguments(parser):
+    parser.add_argument('--tree', required=True, help='auspice v2 tree json')
+    parser.add_argument('--gene', required=True, help='gene to scan, e.g. PB2')
+    parser.add_argument('--hosts', default='Human,Avian', help='host to screen for enrichment in and background host, comma separated')
+    parser.add_argument('--host-annotation', default='host', help='node attribute that encodes the host')
+    parser.add_argument('--minimum-required-count', type=int, default=0, help='minimum number of tips with a mutation for it to be scored')
+    parser.add_argument('--seed', type=int, default=None, help='random seed for the simulations')
+    parser.add_argument('--baltic-path', default='pip', help='path to baltic.py, or "pip" if baltic is installed with pip')
+
+
+
+def check_scan_arguments(parser, args):
+    '''stop with a usage error if scan options that only apply to the full scan are given with a kind of scan that
+    replaces it, rather than ignoring them'''
+    modes = [flag for flag, value in [('--window-width', args.window_width), ('--clades', args.clades), ('--events', args.events or None),
+                                      ('--pairs', args.pairs), ('--subsamples', args.subsamples)] if value is not None]
+    if args.clade_annotation is not None and '--clades' not in modes:
+        modes.append('--clade-annotation')
+    if len(modes) > 1:
+        parser.error('argument %s: not allowed with argument %s' % (modes[1], modes[0]))
+    full_scan_options = [flag for flag, value in [('--bootstrap', args.bootstrap), ('--store', args.store), ('--pipeline', args.pipeline or None),
+                                                  ('--previous', args.previous)] if value is not None]
+    if modes and full_scan_options:
+        parser.error('argument %s: only applies to the full scan, not with argument %s' % (full_scan_options[0], modes[0]))
+    if args.store is not None and args.pipeline:
+        parser.error('argument --pipeline: not allowed with argument --store')
+    if args.previous is not None and args.pipeline:
+        parser.error('argument --previous: not allowed with argument --pipeline')
+
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='run the H5N1 host enrichment scan and residue analysis steps')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scan = subparsers.add_parser('scan', help='run the phylogenetic scan for host enriched mutations (h5n1-gwas)')
+    add_scan_arguments(scan)
+    scan.add_argument('--iterations', type=int, default=10000, help='number of simulations for the null distribution')
+    scan.add_argument('--output', default='GWAS Data/', help='folder in which numbered output folders are created')
+    scan.add_argument('--cores', type=int, default=1, help='cores used to calculate Part 1 enrichment scores (0 for all cores)')
+    scan.add_argument('--pipeline', action='store_true', help='run Part 1 and the simulations at the same time')
+    scan.add_argument('--pipeline-cores', type=int, default=0, help='cores in the pool of --pipeline (0 for all cores)')
+    scan.add_argument('--store', default=None, help='path of a run store; reuse stored results when inputs are unchanged')
+    scan.add_argument('--previous', default=None, help='output folder of a scan of an earlier build; only mutations whose descendant tips changed are rescored')
+    ## kinds of scan that replace the full scan; at most one can be selected
+    modes = scan.add_mutually_exclusive_group()
+    modes.add_argument('--window-width', type=float, default=None, help='score mutations within rolling windows of this many years of sampling dates (Part 1 only)')
+    scan.add_argument('--window-step', type=float, default=1, help='years between the starts of successive windows')
+    modes.add_argument('--clades', default=None, help='tsv with name and clade columns (h5nx-clades.tsv); score mutations within clades and pooled with a CMH test (Part 1 only)')
+    scan.add_argument('--clade-annotation', default=None, help='node attribute with the clade of each leaf, for leaves not in --clades (or instead of it)')
+    modes.add_argument('--events', action='store_true', help='index the independent origins of every mutation with the parent and child host of each (no scoring)')
+    modes.add_argument('--pairs', type=int, default=None, metavar='MIN_SUPPORT', help='score pairs of mutations present together in at least this many tips (Part 1 only; uses --cores)')
+    scan.add_argument('--pair-block-size', type=int, default=256, help='mutations compared at once in each block of the pair scan')
+    modes.add_argument('--subsamples', type=int, default=None, help='score mutations in this many subsamples of tips, and write the fraction in which each is significant (Part 1 only)')
+    scan.add_argument('--group-by', nargs='+', default=['host', 'region', 'month'], help='leaf attributes that tips are subsampled within, as in augur filter (month and year from dates)')
+    scan.add_argument('--sequences-per-group', type=int, default=2, help='tips kept per group in each subsample')
+    scan.add_argument('--subsample-alpha', type=float, default=0.05, help='pvalue at or below which a mutation is significant in a subsample')
+    scan.add_argument('--bootstrap', type=int, default=None, metavar='REPLICATES', help='add bootstrap confidence intervals of enrichment scores from this many resamples of tips')
+    scan.add_argument('--bootstrap-alpha', type=float, default=0.05, help='confidence intervals cover 1 - alpha of bootstrap scores')
+    scan.add_argument('--bootstrap-clusters', default=None, help='tsv with name and clade columns; resample whole clades instead of tips')
+    scan.add_argument('--bootstrap-cluster-annotation', default=None, help='node attribute with the cluster of each leaf to resample, for leaves not in --bootstrap-clusters')
+    scan.add_argument('--testing-mode', action='store_true', help='also write per-branch simulation tables (df9, df10)')
+    scan.set_defaults(function=run_scan)
+
+    part1 = subparsers.add_parser('part1', help='run Part 1 of the scan and write the enrichment scores of every mutation (workflow job)')
+    add_scan_arguments(part1)
+    part1.add_argument('--cores', type=int, default=1, help='cores used to calculate enrichment scores (0 for all cores)')
+    part1.add_argument('--output', required=True, help='output tsv file')
+    part1.set_defaults(function=run_part1)
+
+    shard = subparsers.add_parser('shard', help='run one shard of the scan simulations (workflow job)')
+    add_scan_arguments(shard)
+    shard.add_argument('--iterations', type=int, default=10000, help='total number of simulations over all shards')
+    shard.add_argument('--shard', type=int, required=True, help='number of this shard, from 0 to shards - 1')
+    shard.add_argument('--shards', type=int, required=True, help='number of shards the simulations are split into')
+    shard.add_argument('--cores', type=int, default=1, help='cores used for this shard (0 for all cores)')
+    shard.add_argument('--output', required=True, help='output tsv file')
+    shard.set_defaults(function=run_shard)
+
+    ensemble = subparsers.add_parser('ensemble', help='scan an ensemble of trees, e.g. bootstrap replicates, and summarize each mutation across trees (ensemble.py)')
+    add_scan_arguments(ensemble)
+    ensemble.add_argument('--ensemble', nargs='+', required=True, help='auspice v2 tree jsons of the ensemble, with the same tips as --tree')
+    ensemble.add_argument('--iterations', type=int, default=0, help='simulations per tree for its empirical cutoffs (0 to call mutations with pvalue <= alpha and a score above 1 significant)')
+    ensemble.add_argument('--alpha', type=float, default=0.05, help='fraction of simulated scores beyond the empirical cutoffs, or the pvalue cutoff without simulations')
+    ensemble.add_argument('--cores', type=int, default=0, help='trees scanned at once (0 for all cores)')
+    ensemble.add_argument('--output', required=True, help='output tsv file with the score distribution of every mutation')
+    ensemble.add_argument('--scores', default=None, help='output tsv file with the score of every mutation on every tree')
+    ensemble.add_argument('--cutoffs', default=None, help='output tsv file with the cutoffs of every tree')
+    ensemble.set_defaults(function=run_ensemble)
+
+    reduce = subparsers.add_parser('reduce', help='merge simulation shards and add empirical cutoffs to the Part 1 results (workflow job)')
+    reduce.add_argument('--part1', required=True, help='tsv file written by the part1 subcommand')
+    reduce.add_argument('--shards', nargs='+', required=True, help='tsv files written by the shard subcommand')
+    reduce.add_argument('--iterations', type=int, required=True, help='number of simulations split among the shards')
+    reduce.add_argument('--alpha', type=float, default=0.05, help='fraction of simulated scores beyond the empirical cutoffs')
+    reduce.add_argument('--output', required=True, help='output tsv file with the Part 1 results, empirical pvalues and significance calls')
+    reduce.add_argument('--simulated', required=True, help='output tsv file with the merged simulations')
+    reduce.add_argument('--cutoffs', required=True, help='output tsv file with the empirical cutoffs')
+    reduce.set_defaults(function=run_reduce)
+
+    simulate = subparsers.add_parser('simulate', help='simulate a single site null for the residue analysis (4-perform-simulations.py)')
+    simulate.add_argument('--tree', required=True, help='auspice v2 tree json')
+    simulate.add_argument('--hosts', default='Human,Avian', help='host to screen for enrichment in and background host, comma separated')
+    simulate.add_argument('--iterations', type=int, default=10000, help='number of simulations')
+    simulate.add_argument('--alternative', default='greater', choices=['two-sided', 'greater', 'less'], help='alternative hypothesis for Fisher\'s exact test')
+    simulate.add_argument('--per-site', action='store_true', help='simulate a null matched to the substitutions at each position (matched_null.py)')
+    simulate.add_argument('--gene', default=None, help='gene whose substitutions set the rate at each position (with --per-site)')
+    simulate.add_argument('--alpha', type=float, default=0.05, help='quantile of simulated pvalues used as the cutoff at each position (with --per-site)')
+    simulate.add_argument('--seed', type=int, default=None, help='random seed (with --per-site)')
+    simulate.add_argument('--output', required=True, help='output csv file')
+    simulate.set_defaults(function=run_simulate)
+
+    propagate = subparsers.add_parser('propagate', help='propagate mutations from the root sequence onto every node (1-propagate-mutations.py)')
+    propagate.add_argument('--tree', required=True, help='auspice v2 tree json')
+    propagate.add_argument('--root-sequence', required=True, help='root-sequence json from augur export')
+    propagate.add_argument('--gene', required=True, help='gene to propagate mutations for')
+    propagate.add_argument('--output', required=True, help='output json tree with propagated mutations')
+    propagate.set_defaults(function=run_propagate)
+
+    matrix = subparsers.add_parser('matrix', help='write an int8 leaves x positions residue matrix and leaf table (residue_matrix.py)')
+    matrix.add_argument('--tree', required=True, help='auspice v2 tree json; mutations do not need to be propagated')
+    matrix.add_argument('--root-sequence', required=True, help='root-sequence json from augur export')
+    matrix.add_argument('--gene', required=True, help='gene to build the matrix for')
+    matrix.add_argument('--output', required=True, help='output prefix; writes <prefix>.npy, <prefix>.json and <prefix>_leaves.tsv')
+    matrix.add_argument('--host-annotation', default='host', help='node attribute that encodes the host')
+    matrix.add_argument('--clade-annotation', default='h5_label_clade', help='node attribute that encodes the clade')
+    matrix.set_defaults(function=run_matrix)
+
+    count = subparsers.add_parser('count', help='count amino acids at each position in each host (2-get-all-aa-counts.py)')
+    count.add_argument('--tree', default=None, help='json tree with propagated mutations')
+    count.add_argument('--matrix', default=None, help='prefix of a residue matrix written by the matrix subcommand, instead of --tree')
+    count.add_argument('--gene', default=None, help='gene to count (with --tree)')
+    count.add_argument('--hosts', default='Human,Avian', help='comma separated hosts; two hosts with --tree, any number (or "all") with --matrix')
+    count.add_argument('--output', required=True, help='output folder for <host>_all_aa_counts.tsv files')
+    count.add_argument('--baltic-path', default='pip', help='path to baltic.py, or "pip" if baltic is installed with pip')
+    count.set_defaults(function=run_count)
+
+    analyze = subparsers.add_parser('analyze', help='odds ratios and p-values for each position and amino acid (3-analyze-aa-counts.py)')
+    analyze.add_argument('--counts', nargs=2, default=None, metavar=('HOST1_TSV', 'HOST2_TSV'), help='count tsv files for host1 and host2')
+    analyze.add_argument('--matrix', default=None, help='prefix of a residue matrix written by the matrix subcommand, instead of --counts')
+    analyze.add_argument('--hosts', default='Human,Avian', help='host to screen for enrichment in and background host, comma separated (with --matrix)')
+    analyze.add_argument('--strata', default=None, help='tsv file with name and cluster columns; runs CMH tests stratified by cluster (with --matrix)')
+    analyze.add_argument('--strata-column', default=None, help='column of the leaf table to stratify by, e.g. clade (with --matrix)')
+    analyze.add_argument('--alternative', default='two-sided', choices=['two-sided', 'greater', 'less'], help='alternative hypothesis for Fisher\'s exact test')
+    analyze.add_argument('--output', required=True, help='output csv file')
+    analyze.set_defaults(function=run_analyze)
+
+    permute = subparsers.add_parser('permute', help='empirical pvalues from host labels shuffled within clades or tree clusters (permutation_null.py)')
+    permute.add_argument('--matrix', required=True, help='prefix of a residue matrix written by the matrix subcommand')
+    permute.add_argument('--hosts', default='Human,Avian', help='host to screen for enrichment in and background host, comma separated')
+    permute.add_argument('--strata', default=None, help='tsv file with name and cluster columns; host labels are shuffled within clusters')
+    permute.add_argument('--strata-column', default=None, help='column of the leaf table to shuffle host labels within, e.g. clade')
+    permute.add_argument('--permutations', type=int, default=10000, help='number of host label permutations')
+    permute.add_argument('--batch-size', type=int, default=256, help='permutations evaluated at once')
+    permute.add_argument('--seed', type=int, default=None, help='random seed for the permutations')
+    permute.add_argument('--alternative', default='greater', choices=['two-sided', 'greater', 'less'], help='alternative hypothesis')
+    permute.add_argument('--output', required=True, help='output csv file')
+    permute.set_defaults(function=run_permute)
+
+    genome = subparsers.add_parser('genome', help='residue scan of every segment and gene, with gene lengths from the genbank references (genome_scan.py)')
+    genome.add_argument('--trees', required=True, help='folder with <tree-prefix><segment>.json and <tree-prefix><segment>_root-sequence.json files')
+    genome.add_argument('--references', required=True, help='folder with <reference-prefix><segment>.gb files')
+    genome.add_argument('--hosts', default='Human,Avian', help='host to screen for enrichment in and background host, comma separated')
+    genome.add_argument('--strata', default=None, help='tsv file with name and cluster columns; runs CMH tests stratified by cluster')
+    genome.add_argument('--alternative', default='two-sided', choices=['two-sided', 'greater', 'less'], help='alternative hypothesis')
+    genome.add_argument('--tree-prefix', default='flu_avian_h5n1_', help='prefix of the auspice json file names')
+    genome.add_argument('--reference-prefix', default='reference_h5n1_', help='prefix of the genbank reference file names')
+    genome.add_argument('--cores', type=int, default=None, help='number of worker processes (default: all cores)')
+    genome.add_argument('--output', required=True, help='output folder for residue matrices and the combined table')
+    genome.add_argument('--output-file', default='genome_aa_or_pv.csv', help='name of the combined table')
+    genome.set_defaults(function=run_genome)
+
+    annotate = subparsers.add_parser('annotate', help='annotate FASTA headers with avian orders and/or H5 clades, in one pass over each file (header_annotator.py)')
+    annotate.add_argument('--fasta', nargs='+', required=True, help='FASTA files to annotate')
+    annotate.add_argument('--orders', action='store_true', help='replace avian hosts with their order (order_renamer.py)')
+    annotate.add_argument('--clades', action='store_true', help='add H5 clades from h5nx-clades.tsv (clade_renamer.py)')
+    annotate.add_argument('--synonyms', default=os.path.join(repo_dir, 'get-avian-orders', 'avian-species-synonyms.txt'), help='species synonyms file')
+    annotate.add_argument('--species-orders', default=os.path.join(repo_dir, 'get-avian-orders', 'avian-species-orders.txt'), help='species orders file')
+    annotate.add_argument('--clade-tsv', default=os.path.join(repo_dir, 'get-h5n1-clade', 'h5nx-clades.tsv'), help='strain to clade table')
+    annotate.add_argument('--species-threshold', type=float, default=None, help='match species names that are not in the synonyms file to the closest known name with at least this confidence, e.g. 0.85 (default: exact synonyms only)')
+    annotate.add_argument('--species-report', default=None, help='tsv file to write the fuzzy species matches to, for review (with --species-threshold)')
+    annotate.add_argument('--cores', type=int, default=None, help='FASTA files to annotate at once (default: one per file, up to the number of cores)')
+    annotate.set_defaults(function=run_annotate)
+
+    return parser
+
+
+
+if __name__ == '__main__':
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.command == 'scan':
+        check_scan_arguments(parser, args)
+    if args.command == 'scan' and args.cores == 0:
+        args.cores = None
+    args.function(args)
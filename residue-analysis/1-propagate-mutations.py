@@ -12,9 +12,6 @@ output_file = f'flu_avian_h5n1_{gene.lower()}_mutprop.json' # name for new json
 ##### user input above #####
 
 
-## change to directory with files
-os.chdir(json_dir)
-
 ## functions to read json files
 def read_in_tree_json(input_tree):
     '''read in a tree in json format'''
@@ -42,7 +39,7 @@ def assign_root_muts(tree, gene, root_seq):
         i += 1
     tree['tree']['branch_attrs']['mutations'] = {gene: root_muts}
 
-def propagate_muts(parent):
+def propagate_muts(parent, gene):
     '''propagate mutations from parent nodes onto children, excluding those at positions which are mutated in the child'''
     parent_muts = parent['branch_attrs']['mutations'][gene]
     children = parent['children']
@@ -57,17 +54,93 @@ def propagate_muts(parent):
         else:
             child['branch_attrs']['mutations'] = {gene: parent_muts}
         if 'NODE_' in child['name']:
-            propagate_muts(child)
+            propagate_muts(child, gene)
+
+
+## streaming propagation
+## propagate_muts recurses once per node, re-parses the positions of a child's mutations for every parent mutation, and
+## keeps every node's full list of residues in memory until the whole tree is written with json.dump. The functions
+## below walk the tree with an explicit stack instead, keep an integer position array alongside each list of mutations
+## so that a child only drops the parent positions it mutates, and write each node as soon as it has been propagated.
+## Only the lists of the nodes on the path from the root to the current node are held in memory. The output is
+## byte-identical to json.dump of the tree after assign_root_muts and propagate_muts.
+def get_positions(muts):
+    '''integer position of each mutation in a list of mutations'''
+    return [int(get_position(mut)) for mut in muts]
+
+def propagate_node(child, gene, parent_muts, parent_positions):
+    '''return the propagated mutations dictionary, mutation list and position array of a child, as propagate_muts would assign them'''
+    mutations = child['branch_attrs']['mutations']
+    if gene not in mutations:
+        return {gene: parent_muts}, parent_muts, parent_positions
+    child_muts = mutations[gene]
+    child_positions = get_positions(child_muts)
+    mutated = set(child_positions)
+    kept = [i for i, position in enumerate(parent_positions) if position not in mutated]
+    muts = child_muts + [parent_muts[i] for i in kept]
+    positions = child_positions + [parent_positions[i] for i in kept]
+    mutations = dict(mutations)
+    mutations[gene] = muts
+    return mutations, muts, positions
+
+def iter_node_json(node, gene, mutations, muts, positions, descend):
+    '''yield the json text of a node with its propagated mutations. Where a propagated child should be written, yield
+    (child, muts, positions) instead, so that the caller can write the child before resuming this node'''
+    yield '{'
+    for i, (key, value) in enumerate(node.items()):
+        yield (', ' if i else '') + json.dumps(key) + ': '
+        if key == 'branch_attrs':
+            branch_attrs = dict(value)
+            branch_attrs['mutations'] = mutations
+            yield json.dumps(branch_attrs)
+        elif key == 'children' and descend:
+            yield '['
+            for j, child in enumerate(value):
+                if j:
+                    yield ', '
+                yield (child, muts, positions)
+            yield ']'
+        else:
+            yield json.dumps(value)
+    yield '}'
+
+def write_propagated_tree(json_tree, gene, root_seq, outfile):
+    '''write json_tree to an open file with mutations propagated from the root sequence onto every node, without modifying json_tree'''
+    root_muts = ['_' + str(i) + aa for i, aa in enumerate(root_seq, start=1)]
+    root_positions = list(range(1, len(root_muts) + 1))
+    write = outfile.write
+    write('{')
+    for i, (key, value) in enumerate(json_tree.items()):
+        write((', ' if i else '') + json.dumps(key) + ': ')
+        if key != 'tree':
+            write(json.dumps(value))
+            continue
+        stack = [iter_node_json(value, gene, {gene: root_muts}, root_muts, root_positions, True)]
+        while stack:
+            for chunk in stack[-1]:
+                if isinstance(chunk, str):
+                    write(chunk)
+                else:
+                    ## as in propagate_muts, mutations are only propagated further down from internal nodes
+                    child, parent_muts, parent_positions = chunk
+                    mutations, muts, positions = propagate_node(child, gene, parent_muts, parent_positions)
+                    stack.append(iter_node_json(child, gene, mutations, muts, positions, 'NODE_' in child['name']))
+                    break
+            else:
+                stack.pop()
+    write('}')
+
 
+def propagate_tree_file(tree_file, root_file, output_file, gene):
+    '''read in tree, get root sequence, and write a json tree with mutations propagated from the root sequence'''
+    json_tree = read_in_tree_json(tree_file)
+    root_seq = get_root_seq(root_file, gene)
+    with open(output_file, 'w') as outfile:
+        write_propagated_tree(json_tree, gene, root_seq, outfile)
 
-# read in tree, get root sequence, assign root muts, and propagate muts through tree
-json_tree = read_in_tree_json(tree_file) #(tree_file, gene)
-root_seq = get_root_seq(root_file, gene)
-assign_root_muts(json_tree, gene, root_seq)
-parent = json_tree['tree']
-propagate_muts(parent)
 
+if __name__ == '__main__':
+    ## change to directory with files
+    os.chdir(json_dir)
 
-## save json tree with propagated muts
-with open(output_file, 'w') as outfile:
-    json.dump(json_tree, outfile)
\ No newline at end of file
+    propagate_tree_file(tree_file, root_file, output_file, gene)
@@ -1,9 +1,7 @@
 import json
-import imp
-import pandas as pd
 
 ## specify directory, files, hosts, and gene
-baltic_path = '/Users/jort/coding/baltic/baltic/baltic.py' # path to baltic.py file (https://github.com/evogytis/baltic)
+baltic_path = '/Users/jort/coding/baltic/baltic/baltic.py' # path to baltic.py file (https://github.com/evogytis/baltic), or 'pip' if installed with pip
 gene = 'HA' # gene to analyze
 json_dir = f'/Users/jort/coding/h5n1-mutations-rotation/build3-end-aa-analysis/build3-rerun3/{gene}/' # directory containing json file; output files to be saved here
 tree_file = f'flu_avian_h5n1_{gene.lower()}_mutprop.json' # json tree with mutations propagated
@@ -16,64 +14,68 @@ host2_output_file = 'avian_all_aa_counts.tsv' # output for host2 dataframe (.tsv
 ##### user input above #####
 
 
-## import baltic
-bt = imp.load_source('baltic', baltic_path)
-
 def read_in_tree_json(input_tree):
     '''read in a tree in json format'''
+    ## import baltic
+    if baltic_path == 'pip':
+        import baltic as bt
+    else:
+        import imp
+        bt = imp.load_source('baltic', baltic_path)
     with open(input_tree) as json_file:
         json_tree = json.load(json_file)
     json_translation = {'absoluteTime':lambda k: k.traits['node_attrs']['num_date']['value'],'name':'name'} ## allows baltic to find correct attributes in JSON, height and name are required at a minimum
     bt_tree, meta = bt.loadJSON(json_tree, json_translation)
     return json_tree, bt_tree
 
-
-
-
-
-
-## read in json tree
-json_file = json_dir + tree_file
-json_tree, tree = read_in_tree_json(json_file)
-
-## get full AA sequence for each leaf
-all_seqs = []
-for k in tree.Objects:
-  seq_dict = {}
-  if k.branchType == 'leaf':
-    host = k.traits['node_attrs']['host']['value']
-    for mut in k.traits['branch_attrs']['mutations'][gene]:
-      seq_dict[int(mut[1:len(mut)-1])] = mut[-1]
-    all_seqs.append([host, seq_dict])
-
-
-## generate host count dicts for each amino acid at each position
-if gene == 'HA':
-  aalength = 568 # 568 AAs in HA
-elif gene == 'PB2':
-  aalength = 759 # 759 AAs in PB2
-all_positions = range(1, aalength+1)
-all_aas = ['A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'V', 'W', 'Y', 'other']
-host1_dict = dict((pos, dict((aa, 0) for aa in all_aas)) for pos in all_positions)
-host2_dict = dict((pos, dict((aa, 0) for aa in all_aas)) for pos in all_positions)
-
-## iterate through each sequence and record counts of AA occurrences in each host
-for [host, seq_dict] in all_seqs:
-  if host == host1:
-    for k, v in seq_dict.items():
-      if v in all_aas and k in list(host1_dict):
-        host1_dict[k][v] += 1
-      elif v not in all_aas and k in list(host1_dict):
-        host1_dict[k]['other'] += 1
-  elif host == host2:
-    for k, v in seq_dict.items():
-      if v in all_aas and k in list(host2_dict):
-        host2_dict[k][v] += 1
-      elif v not in all_aas and k in list(host2_dict):
-        host2_dict[k]['other'] += 1
-
-## save host count dataframes as tsv files
-host1_output_path = json_dir + host1_output_file
-host2_output_path = json_dir + host2_output_file
-pd.DataFrame.from_dict(host1_dict).to_csv(host1_output_path, sep='\t', header=True, index=True)
-pd.DataFrame.from_dict(host2_dict).to_csv(host2_output_path, sep='\t', header=True, index=True)
\ No newline at end of file
+def get_all_aa_counts(tree, gene, host1, host2):
+  '''return dicts with counts of each amino acid at each position among host1 and host2 leaves'''
+
+  ## get full AA sequence for each leaf
+  all_seqs = []
+  for k in tree.Objects:
+    seq_dict = {}
+    if k.branchType == 'leaf':
+      host = k.traits['node_attrs']['host']['value']
+      for mut in k.traits['branch_attrs']['mutations'][gene]:
+        seq_dict[int(mut[1:len(mut)-1])] = mut[-1]
+      all_seqs.append([host, seq_dict])
+
+
+  ## generate host count dicts for each amino acid at each position, for every position in the leaf sequences (which
+  ## carry the whole root sequence once mutations are propagated)
+  aalength = max((max(seq_dict) for host, seq_dict in all_seqs if seq_dict), default=0)
+  all_positions = range(1, aalength+1)
+  all_aas = ['A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'V', 'W', 'Y', 'other']
+  host1_dict = dict((pos, dict((aa, 0) for aa in all_aas)) for pos in all_positions)
+  host2_dict = dict((pos, dict((aa, 0) for aa in all_aas)) for pos in all_positions)
+
+  ## iterate through each sequence and record counts of AA occurrences in each host
+  for [host, seq_dict] in all_seqs:
+    if host == host1:
+      for k, v in seq_dict.items():
+        if v in all_aas and k in list(host1_dict):
+          host1_dict[k][v] += 1
+        elif v not in all_aas and k in list(host1_dict):
+          host1_dict[k]['other'] += 1
+    elif host == host2:
+      for k, v in seq_dict.items():
+        if v in all_aas and k in list(host2_dict):
+          host2_dict[k][v] += 1
+        elif v not in all_aas and k in list(host2_dict):
+          host2_dict[k]['other'] += 1
+
+  return host1_dict, host2_dict
+
+
+def write_all_aa_counts(json_file, gene, host1, host2, host1_output_path, host2_output_path):
+  '''read in json tree with propagated mutations, count AA occurrences in each host, and save host count dataframes as tsv files'''
+  import pandas as pd
+  json_tree, tree = read_in_tree_json(json_file)
+  host1_dict, host2_dict = get_all_aa_counts(tree, gene, host1, host2)
+  pd.DataFrame.from_dict(host1_dict).to_csv(host1_output_path, sep='\t', header=True, index=True)
+  pd.DataFrame.from_dict(host2_dict).to_csv(host2_output_path, sep='\t', header=True, index=True)
+
+
+if __name__ == '__main__':
+  write_all_aa_counts(json_dir + tree_file, gene, host1, host2, json_dir + host1_output_file, json_dir + host2_output_file)
@@ -1,5 +1,4 @@
 import pandas as pd
-from scipy.stats import fisher_exact
 
 ## specify directory, files, and gene
 gene = 'HA' # gene to analyze
@@ -13,8 +12,9 @@ alternative = 'two-sided'
 ##### user input above #####
 
 
-def cal_enr(host1_df_col, host2_df_col):
+def cal_enr(host1_df_col, host2_df_col, alternative = alternative):
     '''calculate the odds ratio and pvalue for each amino acid at a given position'''
+    from scipy.stats import fisher_exact
 
     ## get list of AAs with nonzero counts in each host
     host1_df_col_nonzero_aas = host1_df_col.loc[(host1_df_col != 0)].index.values.tolist()
@@ -47,50 +47,49 @@ def cal_enr(host1_df_col, host2_df_col):
     return pos_scores
 
 
-## load tsv files containing AA counts
-host1_df_path = tsv_dir + host1_file
-host2_df_path = tsv_dir + host2_file
-host1_df = pd.read_csv(host1_df_path, sep='\t', header=0, index_col=0)
-host2_df = pd.read_csv(host2_df_path, sep='\t', header=0, index_col=0)
+def analyze_aa_counts(host1_df_path, host2_df_path, output_path, alternative = alternative):
+    '''calculate odds ratios and pvalues for every position/AA pair from host count tsv files, and save as a csv file'''
 
+    ## load tsv files containing AA counts
+    host1_df = pd.read_csv(host1_df_path, sep='\t', header=0, index_col=0)
+    host2_df = pd.read_csv(host2_df_path, sep='\t', header=0, index_col=0)
 
-## get list of all positions based on gene length and make list of all AAs
-if gene == 'HA':
-    aalength = 568 # 568 AAs in HA
-elif gene == 'PB2':
-    aalength = 759 # 759 AAs in PB2
-all_positions = range(1, aalength+1)
-all_aas = ['A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'V', 'W', 'Y']
 
+    ## get list of all positions from the columns of the count files
+    all_positions = sorted(int(pos) for pos in host1_df.columns)
 
-## create dictionary to store data from each position
-all_pos_scores = {}
 
-## get single columns from dataframes corresponding to each position,
-## then get a list of odds ratios and pvalues for each AA at that position
-## and add this list to dictionary with the position as its key
-for pos in all_positions:
-    host1_col = host1_df.loc[:,str(pos)]
-    host2_col = host2_df.loc[:,str(pos)]
-    all_pos_scores[pos] = cal_enr(host1_col, host2_col)
+    ## create dictionary to store data from each position
+    all_pos_scores = {}
 
+    ## get single columns from dataframes corresponding to each position,
+    ## then get a list of odds ratios and pvalues for each AA at that position
+    ## and add this list to dictionary with the position as its key
+    for pos in all_positions:
+        host1_col = host1_df.loc[:,str(pos)]
+        host2_col = host2_df.loc[:,str(pos)]
+        all_pos_scores[pos] = cal_enr(host1_col, host2_col, alternative)
 
-## create lists for position, AA, odds ratio, and pvalue
-pos_list = []
-aa_list = []
-or_list = []
-pv_list = []
 
-## append data to lists for each position/AA pair
-for pos in all_pos_scores:
-  for aa in all_pos_scores[pos].keys():
-    pos_list.append(pos)
-    aa_list.append(aa)
-    or_list.append(all_pos_scores[pos][aa][0])
-    pv_list.append(all_pos_scores[pos][aa][1])
+    ## create lists for position, AA, odds ratio, and pvalue
+    pos_list = []
+    aa_list = []
+    or_list = []
+    pv_list = []
 
+    ## append data to lists for each position/AA pair
+    for pos in all_pos_scores:
+      for aa in all_pos_scores[pos].keys():
+        pos_list.append(pos)
+        aa_list.append(aa)
+        or_list.append(all_pos_scores[pos][aa][0])
+        pv_list.append(all_pos_scores[pos][aa][1])
 
-## generate dataframe from data and save as a tsv file
-output_df = pd.DataFrame({'position': pos_list, 'aminoacid': aa_list, 'oddsratio': or_list, 'pvalue': pv_list})
-output_path = tsv_dir + output_file
-output_df.to_csv(output_path, header=True, index=False)
\ No newline at end of file
+
+    ## generate dataframe from data and save as a tsv file
+    output_df = pd.DataFrame({'position': pos_list, 'aminoacid': aa_list, 'oddsratio': or_list, 'pvalue': pv_list})
+    output_df.to_csv(output_path, header=True, index=False)
+
+
+if __name__ == '__main__':
+    analyze_aa_counts(tsv_dir + host1_file, tsv_dir + host2_file, tsv_dir + output_file)
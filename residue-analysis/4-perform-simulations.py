@@ -1,8 +1,6 @@
 from math import exp
 import random
 import json
-import pandas as pd
-from scipy.stats import fisher_exact
 import multiprocessing as mp
 import time
 
@@ -95,6 +93,8 @@ def mutagenize_tree(parent, results_list, currentstate = None):
 def run_sims(iterations):
     '''perform n simulations, where n = number of iterations defined, and perform a Fisher's exact test for each iteration;
     then return a dict containing results for all simulations'''
+    from scipy.stats import fisher_exact
+
     ## create dictionary of lists to append data to from each simulation iteration
     all_sim_data = {'oddsr': [], 'pvalue': [], 'host1count': [], 'host2count': []}
 
@@ -135,12 +135,15 @@ def get_iteration_list(iterations, cores):
     div, rem = divmod(iterations, cores)
     return [div+1]*rem + [div]*(cores-rem)
 
-if __name__ == '__main__':
+def simulate_tree_file(tree_path, output_path, iterations):
+    '''run simulations on the tree in tree_path, split among all cores, and save the results as a csv file'''
+    import pandas as pd
+    global root, branch_length_dict, total_branch_length
+
     ## start timer
     start_time = time.time()
 
     ## get root of tree
-    tree_path = json_dir + tree_file
     json_tree = read_in_tree_json(tree_path)
     root = json_tree['tree']
 
@@ -152,9 +155,8 @@ if __name__ == '__main__':
     cores = mp.cpu_count()
     iter_list = get_iteration_list(iterations, cores)
 
-    ## start multiprocessing pool
-    mp.set_start_method('fork')
-    pool = mp.Pool()
+    ## start multiprocessing pool; workers are forked, so they share root and the branch lengths set above
+    pool = mp.get_context('fork').Pool()
 
     ## and run the simulations
     pool_sim_data = pool.map(run_sims, iter_list)
@@ -178,5 +180,7 @@ if __name__ == '__main__':
                             host2.lower()+'count': combined_sim_data['host2count']})
     
     ## and save it
-    output_path = json_dir + output_file
-    output_df.to_csv(output_path, header=True, index=False)
\ No newline at end of file
+    output_df.to_csv(output_path, header=True, index=False)
+
+if __name__ == '__main__':
+    simulate_tree_file(json_dir + tree_file, json_dir + output_file, iterations)
@@ -0,0 +1,167 @@
+import os
+
+import numpy as np
+
+import residue_matrix as rm
+
+## specify directory, files, hosts, and strata
+gene = 'PB2' # gene to analyze
+json_dir = f'/Users/jort/coding/h5n1-mutations-rotation/build3-end-aa-analysis/b3-r0-CMH-by-6-tree-cluster/{gene}/' # directory containing the residue matrix; output file to be saved here
+matrix_prefix = f'flu_avian_h5n1_{gene.lower()}_residues' # prefix of the residue matrix written by residue_matrix.py
+host1 = 'Human' # host to screen for enrichment in
+host2 = 'Avian' # background host
+strata_file = 'tree_clusters.tsv' # tsv file with a name and a cluster column for each leaf; None to stratify by strata_column
+strata_column = None # column of the leaf table to stratify by (e.g. 'clade'); with no strata_file or strata_column, runs Fisher's exact tests
+output_file = 'all_aa_or_pv_cmh.csv' # output for dataframe with odds ratios and pvalues (.csv)
+alternative = 'two-sided'
+
+
+##### user input above #####
+
+
+## Cochran-Mantel-Haenszel tests for every position/AA pair
+## Leaves are split into strata (tree clusters), and a (strata x positions x 21 x hosts) count tensor is built from the
+## residue matrix in one pass. For each position/AA pair and stratum, the 2x2 table is
+##       [[host1 leaves with the AA, host1 leaves without it],
+##        [host2 leaves with the AA, host2 leaves without it]]
+## and the CMH statistic, the Mantel-Haenszel common odds ratio and the pvalue are computed for all pairs at once. With
+## a single stratum, Fisher's exact test is run instead, with zero cells set to 1 as in 3-analyze-aa-counts.py, so that
+## the results match that script.
+def read_strata(strata_path, leaf_names):
+    '''cluster of each leaf from a tsv file with name and cluster columns; leaves not in the file get an empty cluster'''
+    import pandas as pd
+    strata_df = pd.read_csv(strata_path, sep='\t', dtype=str, keep_default_na=False)
+    clusters = dict(zip(strata_df['name'], strata_df['cluster']))
+    return [clusters.get(name, '') for name in leaf_names]
+
+def stratified_counts(matrix, leaf_hosts, leaf_strata, host1, host2):
+    '''return the (strata x positions x 21 x 2) count tensor for host1 and host2, and the stratum of each slice.
+    Leaves with an empty stratum are not counted'''
+    leaf_strata = [str(stratum) for stratum in leaf_strata]
+    strata = sorted(set(leaf_strata) - {''})
+    labels = [(stratum, host) for stratum, host in zip(leaf_strata, leaf_hosts)]
+    counts = rm.count_residues(matrix, labels, [(stratum, host) for stratum in strata for host in (host1, host2)])
+    counts = counts.reshape(len(strata), 2, matrix.shape[1], len(rm.all_aas))
+    return counts.transpose(0, 2, 3, 1), strata
+
+def two_by_two(counts):
+    '''cells (a, b, c, d) of the 2x2 table for every stratum, position and AA (excluding 'other') in a count tensor'''
+    totals = counts.sum(axis=2, keepdims=True)
+    present = counts[:, :, :-1, :]
+    absent = totals - present
+    return present[..., 0], absent[..., 0], present[..., 1], absent[..., 1]
+
+def cmh_test(a, b, c, d, alternative='two-sided', axis=0):
+    '''Cochran-Mantel-Haenszel test over the strata axis (the first by default) of arrays of 2x2 cells; returns
+    (statistic, common odds ratio, pvalue) arrays. Strata with fewer than 2 leaves in their table do not contribute'''
+    from scipy.stats import chi2, norm
+    a, b, c, d = [np.asarray(x, dtype=float) for x in (a, b, c, d)]
+    n = a + b + c + d
+    informative = n > 1
+    safe_n = np.where(informative, n, 2)
+    expected = np.where(informative, (a + b) * (a + c) / safe_n, 0)
+    variance = np.where(informative, (a + b) * (c + d) * (a + c) * (b + d) / (safe_n ** 2 * (safe_n - 1)), 0)
+    difference = np.where(informative, a - expected, 0).sum(axis=axis)
+    variance = variance.sum(axis=axis)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        statistic = np.where(variance > 0, difference ** 2 / variance, 0.0)
+        z = np.where(variance > 0, difference / np.sqrt(variance), 0.0)
+        r = np.where(informative, a * d / safe_n, 0).sum(axis=axis)
+        s = np.where(informative, b * c / safe_n, 0).sum(axis=axis)
+        oddsratio = r / s
+    if alternative == 'two-sided':
+        pvalue = chi2.sf(statistic, 1)
+    elif alternative == 'greater':
+        pvalue = norm.sf(z)
+    elif alternative == 'less':
+        pvalue = norm.cdf(z)
+    else:
+        raise ValueError("alternative should be 'two-sided', 'less' or 'greater'")
+    ## tables with no variance carry no information about the odds ratio
+    pvalue = np.where(variance > 0, pvalue, 1.0)
+    return statistic, oddsratio, pvalue
+
+def fisher_exact_test(a, b, c, d, alternative='two-sided', max_support=1 << 22):
+    '''Fisher's exact test for arrays of 2x2 cells; returns (sample odds ratio, pvalue) arrays, as scipy's fisher_exact
+    would for each table. Each distinct table is only tested once, and two-sided pvalues sum the hypergeometric pmf over
+    the support of all distinct tables at once, max_support points at a time'''
+    from scipy.stats import hypergeom
+    shape = np.shape(a)
+    tables = np.stack([np.ravel(x).astype(np.int64) for x in (a, b, c, d)], axis=1)
+    tables, inverse = np.unique(tables, axis=0, return_inverse=True)
+    ta, tb, tc, td = tables.T
+    n1, n2, n = ta + tb, tc + td, ta + tc
+    with np.errstate(divide='ignore', invalid='ignore'):
+        oddsratio = (ta * td) / (tb * tc).astype(float)
+
+    if alternative == 'greater':
+        pvalue = hypergeom.sf(ta - 1, n1 + n2, n1, n)
+    elif alternative == 'less':
+        pvalue = hypergeom.cdf(ta, n1 + n2, n1, n)
+    elif alternative == 'two-sided':
+        ## sum the probabilities of all tables with the same margins that are no more likely than the observed one
+        pvalue = np.zeros(len(tables))
+        observed = hypergeom.logpmf(ta, n1 + n2, n1, n)
+        low = np.maximum(0, n - n2)
+        width = np.minimum(n, n1) - low + 1
+        start = 0
+        while start < len(tables):
+            stop = start + max(1, np.searchsorted(np.cumsum(width[start:]), max_support, side='right'))
+            group = np.repeat(np.arange(start, stop), width[start:stop])
+            x = low[group] + np.arange(len(group)) - np.repeat(np.cumsum(width[start:stop]) - width[start:stop], width[start:stop])
+            logpmf = hypergeom.logpmf(x, (n1 + n2)[group], n1[group], n[group])
+            keep = logpmf <= observed[group] + 1e-7
+            pvalue[start:stop] = np.bincount(group[keep] - start, weights=np.exp(logpmf[keep]), minlength=stop - start)
+            start = stop
+        pvalue = np.minimum(pvalue, 1.0)
+    else:
+        raise ValueError("alternative should be 'two-sided', 'less' or 'greater'")
+
+    ## tables with an empty row or column are uninformative
+    empty = (n1 == 0) | (n2 == 0) | (n == 0) | (n == n1 + n2)
+    pvalue = np.where(empty, 1.0, pvalue)
+    oddsratio = np.where(empty, np.nan, oddsratio)
+    return oddsratio[inverse].reshape(shape), pvalue[inverse].reshape(shape)
+
+def analyze_counts(counts, alternative='two-sided'):
+    '''odds ratios and pvalues for every position/AA pair with nonzero counts in a (strata x positions x 21 x 2) count
+    tensor, as a dataframe. Runs CMH tests if there is more than one stratum, and Fisher's exact tests otherwise'''
+    import pandas as pd
+    a, b, c, d = two_by_two(counts)
+    nonzero = (a + c).sum(axis=0) > 0
+    positions, aas = np.nonzero(nonzero)
+    output_df = pd.DataFrame({'position': positions + 1, 'aminoacid': np.array(rm.all_aas[:-1])[aas]})
+    if counts.shape[0] == 1:
+        ## zero cells are set to 1, as in cal_enr in 3-analyze-aa-counts.py
+        a, b, c, d = [np.maximum(x[0][nonzero], 1) for x in (a, b, c, d)]
+        output_df['oddsratio'], output_df['pvalue'] = fisher_exact_test(a, b, c, d, alternative)
+    else:
+        statistic, oddsratio, pvalue = cmh_test(a[:, nonzero], b[:, nonzero], c[:, nonzero], d[:, nonzero], alternative)
+        output_df['oddsratio'] = oddsratio
+        output_df['pvalue'] = pvalue
+        output_df['statistic'] = statistic
+        output_df['strata'] = ((a + b + c + d)[:, nonzero] > 1).sum(axis=0)
+    return output_df
+
+def analyze_residue_matrix(matrix_prefix, host1, host2, output_path, strata_path=None, strata_column=None, alternative='two-sided'):
+    '''run CMH tests stratified by the clusters in strata_path (or a column of the leaf table) for every position/AA pair
+    of a residue matrix, or Fisher's exact tests without strata, and save the results as a csv file'''
+    matrix, leaves, index = rm.load_residue_matrix(matrix_prefix)
+    if strata_path is not None:
+        leaf_strata = read_strata(strata_path, leaves['name'])
+    elif strata_column is not None:
+        leaf_strata = leaves[strata_column].tolist()
+    else:
+        leaf_strata = ['all'] * len(leaves)
+    counts, strata = stratified_counts(matrix, leaves['host'].tolist(), leaf_strata, host1, host2)
+    output_df = analyze_counts(counts, alternative)
+    output_df.to_csv(output_path, header=True, index=False)
+    return output_df
+
+
+if __name__ == '__main__':
+    ## change to directory with files
+    os.chdir(json_dir)
+
+    analyze_residue_matrix(matrix_prefix, host1, host2, output_file, strata_file, strata_column, alternative)
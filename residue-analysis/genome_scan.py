@@ -0,0 +1,112 @@
+import glob
+import multiprocessing as mp
+import os
+import re
+
+import residue_matrix as rm
+import cmh_analysis as cmh
+
+## specify directories, hosts, and output
+json_dir = '/Users/jort/coding/h5n1-mutations-rotation/base-build/auspice/' # directory with flu_avian_h5n1_<segment>.json and flu_avian_h5n1_<segment>_root-sequence.json for each segment
+reference_dir = '/Users/jort/coding/h5n1-mutations-rotation/base-build/config/' # directory with reference_h5n1_<segment>.gb for each segment
+tree_prefix = 'flu_avian_h5n1_' # auspice json files are named <tree_prefix><segment>.json
+reference_prefix = 'reference_h5n1_' # genbank references are named <reference_prefix><segment>.gb
+output_dir = '/Users/jort/coding/h5n1-mutations-rotation/genome-scan/' # residue matrices and the combined table are saved here
+output_file = 'genome_aa_or_pv.csv' # combined table with odds ratios and pvalues for every segment (.csv)
+host1 = 'Human' # host to screen for enrichment in
+host2 = 'Avian' # background host
+strata_file = None # tsv file with name and cluster columns to run CMH tests stratified by cluster; None for Fisher's exact tests
+alternative = 'two-sided'
+cores = None # number of worker processes; None for all cores
+
+
+##### user input above #####
+
+
+## Genome-wide residue scan
+## Every segment with an auspice json, a root-sequence json and a genbank reference is found, and the length of each
+## gene is read from the CDS features of the reference (excluding the stop codon) rather than hard-coded. For each
+## segment and gene, a worker process builds the residue matrix, counts residues by host, and runs Fisher's exact tests
+## (or CMH tests stratified by cluster); the results are combined into one table, annotated with the segment, gene,
+## reference and root residue at each position.
+def read_cds_features(genbank_path):
+    '''return {gene: (aa length, reference translation)} for every CDS in a genbank file'''
+    with open(genbank_path) as genbank_file:
+        text = genbank_file.read()
+    features = text.split('ORIGIN')[0]
+    cds_features = {}
+    ## each CDS runs until the next feature key, which starts at column 6
+    for match in re.finditer(r'^ {5}CDS {13}(.+?)(?=^ {5}\S|\Z)', features, flags=re.M | re.S):
+        block = match.group(1)
+        location = block.splitlines()[0]
+        nt_length = sum(int(end) - int(start) + 1 for start, end in re.findall(r'<?(\d+)\.\.>?(\d+)', location))
+        gene = re.search(r'/gene="([^"]+)"', block)
+        translation = re.search(r'/translation="([^"]+)"', block)
+        translation = re.sub(r'\s+', '', translation.group(1)) if translation else ''
+        if gene is not None:
+            cds_features[gene.group(1)] = (nt_length // 3 - 1, translation)
+    return cds_features
+
+def find_segments(json_dir, reference_dir, tree_prefix='flu_avian_h5n1_', reference_prefix='reference_h5n1_'):
+    '''return a list of (segment, tree file, root-sequence file, genbank reference) for every segment with all three files'''
+    segments = []
+    for tree_path in sorted(glob.glob(os.path.join(json_dir, tree_prefix + '*.json'))):
+        segment = os.path.basename(tree_path)[len(tree_prefix):-len('.json')]
+        if '_' in segment:
+            continue
+        root_path = os.path.join(json_dir, tree_prefix + segment + '_root-sequence.json')
+        reference_path = os.path.join(reference_dir, reference_prefix + segment + '.gb')
+        if os.path.exists(root_path) and os.path.exists(reference_path):
+            segments.append((segment, tree_path, root_path, reference_path))
+    return segments
+
+def scan_gene(segment, gene, aalength, reference_seq, tree_path, root_path, host1, host2, output_dir, strata_path=None, alternative='two-sided'):
+    '''build the residue matrix for one gene, test every position/AA pair, and return the annotated results'''
+    matrix_prefix = os.path.join(output_dir, f'{segment}_{gene}_residues')
+    rm.write_residue_matrix(tree_path, root_path, gene, matrix_prefix, aalength=aalength)
+    matrix, leaves, index = rm.load_residue_matrix(matrix_prefix)
+    if strata_path is not None:
+        leaf_strata = cmh.read_strata(strata_path, leaves['name'])
+    else:
+        leaf_strata = ['all'] * len(leaves)
+    counts, strata = cmh.stratified_counts(matrix, leaves['host'].tolist(), leaf_strata, host1, host2)
+    output_df = cmh.analyze_counts(counts, alternative)
+
+    root_seq = rm.get_root_seq(root_path, gene)
+    positions = output_df['position'].to_numpy()
+    aas = output_df['aminoacid'].map(rm.aa_codes).to_numpy()
+    pooled = counts.sum(axis=0)
+    output_df[host1.lower() + '_count'] = pooled[positions - 1, aas, 0]
+    output_df[host2.lower() + '_count'] = pooled[positions - 1, aas, 1]
+    output_df.insert(0, 'reference_aa', [reference_seq[p - 1] if p <= len(reference_seq) else '' for p in positions])
+    output_df.insert(0, 'root_aa', [root_seq[p - 1] for p in positions])
+    output_df.insert(0, 'gene_length', aalength)
+    output_df.insert(0, 'gene', gene)
+    output_df.insert(0, 'segment', segment)
+    cols = ['segment', 'gene', 'gene_length', 'position', 'aminoacid', 'root_aa', 'reference_aa']
+    return output_df[cols + [c for c in output_df.columns if c not in cols]]
+
+def run_genome_scan(json_dir, reference_dir, output_dir, output_file, host1, host2, strata_path=None, alternative='two-sided',
+                    tree_prefix='flu_avian_h5n1_', reference_prefix='reference_h5n1_', cores=None):
+    '''scan every gene of every segment in parallel, and save the combined results as a csv file in output_dir'''
+    import pandas as pd
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = []
+    for segment, tree_path, root_path, reference_path in find_segments(json_dir, reference_dir, tree_prefix, reference_prefix):
+        root_genes = rm.read_in_tree_json(root_path)
+        for gene, (aalength, reference_seq) in read_cds_features(reference_path).items():
+            if gene in root_genes:
+                tasks.append((segment, gene, aalength, reference_seq, tree_path, root_path, host1, host2, output_dir, strata_path, alternative))
+    if not tasks:
+        raise FileNotFoundError(f'no segments with a tree, root sequence and reference found in {json_dir} and {reference_dir}')
+    print(f'scanning {len(tasks)} genes: ' + ', '.join(f'{task[0]}/{task[1]} ({task[2]} aa)' for task in tasks))
+
+    with mp.get_context('fork').Pool(min(cores or mp.cpu_count(), len(tasks))) as pool:
+        results = pool.starmap(scan_gene, tasks)
+    output_df = pd.concat(results, ignore_index=True)
+    output_df.to_csv(os.path.join(output_dir, output_file), header=True, index=False)
+    return output_df
+
+
+if __name__ == '__main__':
+    run_genome_scan(json_dir, reference_dir, output_dir, output_file, host1, host2, strata_file, alternative, tree_prefix, reference_prefix, cores)
@@ -0,0 +1,133 @@
+import json
+import time
+
+import numpy as np
+
+import cmh_analysis as cmh
+
+## specify directory, files, hosts, and gene
+gene = 'PB2' # gene to simulate a null for
+json_dir = f'/Users/jort/coding/h5n1-mutations-rotation/build3-end-aa-analysis/build3-rerun0/{gene}/' # directory containing tree; results saved here
+tree_file = f'flu_avian_h5n1_{gene.lower()}.json' # json tree with mutations on each branch (mutations do not need to be propagated)
+output_file = 'simulation_cutoffs_greater.csv' # output for dataframe with the null cutoff at each position (.csv)
+host1 = 'Human'
+host2 = 'Avian'
+iterations = 10000
+alpha = 0.05 # quantile of the simulated pvalues used as the cutoff at each position
+seed = None # random seed for the simulations
+alternative = 'greater'
+
+
+##### user input above #####
+
+
+## Per-site matched simulation null
+## 4-perform-simulations.py simulates a single binary site at rate 1/total_branch_length, so that every position is
+## compared with a null that mutates about once on the tree. Here, the rate at each position is matched to the number
+## of substitutions observed at that position on the tree, and the null is simulated for every position.
+##
+## Under the same symmetric two-state model, a site changes state at each event of a Poisson process along the
+## branches; the number of events on the tree is Poisson(substitutions) and each event falls on a branch with
+## probability proportional to its length. A leaf is in the mutated state if an odd number of events fall on the path to
+## it. With leaves in depth first order, the leaves below a branch are a contiguous range, so the number of mutated host1
+## and host2 leaves in a simulation is read from prefix sums of host leaf counts at the sorted range boundaries of its
+## events. All iterations of a position are simulated at once, so the cost grows with the number of events, not with the
+## number of branches times iterations.
+def read_in_tree_json(input_tree):
+    '''read in a tree in json format'''
+    with open(input_tree) as json_file:
+        json_tree = json.load(json_file)
+    return json_tree
+
+def get_branch_arrays(root, gene, host1, host2):
+    '''return branch lengths, the leaf range [start, end) below each branch, prefix sums of host1 and host2 leaves in
+    depth first order, and the number of substitutions at each position of gene'''
+    lengths = []
+    starts = []
+    ends = []
+    leaf_hosts = []
+    substitutions = {}
+    stack = [(root, 0, False)]
+    while stack:
+        node, parent_div, done = stack.pop()
+        if done:
+            ends[node] = len(leaf_hosts)
+            continue
+        branch = len(lengths)
+        lengths.append(node['node_attrs']['div'] - parent_div)
+        starts.append(len(leaf_hosts))
+        ends.append(None)
+        if node is not root:
+            for mut in node.get('branch_attrs', {}).get('mutations', {}).get(gene, []):
+                position = int(mut[1:len(mut)-1])
+                substitutions[position] = substitutions.get(position, 0) + 1
+        if 'children' in node:
+            stack.append((branch, None, True))
+            for child in reversed(node['children']):
+                stack.append((child, node['node_attrs']['div'], False))
+        else:
+            leaf_hosts.append(node['node_attrs']['host']['value'])
+            ends[branch] = len(leaf_hosts)
+    leaf_hosts = np.array(leaf_hosts)
+    host1_prefix = np.concatenate([[0], np.cumsum(leaf_hosts == host1)])
+    host2_prefix = np.concatenate([[0], np.cumsum(leaf_hosts == host2)])
+    return np.array(lengths), np.array(starts), np.array(ends), host1_prefix, host2_prefix, substitutions
+
+def simulate_counts(lengths, starts, ends, host1_prefix, host2_prefix, expected_events, iterations, rng):
+    '''simulate iterations of a binary site with the given expected number of events on the tree; return the number of
+    mutated host1 and host2 leaves in each iteration'''
+    n_events = rng.poisson(expected_events, iterations)
+    simulation = np.repeat(np.arange(iterations), n_events)
+    branches = np.searchsorted(np.cumsum(lengths) / lengths.sum(), rng.random(len(simulation)), side='right')
+    branches = np.minimum(branches, len(lengths) - 1)
+
+    ## each event flips the state of the leaf range below its branch; after sorting the range boundaries of a
+    ## simulation, mutated leaves lie between the 1st and 2nd boundary, the 3rd and 4th, and so on
+    boundaries = np.concatenate([starts[branches], ends[branches]])
+    simulation = np.concatenate([simulation, simulation])
+    order = np.lexsort((boundaries, simulation))
+    boundaries = boundaries[order]
+    simulation = simulation[order]
+    first = np.searchsorted(simulation, np.arange(iterations))
+    sign = np.where((np.arange(len(simulation)) - first[simulation]) % 2 == 0, -1, 1)
+    host1_counts = np.bincount(simulation, weights=sign * host1_prefix[boundaries], minlength=iterations)
+    host2_counts = np.bincount(simulation, weights=sign * host2_prefix[boundaries], minlength=iterations)
+    return np.rint(host1_counts).astype(np.int64), np.rint(host2_counts).astype(np.int64)
+
+def simulate_matched_null(tree_path, gene, output_path, host1, host2, iterations=10000, alpha=0.05, seed=None, alternative='greater'):
+    '''simulate a null matched to the number of substitutions at each position of gene, and save the pvalue and odds
+    ratio cutoffs for each position as a csv file'''
+    import pandas as pd
+
+    ## start timer
+    start_time = time.time()
+    rng = np.random.default_rng(seed)
+    root = read_in_tree_json(tree_path)['tree']
+    lengths, starts, ends, host1_prefix, host2_prefix, substitutions = get_branch_arrays(root, gene, host1, host2)
+    n_host1, n_host2 = host1_prefix[-1], host2_prefix[-1]
+
+    rows = []
+    ## positions without substitutions on the tree have no variation to test, so only mutated positions are simulated
+    for position in sorted(substitutions):
+        expected_events = substitutions[position]
+        p1, p2 = simulate_counts(lengths, starts, ends, host1_prefix, host2_prefix, expected_events, iterations, rng)
+        a1, a2 = n_host1 - p1, n_host2 - p2
+
+        ## add a pseudocount for denominator values that are equal to 0, as in run_sims
+        p2 = np.maximum(p2, 1)
+        a1 = np.maximum(a1, 1)
+        oddsr, p = cmh.fisher_exact_test(p1, a1, p2, a2, alternative)
+        rows.append({'position': position, 'substitutions': substitutions[position], 'rate': expected_events / lengths.sum(),
+                     'pvalue_cutoff': np.quantile(p, alpha), 'oddsratio_cutoff': np.nanquantile(oddsr, 1 - alpha),
+                     host1.lower() + 'count_mean': p1.mean(), host2.lower() + 'count_mean': (n_host2 - a2).mean(), 'iterations': iterations})
+
+    ## print timer statement
+    print("It took", round(time.time() - start_time, 2), "seconds to run", iterations, "simulations at each of", len(rows), "positions")
+
+    output_df = pd.DataFrame(rows)
+    output_df.to_csv(output_path, header=True, index=False)
+    return output_df
+
+
+if __name__ == '__main__':
+    simulate_matched_null(json_dir + tree_file, gene, json_dir + output_file, host1, host2, iterations, alpha, seed, alternative)
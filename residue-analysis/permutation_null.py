@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+
+import residue_matrix as rm
+import cmh_analysis as cmh
+
+## specify directory, files, hosts, and strata
+gene = 'PB2' # gene to analyze
+json_dir = f'/Users/jort/coding/h5n1-mutations-rotation/build3-end-aa-analysis/b3-r0-CMH-by-6-tree-cluster/{gene}/' # directory containing the residue matrix; output file to be saved here
+matrix_prefix = f'flu_avian_h5n1_{gene.lower()}_residues' # prefix of the residue matrix written by residue_matrix.py
+host1 = 'Human' # host to screen for enrichment in
+host2 = 'Avian' # background host
+strata_file = 'tree_clusters.tsv' # tsv file with a name and a cluster column for each leaf; None to use strata_column
+strata_column = 'clade' # column of the leaf table to shuffle host labels within, if there is no strata_file
+permutations = 10000 # number of host label permutations
+batch_size = 256 # permutations evaluated at once
+seed = None # random seed for the permutations
+output_file = 'all_aa_permutation_pv.csv' # output for dataframe with empirical pvalues (.csv)
+alternative = 'greater'
+
+
+##### user input above #####
+
+
+## Host label permutation null
+## Clades (or tree clusters) are sampled unevenly across hosts, so residues that are common in a clade with many human
+## leaves look enriched in humans even without host adaptation. To account for this, host1 and host2 labels are shuffled
+## among leaves within each stratum, which keeps the number of host1 and host2 leaves in every stratum fixed, and the
+## number of host1 leaves with each residue is recounted for every permutation. Within fixed strata margins, the host1
+## count is the test statistic of both the Fisher and CMH tests, so the empirical pvalue is the fraction of permutations
+## with a count at least as extreme as the observed one.
+##
+## Permutations are evaluated in batches as a single matrix product: a (leaves x tested position/AA pairs) sparse
+## indicator matrix, built once from the residue matrix, times a (leaves x batch) matrix of permuted host1 labels.
+def residue_indicators(matrix, rows, pairs):
+    '''sparse (rows x pairs) matrix with a 1 where a leaf has the AA of a (position index, code) pair'''
+    from scipy.sparse import csr_matrix
+    pair_index = np.full(matrix.shape[1] * len(rm.all_aas), -1, dtype=np.int64)
+    pair_index[pairs[:, 0] * len(rm.all_aas) + pairs[:, 1]] = np.arange(len(pairs))
+    leaf_codes = np.asarray(matrix[rows], dtype=np.int64)
+    columns = pair_index[(np.arange(matrix.shape[1]) * len(rm.all_aas))[None, :] + leaf_codes]
+    leaf_rows, _ = np.nonzero(columns >= 0)
+    columns = columns[columns >= 0]
+    return csr_matrix((np.ones(len(columns), dtype=np.float32), (leaf_rows, columns)), shape=(len(rows), len(pairs)))
+
+def permuted_labels(stratum_rows, stratum_host1_counts, n_leaves, batch, rng):
+    '''(leaves x batch) matrix of host1 labels, with the host1 labels shuffled among the leaves of each stratum'''
+    labels = np.zeros((n_leaves, batch), dtype=np.float32)
+    for rows, n_host1 in zip(stratum_rows, stratum_host1_counts):
+        if n_host1 == 0 or n_host1 == len(rows):
+            labels[rows, :] = n_host1 > 0
+            continue
+        ## a random subset of n_host1 leaves for each permutation: the leaves with the smallest random keys
+        chosen = np.argpartition(rng.random((batch, len(rows))), n_host1 - 1, axis=1)[:, :n_host1]
+        labels[rows[chosen], np.arange(batch)[:, None]] = 1
+    return labels
+
+def permutation_test(matrix, leaf_hosts, leaf_strata, host1, host2, permutations=10000, batch_size=256, seed=None, alternative='greater'):
+    '''empirical pvalues for the host1 count of every position/AA pair present in host1 or host2 leaves, under host labels
+    shuffled within strata; returns a dataframe'''
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    leaf_hosts = np.asarray(leaf_hosts)
+    leaf_strata = np.asarray([str(stratum) for stratum in leaf_strata])
+    rows = np.nonzero(np.isin(leaf_hosts, [host1, host2]) & (leaf_strata != ''))[0]
+    is_host1 = (leaf_hosts[rows] == host1).astype(np.float32)
+
+    ## tested pairs: every position/AA (excluding other) present in a host1 or host2 leaf
+    counts = rm.count_residues(matrix[rows], leaf_hosts[rows], [host1, host2])
+    present = counts[:, :, :-1].sum(axis=0) > 0
+    pairs = np.argwhere(present)
+    indicators = residue_indicators(matrix, rows, pairs)
+
+    ## observed host1 count and its expectation under the null, from the strata margins
+    strata, stratum_index = np.unique(leaf_strata[rows], return_inverse=True)
+    stratum_rows = [np.nonzero(stratum_index == i)[0] for i in range(len(strata))]
+    stratum_host1_counts = [int(is_host1[r].sum()) for r in stratum_rows]
+    observed = indicators.T @ is_host1
+    expected = np.zeros(len(pairs))
+    for r, n_host1 in zip(stratum_rows, stratum_host1_counts):
+        expected += np.asarray(indicators[r].sum(axis=0)).ravel() * n_host1 / len(r)
+
+    ## count permutations at least as extreme as observed, a batch at a time; a small tolerance absorbs float rounding
+    extreme = np.zeros(len(pairs), dtype=np.int64)
+    done = 0
+    while done < permutations:
+        batch = min(batch_size, permutations - done)
+        permuted = (indicators.T @ permuted_labels(stratum_rows, stratum_host1_counts, len(rows), batch, rng)).T
+        if alternative == 'greater':
+            extreme += (permuted >= observed - 1e-6).sum(axis=0)
+        elif alternative == 'less':
+            extreme += (permuted <= observed + 1e-6).sum(axis=0)
+        elif alternative == 'two-sided':
+            extreme += (np.abs(permuted - expected) >= np.abs(observed - expected) - 1e-6).sum(axis=0)
+        else:
+            raise ValueError("alternative should be 'two-sided', 'less' or 'greater'")
+        done += batch
+
+    return pd.DataFrame({'position': pairs[:, 0] + 1, 'aminoacid': np.array(rm.all_aas)[pairs[:, 1]],
+                         host1.lower() + 'count': np.rint(observed).astype(int), 'expected_' + host1.lower() + 'count': expected,
+                         'pvalue': (extreme + 1) / (permutations + 1), 'permutations': permutations, 'strata': len(strata)})
+
+def permute_residue_matrix(matrix_prefix, host1, host2, output_path, strata_path=None, strata_column=None, permutations=10000,
+                           batch_size=256, seed=None, alternative='greater'):
+    '''run the within-strata host label permutation test on a residue matrix and save the results as a csv file'''
+    matrix, leaves, index = rm.load_residue_matrix(matrix_prefix)
+    if strata_path is not None:
+        leaf_strata = cmh.read_strata(strata_path, leaves['name'])
+    elif strata_column is not None:
+        leaf_strata = leaves[strata_column].tolist()
+    else:
+        leaf_strata = ['all'] * len(leaves)
+    output_df = permutation_test(matrix, leaves['host'].tolist(), leaf_strata, host1, host2, permutations, batch_size, seed, alternative)
+    output_df.to_csv(output_path, header=True, index=False)
+    return output_df
+
+
+if __name__ == '__main__':
+    ## change to directory with files
+    os.chdir(json_dir)
+
+    permute_residue_matrix(matrix_prefix, host1, host2, output_file, strata_file, strata_column, permutations, batch_size, seed, alternative)
@@ -0,0 +1,186 @@
+import csv
+import json
+import os
+
+import numpy as np
+
+## specify directory, files, and gene
+gene = 'PB2' # gene to build the residue matrix for
+json_dir = f'/Users/jort/coding/h5n1-mutations-rotation/build3-end-aa-analysis/b3-r0-CMH-by-6-tree-cluster/{gene}/' # directory containing json files
+tree_file = f'flu_avian_h5n1_{gene.lower()}.json' # json tree with mutations on each branch (mutations do not need to be propagated)
+root_file = f'flu_avian_h5n1_{gene.lower()}_root-sequence.json' # json file with inferred root sequence
+output_prefix = f'flu_avian_h5n1_{gene.lower()}_residues' # writes <prefix>.npy, <prefix>.json and <prefix>_leaves.tsv in json_dir
+host_annotation = 'host' # node attribute with the host of each leaf
+clade_annotation = 'h5_label_clade' # node attribute with the clade of each leaf
+
+
+##### user input above #####
+
+
+## The residue matrix holds the amino acid at every position of every leaf, encoded as int8, with one row per leaf (in
+## the order the leaves appear in the tree json) and one column per position (position 1 in column 0). It is built
+## directly from the root sequence and the mutations on each branch, so the tree does not need to be propagated first.
+## Files written for a prefix:
+##   <prefix>.npy:         the (leaves x positions) int8 matrix; open with np.load(..., mmap_mode='r') to read
+##                         single columns without loading the whole matrix
+##   <prefix>.json:        sidecar index with the gene, shape, and the amino acid for each code
+##   <prefix>_leaves.tsv:  leaf metadata table (name, host, date, clade), one line per matrix row
+all_aas = ['A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'V', 'W', 'Y', 'other']
+aa_codes = dict((aa, code) for code, aa in enumerate(all_aas))
+other_code = aa_codes['other']
+
+
+def read_in_tree_json(input_tree):
+    '''read in a tree in json format'''
+    with open(input_tree) as json_file:
+        json_tree = json.load(json_file)
+    return json_tree
+
+def get_root_seq(root_file, gene):
+    '''get root aa sequence for gene of interest'''
+    with open(root_file) as json_file:
+        json_root_tree = json.load(json_file)
+    return json_root_tree[gene]
+
+def encode_residues(seq):
+    '''int8 code of each amino acid in a sequence; anything that is not one of the 20 amino acids is coded as other'''
+    return np.array([aa_codes.get(aa, other_code) for aa in seq], dtype=np.int8)
+
+def get_attr(node, attribute):
+    '''value of a node attribute, or an empty string if the node does not have it'''
+    value = node.get('node_attrs', {}).get(attribute, '')
+    if isinstance(value, dict):
+        value = value.get('value', '')
+    return value
+
+def count_leaves(root):
+    '''number of leaves below (and including) a node'''
+    n_leaves = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        children = node.get('children', [])
+        if children:
+            stack.extend(children)
+        else:
+            n_leaves += 1
+    return n_leaves
+
+def build_residue_matrix(json_tree, root_seq, gene, matrix, host_annotation='host', clade_annotation='h5_label_clade'):
+    '''fill matrix (leaves x positions) with the residues of each leaf and return a list of (name, host, date, clade) for
+    each row. The tree is walked depth first with a single residue array, which is updated with each branch's mutations
+    on the way down and restored on the way back up'''
+    residues = encode_residues(root_seq)
+    aalength = len(residues)
+    leaves = []
+    stack = [('enter', json_tree['tree'], True)]
+    while stack:
+        action, node, is_root = stack.pop()
+        if action == 'exit':
+            ## undo this branch's mutations, in reverse order in case a position is mutated twice
+            for position, code in reversed(node):
+                residues[position] = code
+            continue
+        undo = []
+        if not is_root:
+            for mut in node.get('branch_attrs', {}).get('mutations', {}).get(gene, []):
+                position = int(mut[1:len(mut)-1]) - 1
+                if 0 <= position < aalength:
+                    undo.append((position, residues[position]))
+                    residues[position] = aa_codes.get(mut[-1], other_code)
+        children = node.get('children', [])
+        if children:
+            stack.append(('exit', undo, False))
+            for child in reversed(children):
+                stack.append(('enter', child, False))
+        else:
+            matrix[len(leaves)] = residues
+            leaves.append((node['name'], get_attr(node, host_annotation), get_attr(node, 'num_date'), get_attr(node, clade_annotation)))
+            for position, code in reversed(undo):
+                residues[position] = code
+    return leaves
+
+def write_residue_matrix(tree_file, root_file, gene, output_prefix, host_annotation='host', clade_annotation='h5_label_clade', aalength=None):
+    '''build the residue matrix for a tree and write it as <prefix>.npy, with the sidecar index <prefix>.json and the
+    leaf table <prefix>_leaves.tsv. If aalength is given, only the first aalength positions are kept'''
+    json_tree = read_in_tree_json(tree_file)
+    root_seq = get_root_seq(root_file, gene)[:aalength]
+    shape = (count_leaves(json_tree['tree']), len(root_seq))
+    matrix = np.lib.format.open_memmap(output_prefix + '.npy', mode='w+', dtype=np.int8, shape=shape)
+    leaves = build_residue_matrix(json_tree, root_seq, gene, matrix, host_annotation, clade_annotation)
+    matrix.flush()
+    del matrix
+
+    with open(output_prefix + '_leaves.tsv', 'w', newline='') as outfile:
+        writer = csv.writer(outfile, delimiter='\t')
+        writer.writerow(['name', 'host', 'date', 'clade'])
+        writer.writerows(leaves)
+    index = {'gene': gene, 'shape': list(shape), 'dtype': 'int8', 'first_position': 1, 'alphabet': all_aas,
+             'matrix': os.path.basename(output_prefix + '.npy'), 'leaves': os.path.basename(output_prefix + '_leaves.tsv'),
+             'tree_file': os.path.basename(tree_file), 'root_file': os.path.basename(root_file)}
+    with open(output_prefix + '.json', 'w') as outfile:
+        json.dump(index, outfile, indent=2)
+
+def load_residue_matrix(output_prefix, mmap_mode='r'):
+    '''return (matrix, leaves dataframe, index) for a residue matrix written by write_residue_matrix. The matrix is
+    memory-mapped by default, so reading a few columns does not load the rest'''
+    import pandas as pd
+    with open(output_prefix + '.json') as json_file:
+        index = json.load(json_file)
+    folder = os.path.dirname(output_prefix)
+    matrix = np.load(os.path.join(folder, index['matrix']), mmap_mode=mmap_mode)
+    leaves = pd.read_csv(os.path.join(folder, index['leaves']), sep='\t', dtype={'name': str, 'host': str, 'clade': str}, keep_default_na=False)
+    leaves['date'] = pd.to_numeric(leaves['date'], errors='coerce')
+    return matrix, leaves, index
+
+
+## counting residues by host
+## The counts for every host, position and amino acid are tallied at once with np.bincount over flat (host, position,
+## code) indices, a block of rows at a time so that memory-mapped matrices are read in order and never fully loaded.
+def count_residues(matrix, leaf_hosts, hosts, block_rows=4096):
+    '''return a (hosts x positions x 21) array with the number of leaves of each host with each amino acid at each
+    position. leaf_hosts gives the host of each matrix row; rows whose host is not in hosts are not counted'''
+    n_hosts = len(hosts)
+    aalength = matrix.shape[1]
+    host_index = dict((host, i) for i, host in enumerate(hosts))
+    leaf_host_index = np.array([host_index.get(host, -1) for host in leaf_hosts], dtype=np.int64)
+    position_offsets = np.arange(aalength, dtype=np.int64) * len(all_aas)
+    counts = np.zeros(n_hosts * aalength * len(all_aas), dtype=np.int64)
+    for start in range(0, matrix.shape[0], block_rows):
+        block_hosts = leaf_host_index[start:start + block_rows]
+        keep = block_hosts >= 0
+        if not keep.any():
+            continue
+        block = np.asarray(matrix[start:start + block_rows])[keep]
+        flat = (block_hosts[keep, None] * (aalength * len(all_aas)) + position_offsets[None, :]) + block
+        counts += np.bincount(flat.ravel(), minlength=counts.size)
+    return counts.reshape(n_hosts, aalength, len(all_aas))
+
+def host_counts_df(host_counts):
+    '''(positions x 21) counts for one host as a dataframe in the layout of the 2-get-all-aa-counts.py tsv files, with
+    amino acids as rows and positions as columns'''
+    import pandas as pd
+    return pd.DataFrame(host_counts.T, index=all_aas, columns=range(1, host_counts.shape[0] + 1))
+
+def write_host_counts(output_prefix, output_dir, hosts=None, host_output_files=None):
+    '''count residues by host from a residue matrix and write one <host>_all_aa_counts.tsv per host to output_dir. If
+    hosts is None, every host in the leaf table is counted. Returns the list of files written'''
+    matrix, leaves, index = load_residue_matrix(output_prefix)
+    if hosts is None:
+        hosts = sorted(set(leaves['host']) - {''})
+    if host_output_files is None:
+        host_output_files = [host.lower() + '_all_aa_counts.tsv' for host in hosts]
+    counts = count_residues(matrix, leaves['host'].tolist(), hosts)
+    output_paths = []
+    for host_counts, output_file in zip(counts, host_output_files):
+        output_path = os.path.join(output_dir, output_file)
+        host_counts_df(host_counts).to_csv(output_path, sep='\t', header=True, index=True)
+        output_paths.append(output_path)
+    return output_paths
+
+
+if __name__ == '__main__':
+    ## change to directory with files
+    os.chdir(json_dir)
+
+    write_residue_matrix(tree_file, root_file, gene, output_prefix, host_annotation, clade_annotation)